@@ -71,7 +71,7 @@ class FuzzyQuery:
     def __call__(self, query):
         matched_rule = None
 
-        urlkey = query.key
+        urlkey = query.url_key
         url = query.url
         filter_ = query.filters
         output = query.output
@@ -120,6 +120,9 @@ class FuzzyQuery:
         if 'end_key' in params:
             del params['end_key']
 
+        if 'url_key' in params:
+            del params['url_key']
+
         return params
 
 
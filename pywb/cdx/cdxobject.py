@@ -117,17 +117,8 @@ class CDXObject(OrderedDict):
         if fields[-1].startswith('{'):
             self[URLKEY] = fields[0]
             self[TIMESTAMP] = fields[1]
-            json_fields = json_decode(fields[-1])
-            for n, v in json_fields.iteritems():
-                n = self.CDX_ALT_FIELDS.get(n, n)
-
-                try:
-                    self[n] = str(v)
-                except UnicodeEncodeError:
-                    v = v.encode('utf-8')
-                    parts = v.split('//', 1)
-                    v = parts[0] + '//' + quote(parts[1])
-                    self[n] = v
+            for n, v in self.iter_json_fields(fields[-1]):
+                self[n] = v
 
             self.cdxline = cdxline
             self._from_json = True
@@ -136,19 +127,45 @@ class CDXObject(OrderedDict):
         more_fields = fields.pop().split(' ')
         fields.extend(more_fields)
 
+        cdxformat = self.get_cdx_format(len(fields))
+
+        for header, field in itertools.izip(cdxformat, fields):
+            self[header] = field
+
+        self.cdxline = cdxline
+
+    @classmethod
+    def get_cdx_format(cls, num_fields):
+        """ Return field names for a cdx line with ``num_fields`` fields
+        """
         cdxformat = None
-        for i in self.CDX_FORMATS:
-            if len(i) == len(fields):
+        for i in cls.CDX_FORMATS:
+            if len(i) == num_fields:
                 cdxformat = i
 
         if not cdxformat:
-            msg = 'unknown {0}-field cdx format'.format(len(fields))
+            msg = 'unknown {0}-field cdx format'.format(num_fields)
             raise CDXException(msg)
 
-        for header, field in itertools.izip(cdxformat, fields):
-            self[header] = field
+        return cdxformat
 
-        self.cdxline = cdxline
+    @classmethod
+    def iter_json_fields(cls, json_string):
+        """ Decode the json block of a cdxj line, yielding
+        (name, value) pairs with alt field names normalized
+        and values encoded as str
+        """
+        for n, v in json_decode(json_string).iteritems():
+            n = cls.CDX_ALT_FIELDS.get(n, n)
+
+            try:
+                v = str(v)
+            except UnicodeEncodeError:
+                v = v.encode('utf-8')
+                parts = v.split('//', 1)
+                v = parts[0] + '//' + quote(parts[1])
+
+            yield n, v
 
     def __setitem__(self, key, value):
         OrderedDict.__setitem__(self, key, value)
@@ -211,6 +228,288 @@ class CDXObject(OrderedDict):
         else:
             return json_encode(self)
 
+#=================================================================
+class LazyCDXObject(object):
+    """
+    Compact, read-mostly alternative to :class:`CDXObject`
+
+    Only the raw cdx line is stored on creation. The line is split
+    into fields on first access, and for cdxj, the json block
+    is decoded only when a field other than the urlkey or timestamp
+    is accessed.
+
+    Field values are stored in a list, with the field names shared
+    with all other lines of the same format.
+
+    Supports the same mapping api, :meth:`to_text` and :meth:`to_json`
+    as :class:`CDXObject`
+
+    >>> x = LazyCDXObject('com,example)/ 20140127171200 {"url": "http://example.com", "length": "1046"}')
+    >>> x['urlkey'], x['timestamp'], x._json
+    ('com,example)/', '20140127171200', '{"url": "http://example.com", "length": "1046"}')
+
+    >>> x['url'], x._json
+    ('http://example.com', None)
+
+    >>> x = LazyCDXObject('com,example)/ 20140127171200 http://example.com/ text/html 200 ABC - - 100 0 a.warc.gz')
+    >>> x['filename'], x.get('foo'), 'mime' in x, len(x)
+    ('a.warc.gz', None, True, 11)
+
+    >>> x['filename'] = 'b.warc.gz'
+    >>> x['orig.filename'] = '-'
+    >>> x.to_text(['timestamp', 'filename', 'orig.filename'])
+    '20140127171200 b.warc.gz -\\n'
+
+    >>> x.to_text()
+    'com,example)/ 20140127171200 http://example.com/ text/html 200 ABC - - 100 0 b.warc.gz -\\n'
+
+    >>> x.to_text(['foo'])
+    Traceback (most recent call last):
+    CDXException: Invalid field "foo" found in fields= argument
+    """
+    __slots__ = ('cdxline', '_names', '_values', '_json', '_from_json')
+
+    CDX_ALT_FIELDS = CDXObject.CDX_ALT_FIELDS
+
+    def __init__(self, cdxline=''):
+        self.cdxline = cdxline.rstrip()
+        self._names = None
+        self._values = None
+        self._json = None
+        self._from_json = False
+
+    @classmethod
+    def from_fields(cls, names, values, from_json=False):
+        """ Create from field ``names`` and ``values``, instead of
+        a cdx line. ``names`` may be shared with other objects
+        """
+        cdx = cls()
+        cdx._names = names
+        cdx._values = list(values)
+        cdx._from_json = from_json
+        return cdx
+
+    def _parse(self):
+        cdxline = self.cdxline
+        if not cdxline:
+            self._names = []
+            self._values = []
+            return
+
+        fields = cdxline.split(' ', 2)
+        # Check for CDX JSON
+        if fields[-1].startswith('{'):
+            self._names = [URLKEY, TIMESTAMP]
+            self._values = fields[:2]
+            self._json = fields[-1]
+            self._from_json = True
+            return
+
+        fields = fields[:-1] + fields[-1].split(' ')
+        self._names = CDXObject.get_cdx_format(len(fields))
+        self._values = fields
+
+    def _parse_json(self):
+        names = self._names
+        values = self._values
+        for n, v in CDXObject.iter_json_fields(self._json):
+            try:
+                values[names.index(n)] = v
+            except ValueError:
+                names.append(n)
+                values.append(v)
+
+        self._json = None
+
+    def _parse_all(self):
+        if self._names is None:
+            self._parse()
+
+        if self._json is not None:
+            self._parse_json()
+
+    def _index(self, key):
+        if self._names is None:
+            self._parse()
+
+        try:
+            return self._names.index(key)
+        except ValueError:
+            if self._json is None:
+                raise KeyError(key)
+
+        self._parse_json()
+
+        try:
+            return self._names.index(key)
+        except ValueError:
+            raise KeyError(key)
+
+    def __getitem__(self, key):
+        inx = self._index(key)
+        return self._values[inx]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self._index(key)
+            return True
+        except KeyError:
+            return False
+
+    has_key = __contains__
+
+    def __setitem__(self, key, value):
+        self._parse_all()
+
+        try:
+            self._values[self._names.index(key)] = value
+        except ValueError:
+            # names may be shared with other lines, so copy
+            self._names = self._names + [key]
+            self._values.append(value)
+
+        # force regen on next __str__ call
+        self.cdxline = None
+
+    def __delitem__(self, key):
+        self._parse_all()
+        inx = self._index(key)
+
+        self._names = self._names[:inx] + self._names[inx + 1:]
+        del self._values[inx]
+
+        self.cdxline = None
+
+    def pop(self, key, *args):
+        try:
+            value = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def update(self, *args, **kwargs):
+        for n, v in dict(*args, **kwargs).iteritems():
+            self[n] = v
+
+    def keys(self):
+        self._parse_all()
+        return list(self._names)
+
+    def values(self):
+        self._parse_all()
+        return list(self._values)
+
+    def items(self):
+        self._parse_all()
+        return zip(self._names, self._values)
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    __iter__ = iterkeys
+
+    def __len__(self):
+        self._parse_all()
+        return len(self._names)
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyCDXObject, OrderedDict)):
+            return self.items() == list(other.items())
+
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def is_revisit(self):
+        """return ``True`` if this record is a revisit record."""
+        return (self.get(MIMETYPE) == 'warc/revisit' or
+                self.get(FILENAME) == '-')
+
+    def to_text(self, fields=None):
+        """
+        return plaintext CDX record (includes newline).
+        if ``fields`` is ``None``, output will have all fields
+        in the order they are stored.
+
+        :param fields: list of field names to output.
+        """
+        if fields is None:
+            return str(self) + '\n'
+
+        try:
+            result = ' '.join(self[x] for x in fields) + '\n'
+        except KeyError as ke:
+            msg = 'Invalid field "{0}" found in fields= argument'
+            msg = msg.format(ke.message)
+            raise CDXException(msg)
+
+        return result
+
+    def to_json(self, fields=None):
+        """
+        return cdx as json dictionary string
+        if ``fields`` is ``None``, output will include all fields
+        in order stored, otherwise only specified fields will be
+        included
+
+        :param fields: list of field names to output
+        """
+        if fields is None:
+            return json_encode(OrderedDict(self.items())) + '\n'
+
+        try:
+            result = json_encode(OrderedDict((x, self[x]) for x in fields)) + '\n'
+        except KeyError as ke:
+            msg = 'Invalid field "{0}" found in fields= argument'
+            msg = msg.format(ke.message)
+            raise CDXException(msg)
+
+        return result
+
+    def __str__(self):
+        if self.cdxline:
+            return self.cdxline
+
+        if not self._from_json:
+            return ' '.join(self.values())
+        else:
+            return json_encode(OrderedDict(self.items()))
+
+    def __repr__(self):
+        return 'LazyCDXObject(' + repr(str(self)) + ')'
+
+
 #=================================================================
 class IDXObject(OrderedDict):
 
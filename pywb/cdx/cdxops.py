@@ -1,39 +1,99 @@
-from cdxobject import CDXObject, IDXObject
-from cdxobject import TIMESTAMP, STATUSCODE, MIMETYPE, DIGEST
+from cdxobject import CDXObject, IDXObject, LazyCDXObject, CDXException
+from cdxobject import URLKEY, TIMESTAMP, STATUSCODE, MIMETYPE, DIGEST
 from cdxobject import OFFSET, LENGTH, FILENAME
 
 from query import CDXQuery
-from pywb.utils.timeutils import timestamp_to_sec, pad_timestamp
+from pywb.utils.lrucache import LRUCache
+from pywb.utils.timeutils import timestamp_to_sec, sec_to_timestamp
+from pywb.utils.timeutils import pad_timestamp
 from pywb.utils.timeutils import PAD_14_DOWN, PAD_14_UP
 
 import bisect
+import heapq
 import itertools
+import json
+import logging
 import re
+import sys
+import threading
+import Queue
 
 from heapq import merge
 from collections import deque
+from hashlib import md5
+from multiprocessing.pool import ThreadPool
 
 
 #=================================================================
-def cdx_load(sources, query, process=True):
+def cdx_load(sources, query, process=True, merge_opts=None,
+             revisit_opts=None, range_workers=None):
     """
     merge text CDX lines from sources, return an iterator for
     filtered and access-checked sequence of CDX objects.
 
     :param sources: iterable for text CDX sources.
     :param process: bool, perform processing sorting/filtering/grouping ops
+    :param merge_opts: dict of options passed to
+    :func:`create_merged_cdx_gen`
+    :param revisit_opts: dict of options passed to
+    :func:`make_revisit_originals`
+    :param range_workers: :class:`RangeWorkers` for loading key ranges
+    of non-exact queries in parallel, if set
     """
-    cdx_iter = create_merged_cdx_gen(sources, query)
+    merge_opts = merge_opts or {}
+
+    # split into pages by key range, if possible
+    if process and is_block_paged(sources, query):
+        return cdx_load_page(sources, query, merge_opts, revisit_opts,
+                             range_workers)
+
+    originals = None
+    if process and query.resolve_revisits:
+        originals = make_revisit_originals(sources, query, revisit_opts)
+
+    # seek directly to closest captures, if possible
+    if process and is_closest_seek(sources, query):
+        return cdx_load_closest(sources, query, merge_opts, originals)
+
+    # read backwards from end of range, if possible
+    if process and is_reverse_seek(sources, query):
+        return cdx_load_reverse(sources, query, originals, merge_opts)
+
+    # skip to next urlkey instead of reading all captures, if possible
+    if process and is_collapse_seek(sources, query):
+        cdx_iter = cdx_collapse_seek(sources, query, merge_opts)
+    elif process and is_range_parallel(sources, query, range_workers):
+        cdx_iter = cdx_load_ranges(sources, query, merge_opts, range_workers)
+    else:
+        cdx_iter = create_merged_cdx_gen(sources, query, **merge_opts)
 
     # page count is a special case, no further processing
     if query.page_count:
         return cdx_iter
 
-    cdx_iter = make_obj_iter(cdx_iter, query)
+    # no processing needed, stream text lines as is
+    if is_text_passthrough(query, process):
+        return cdx_text_passthrough(cdx_iter, query, process)
+
+    line_filters = None
+    if process and not query.secondary_index_only:
+        line_filters = get_line_filters(query)
+
+    cdx_iter = make_obj_iter(cdx_iter, query, line_filters)
 
     if process and not query.secondary_index_only:
-        cdx_iter = process_cdx(cdx_iter, query)
+        cdx_iter = process_cdx(cdx_iter, query,
+                               filtered=line_filters is not None,
+                               originals=originals)
 
+    return cdx_output(cdx_iter, query)
+
+
+#=================================================================
+def cdx_output(cdx_iter, query):
+    """
+    apply custom ops to CDX objects and convert to the query output
+    """
     custom_ops = query.custom_ops
     for op in custom_ops:
         cdx_iter = op(cdx_iter, query)
@@ -46,6 +106,708 @@ def cdx_load(sources, query, process=True):
     return cdx_iter
 
 
+#=================================================================
+DEFAULT_PAGE_SIZE = 10
+
+
+def is_block_paged(sources, query):
+    """
+    return ``True`` if a page query can be split into pages by
+    the block keys of the sources. A single source which handles
+    paging itself (zipnum) is paged as before
+    """
+    if not query.page_count and 'page' not in query.params:
+        return False
+
+    if query.secondary_index_only:
+        return False
+
+    if not sources:
+        return False
+
+    if len(sources) == 1 and getattr(sources[0], 'paged', False):
+        return False
+
+    return all(getattr(source, 'seekable', False) for source in sources)
+
+
+def get_block_keys(sources, query):
+    """
+    return the block keys of the source with the most blocks
+    in the query range, which are used to split all sources
+    """
+    block_keys = []
+    for source in sources:
+        keys = source.get_block_keys(query)
+        if keys is not None and len(keys) > len(block_keys):
+            block_keys = keys
+
+    return block_keys
+
+
+def cdx_load_page(sources, query, merge_opts, revisit_opts=None,
+                  range_workers=None):
+    """
+    load a single page of ``pageSize`` blocks, as a query for the
+    key range of the page, or return the page count. Only the
+    block keys at the start and end of the page are read
+    """
+    page_size = int(query.page_size or DEFAULT_PAGE_SIZE)
+
+    block_keys = get_block_keys(sources, query)
+    num_blocks = len(block_keys) + 1
+    total_pages = (num_blocks + page_size - 1) / page_size
+
+    if query.page_count:
+        # single block, check if any lines in range
+        if num_blocks == 1:
+            try:
+                next(create_merged_cdx_gen(sources, query, **merge_opts))
+            except StopIteration:
+                total_pages = 0
+                num_blocks = 0
+
+        info = dict(pages=total_pages, pageSize=page_size,
+                    blocks=num_blocks)
+        return iter([json.dumps(info) + '\n'])
+
+    curr_page = query.page
+    if curr_page >= total_pages or curr_page < 0:
+        msg = 'Page {0} invalid: First Page is 0, Last Page is {1}'
+        raise CDXException(msg.format(curr_page, total_pages - 1))
+
+    key = query.key
+    if curr_page > 0:
+        key = max(key, block_keys[curr_page * page_size - 1])
+
+    end_key = query.end_key
+    end_inx = (curr_page + 1) * page_size - 1
+    if end_inx < len(block_keys):
+        end_key = min(end_key, block_keys[end_inx])
+
+    params = dict(query.params)
+    params.pop('page', None)
+    params.pop('showNumPages', None)
+
+    # page is bounded by key range, not by the page size of each source
+    params['pageSize'] = sys.maxint
+
+    page_query = CDXQuery(**params)
+    page_query.set_key(key, end_key)
+
+    # originals of revisits may be in an earlier page
+    if curr_page > 0 and query.resolve_revisits:
+        revisit_opts = dict(revisit_opts or {}, lookup=True, partial=True)
+
+    return cdx_load(sources, page_query, merge_opts=merge_opts,
+                    revisit_opts=revisit_opts, range_workers=range_workers)
+
+
+#=================================================================
+class RangeWorkers(object):
+    """
+    Pool of ``num_workers`` threads, shared by all queries of a
+    cdx server, for loading key ranges of ``range_blocks`` blocks each
+    in parallel. The threads are started on first use
+    """
+    def __init__(self, num_workers, range_blocks=1):
+        self.num_workers = num_workers
+        self.range_blocks = range_blocks
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        if not self.pool:
+            with self.lock:
+                if not self.pool:
+                    self.pool = ThreadPool(self.num_workers)
+
+        return self.pool
+
+    def close(self):
+        """ Stop the threads, started again on next use
+        """
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def is_range_parallel(sources, query, range_workers):
+    """
+    return ``True`` if a non-exact query can be split into key ranges,
+    by the block keys of the sources, and loaded in parallel
+    """
+    if not range_workers or range_workers.num_workers < 2:
+        return False
+
+    if query.is_exact or query.page_count or query.secondary_index_only:
+        return False
+
+    if not sources:
+        return False
+
+    return all(getattr(source, 'seekable', False) for source in sources)
+
+
+def get_key_ranges(sources, query, range_blocks):
+    """
+    return list of (key, end_key) ranges, in order, covering the same
+    lines as the query, each of ``range_blocks`` blocks of the sources
+    """
+    end_key = query.end_key
+
+    # single source without a page only reads a page of blocks
+    if len(sources) == 1 and getattr(sources[0], 'paged', False):
+        end_key = sources[0].get_unpaged_end_key(query)
+
+    block_keys = get_block_keys(sources, query)
+
+    ranges = []
+    key = query.key
+    for i in xrange(range_blocks - 1, len(block_keys), range_blocks):
+        block_key = block_keys[i]
+        if block_key >= end_key:
+            break
+
+        if block_key > key:
+            ranges.append((key, block_key))
+            key = block_key
+
+    ranges.append((key, end_key))
+    return ranges
+
+
+def load_range_lines(sources, query, dedup=False, dedup_stats=None):
+    return list(create_merged_cdx_gen(sources, query, dedup=dedup,
+                                      dedup_stats=dedup_stats))
+
+
+def cdx_load_ranges(sources, query, merge_opts, range_workers):
+    """
+    load the lines of the query range by splitting it at the block keys
+    of the sources, and loading each range on the ``range_workers`` pool.
+
+    The lines are yielded in key order, with at most ``num_workers``
+    ranges loaded ahead of the consumer, so that no more ranges are
+    loaded once the consumer stops, eg. at the query limit
+    """
+    ranges = get_key_ranges(sources, query, range_workers.range_blocks)
+    if len(ranges) == 1:
+        for line in create_merged_cdx_gen(sources, query, **merge_opts):
+            yield line
+
+        return
+
+    params = dict(query.params)
+
+    # each range is bounded by keys, not by the page size of the source
+    params['pageSize'] = sys.maxint
+
+    def submit(key, end_key):
+        range_query = CDXQuery(**params)
+        range_query.set_key(key, end_key)
+        pending.append(pool.apply_async(load_range_lines,
+                                        (sources, range_query,
+                                         merge_opts.get('dedup'),
+                                         merge_opts.get('dedup_stats'))))
+
+    pool = range_workers.get_pool()
+    pending = deque()
+    ranges = iter(ranges)
+
+    for key, end_key in itertools.islice(ranges, range_workers.num_workers):
+        submit(key, end_key)
+
+    while pending:
+        lines = pending.popleft().get()
+
+        # start next range before current is consumed
+        for key, end_key in itertools.islice(ranges, 1):
+            submit(key, end_key)
+
+        for line in lines:
+            yield line
+
+
+#=================================================================
+def is_closest_seek(sources, query):
+    """
+    return ``True`` if the closest captures can be loaded by seeking
+    to the closest timestamp in each source and reading outwards,
+    instead of reading all captures
+    """
+    if not query.closest or not query.is_exact:
+        return False
+
+    # collapse keeps the first capture of each group in forward order
+    if query.collapse:
+        return False
+
+    return is_seekable(sources, query)
+
+
+def is_reverse_seek(sources, query):
+    """
+    return ``True`` if a reverse query can be loaded by reading
+    each source backwards from the end of the query range
+    """
+    if not query.reverse or query.closest:
+        return False
+
+    # revisits resolved by timestamp, only within a single url
+    if query.resolve_revisits and not query.is_exact:
+        return False
+
+    # collapse keeps the first capture of each group in forward order
+    if query.collapse:
+        return False
+
+    return is_seekable(sources, query)
+
+
+def is_seekable(sources, query):
+    if query.secondary_index_only or query.page_count:
+        return False
+
+    # explicit page of results requested
+    if 'page' in query.params:
+        return False
+
+    # collapsing depends on reading in timestamp order
+    if query.collapse_time:
+        return False
+
+    if not sources:
+        return False
+
+    return all(getattr(source, 'seekable', False) for source in sources)
+
+
+def cdx_load_reverse(sources, query, originals=None, merge_opts=None):
+    """
+    load captures in reverse order, reading backwards from the
+    end of the query range, until ``limit`` captures
+    (after filtering) are found
+    """
+    merge_opts = merge_opts or {}
+    cdx_iter = create_merged_reverse_cdx_gen(sources, query,
+                                             merge_opts.get('dedup'),
+                                             merge_opts.get('dedup_stats'))
+
+    line_filters = get_line_filters(query)
+
+    cdx_iter = make_obj_iter(cdx_iter, query, line_filters)
+
+    if query.resolve_revisits:
+        cdx_iter = iter(ReverseRevisitReader(cdx_iter, True, originals))
+
+    cdx_iter = cdx_process_seek(cdx_iter, query,
+                                filtered=line_filters is not None)
+
+    return cdx_output(cdx_iter, query)
+
+
+def cdx_load_closest(sources, query, merge_opts, originals=None):
+    """
+    load captures closest to ``query.closest``, in order of distance.
+
+    the sources are read forward from ``key + ' ' + closest`` and
+    in reverse from just before it, and the two sides are merged
+    by distance until ``limit`` captures (after filtering) are found
+    """
+    closest_sec = timestamp_to_sec(query.closest)
+    seek_key = query.url_key + ' ' + sec_to_timestamp(closest_sec)
+
+    fwd_query = CDXQuery(**query.params)
+    fwd_query.set_key(max(seek_key, query.key), query.end_key)
+
+    bwd_query = CDXQuery(**query.params)
+    bwd_query.set_key(query.key, min(seek_key, query.end_key))
+
+    fwd_iter = create_merged_cdx_gen(sources, fwd_query, **merge_opts)
+    bwd_iter = create_merged_reverse_cdx_gen(sources, bwd_query,
+                                             merge_opts.get('dedup'),
+                                             merge_opts.get('dedup_stats'))
+
+    line_filters = get_line_filters(query)
+
+    # captures with the same timestamp are kept in forward order
+    bwd_iter = make_obj_iter(bwd_iter, query, line_filters)
+    bwd_iter = cdx_reverse_groups(bwd_iter)
+
+    cdx_iter = iter(ClosestMerge(closest_sec,
+                                 make_obj_iter(fwd_iter, query, line_filters),
+                                 bwd_iter,
+                                 query.resolve_revisits,
+                                 originals))
+
+    cdx_iter = cdx_process_seek(cdx_iter, query,
+                                filtered=line_filters is not None)
+
+    return cdx_output(cdx_iter, query)
+
+
+def is_collapse_seek(sources, query):
+    """
+    return ``True`` if a collapse query can be loaded by seeking
+    past the remaining captures of each group: ``collapse=urlkey``
+    for non-exact queries, or ``collapse=timestamp:N``
+    """
+    if not get_collapse_groups(query):
+        return False
+
+    # all captures needed for counts
+    if (query.show_group_count or query.show_uniq_count or
+        query.last_skip_timestamp):
+        return False
+
+    # first capture of each group must be the one kept
+    if (query.filters or query.resolve_revisits or
+        query.closest or query.reverse):
+        return False
+
+    return is_seekable(sources, query)
+
+
+def get_collapse_groups(query):
+    """
+    return a pair of functions for a collapse query, which return the
+    group of a cdx line, and the first key after all lines of a group,
+    or ``None`` if not supported for this collapse
+    """
+    collapse = query.collapse
+    if not collapse:
+        return None
+
+    if collapse == URLKEY:
+        if query.is_exact:
+            return None
+
+        return (lambda line: line.split(' ', 1)[0],
+                lambda urlkey: urlkey + '!')
+
+    field, _, length = collapse.partition(':')
+    if field == TIMESTAMP and length.isdigit() and int(length) > 0:
+        length = int(length)
+        return (lambda line: _timestamp_bucket(line, length),
+                _next_timestamp_bucket)
+
+    return None
+
+
+def _timestamp_bucket(line, length):
+    urlkey, timestamp = line.split(' ', 2)[:2]
+    return urlkey, timestamp[:length]
+
+
+def _next_timestamp_bucket(group):
+    """
+    >>> _next_timestamp_bucket(('com,example)/', '201412'))
+    'com,example)/ 201413'
+
+    >>> _next_timestamp_bucket(('com,example)/', '99'))
+    'com,example)/!'
+    """
+    urlkey, bucket = group
+    next_bucket = str(int(bucket) + 1).zfill(len(bucket))
+
+    # no timestamps after last bucket
+    if len(next_bucket) > len(bucket):
+        return urlkey + '!'
+
+    return urlkey + ' ' + next_bucket
+
+
+def cdx_collapse_seek(sources, query, merge_opts, max_scan=8):
+    """
+    yield the first cdx line of each collapse group, see
+    :func:`get_collapse_groups`. once more than ``max_scan`` further lines
+    of the same group are read, the sources are searched again from
+    the first key after the group, skipping the rest of the group.
+
+    lines outside the from/to range are dropped, and do not start a group
+    """
+    group_func, group_end_func = get_collapse_groups(query)
+    in_range = timestamp_range_func(query.from_ts, query.to_ts)
+
+    key = query.key
+
+    while key:
+        seek_query = CDXQuery(**query.params)
+        seek_query.set_key(key, query.end_key)
+
+        cdx_iter = create_merged_cdx_gen(sources, seek_query, **merge_opts)
+
+        key = None
+        group = None
+        num_scan = 0
+
+        try:
+            for line in cdx_iter:
+                if in_range and not in_range(line.split(' ', 2)[1]):
+                    continue
+
+                curr_group = group_func(line)
+                if curr_group != group:
+                    group = curr_group
+                    num_scan = 0
+                    yield line
+                    continue
+
+                num_scan += 1
+                if num_scan > max_scan:
+                    key = group_end_func(group)
+                    break
+        finally:
+            cdx_iter.close()
+
+
+def cdx_process_seek(cdx_iter, query, filtered=False):
+    """
+    filter and limit captures already in the final order
+    """
+    filters = query.filters
+    if filters and not filtered:
+        cdx_iter = cdx_filter(cdx_iter, filters)
+
+    if query.from_ts or query.to_ts:
+        cdx_iter = cdx_clamp(cdx_iter, query.from_ts, query.to_ts)
+
+    return cdx_limit(cdx_iter, query.limit)
+
+
+def cdx_reverse_groups(cdx_iter):
+    """
+    reverse the order of each group of consecutive captures
+    with the same timestamp
+    """
+    for _, group in itertools.groupby(cdx_iter, lambda cdx: cdx[TIMESTAMP]):
+        for cdx in reversed(list(group)):
+            yield cdx
+
+
+#=================================================================
+class ReverseRevisitReader(object):
+    """
+    Reader of captures in reverse order.
+
+    If ``resolve_revisits`` is set, each revisit is resolved to the
+    earliest original with the same digest read so far, reading
+    further back if no earlier original has been read yet.
+    Originals may also be added from other iterators with
+    :meth:`add_original`
+    """
+    def __init__(self, cdx_iter, resolve_revisits=False, originals=None):
+        self.cdx_iter = cdx_iter
+        self.resolve_revisits = resolve_revisits
+
+        # captures read ahead while looking for originals
+        self.buff = deque()
+
+        if resolve_revisits and originals is None:
+            originals = RevisitOriginals()
+
+        self.originals = originals
+
+    def add_original(self, cdx, replace=True):
+        if self.resolve_revisits:
+            self.originals.add(cdx, replace)
+
+    def _read(self):
+        cdx = next(self.cdx_iter, None)
+        if cdx is not None:
+            self.add_original(cdx)
+
+        return cdx
+
+    def read(self):
+        """ return next capture, or None if no more captures
+        """
+        if self.buff:
+            return self.buff.popleft()
+
+        return self._read()
+
+    def find_original(self, cdx):
+        digest = cdx.get(DIGEST)
+        if not digest:
+            return None
+
+        timestamp = cdx[TIMESTAMP]
+
+        original_cdx = self.originals.find(cdx, timestamp, lookup=False)
+        if original_cdx:
+            return original_cdx
+
+        # read further back until an original is found
+        while True:
+            orig = self._read()
+            if orig is None:
+                # may be evicted or before start of range
+                return self.originals.find(cdx, timestamp)
+
+            self.buff.append(orig)
+
+            if (orig.get(DIGEST) == digest and not orig.is_revisit() and
+                orig[TIMESTAMP] <= timestamp):
+                return orig
+
+    def resolve(self, cdx):
+        if self.resolve_revisits:
+            self.originals.resolve(cdx, self.find_original)
+
+    def __iter__(self):
+        while True:
+            cdx = self.read()
+            if cdx is None:
+                return
+
+            self.resolve(cdx)
+            yield cdx
+
+
+#=================================================================
+class ClosestMerge(object):
+    """
+    Merge a forward iterator of captures at or after the closest
+    timestamp with a reverse iterator of captures before it,
+    yielding captures in order of distance from the closest timestamp.
+    On equal distance, the earlier capture is first.
+
+    Revisits are resolved as by :class:`ReverseRevisitReader`
+    """
+    def __init__(self, closest_sec, fwd_iter, bwd_iter,
+                 resolve_revisits=False, originals=None):
+        self.closest_sec = closest_sec
+        self.fwd_iter = fwd_iter
+        self.bwd_reader = ReverseRevisitReader(bwd_iter, resolve_revisits,
+                                               originals)
+
+    def _dist(self, cdx):
+        if cdx is None:
+            return None
+
+        return abs(self.closest_sec - timestamp_to_sec(cdx[TIMESTAMP]))
+
+    def _read_fwd(self):
+        cdx = next(self.fwd_iter, None)
+        if cdx is not None:
+            # after all captures read backwards, in forward order
+            self.bwd_reader.add_original(cdx, replace=False)
+
+        return cdx
+
+    def __iter__(self):
+        fwd = self._read_fwd()
+        bwd = self.bwd_reader.read()
+
+        fwd_dist = self._dist(fwd)
+        bwd_dist = self._dist(bwd)
+
+        while fwd is not None or bwd is not None:
+            if bwd is not None and (fwd is None or bwd_dist <= fwd_dist):
+                cdx = bwd
+                bwd = self.bwd_reader.read()
+                bwd_dist = self._dist(bwd)
+            else:
+                cdx = fwd
+                fwd = self._read_fwd()
+                fwd_dist = self._dist(fwd)
+
+            self.bwd_reader.resolve(cdx)
+            yield cdx
+
+
+#=================================================================
+def is_text_passthrough(query, process=True):
+    """
+    return ``True`` if query requests text output and no ops which
+    require parsing each cdx line
+    """
+    if query.output != 'text' or query.secondary_index_only:
+        return False
+
+    if query.custom_ops:
+        return False
+
+    if not process:
+        return True
+
+    return not (query.resolve_revisits or
+                query.filters or
+                query.from_ts or
+                query.to_ts or
+                query.collapse_time or
+                query.collapse or
+                query.closest or
+                query.reverse)
+
+
+#=================================================================
+def cdx_text_passthrough(text_iter, query, process=True):
+    """
+    stream text cdx lines without creating cdx objects.
+    if ``fields`` are specified, fields are projected from each line
+    directly (falling back to a cdx object for cdxj lines)
+    """
+    if process:
+        text_iter = itertools.islice(text_iter, query.limit)
+
+    fields = query.fields
+    if not fields:
+        return (line.rstrip() + '\n' for line in text_iter)
+
+    return FieldProjector(fields).project_iter(text_iter)
+
+
+#=================================================================
+class FieldProjector(object):
+    """
+    Project ``fields`` from plain text cdx lines, by field position,
+    computed once per cdx format
+    """
+    def __init__(self, fields):
+        self.fields = fields
+        self.positions = {}
+
+    def get_positions(self, num_fields):
+        positions = self.positions.get(num_fields)
+        if positions:
+            return positions
+
+        cdxformat = CDXObject.get_cdx_format(num_fields)
+
+        try:
+            positions = [cdxformat.index(x) for x in self.fields]
+        except ValueError:
+            # raise standard invalid field error
+            missing = [x for x in self.fields if x not in cdxformat][0]
+            msg = 'Invalid field "{0}" found in fields= argument'
+            raise CDXException(msg.format(missing))
+
+        self.positions[num_fields] = positions
+        return positions
+
+    def project(self, line):
+        line = line.rstrip()
+        fields = line.split(' ')
+
+        # cdxj line, parse json block
+        if len(fields) > 2 and fields[2].startswith('{'):
+            return LazyCDXObject(line).to_text(self.fields)
+
+        positions = self.get_positions(len(fields))
+        return ' '.join([fields[i] for i in positions]) + '\n'
+
+    def project_iter(self, text_iter):
+        for line in text_iter:
+            yield self.project(line)
+
+
 #=================================================================
 def cdx_to_text(cdx_iter, fields):
     for cdx in cdx_iter:
@@ -59,12 +821,12 @@ def cdx_to_json(cdx_iter, fields):
 
 
 #=================================================================
-def process_cdx(cdx_iter, query):
+def process_cdx(cdx_iter, query, filtered=False, originals=None):
     if query.resolve_revisits:
-        cdx_iter = cdx_resolve_revisits(cdx_iter)
+        cdx_iter = cdx_resolve_revisits(cdx_iter, originals)
 
     filters = query.filters
-    if filters:
+    if filters and not filtered:
         cdx_iter = cdx_filter(cdx_iter, filters)
 
     if query.from_ts or query.to_ts:
@@ -74,12 +836,21 @@ def process_cdx(cdx_iter, query):
     if collapse_time:
         cdx_iter = cdx_collapse_time_status(cdx_iter, collapse_time)
 
+    collapse = query.collapse
+    if collapse:
+        cdx_iter = cdx_collapse(cdx_iter, collapse,
+                                group_count=query.show_group_count,
+                                uniq_count=query.show_uniq_count,
+                                last_timestamp=query.last_skip_timestamp)
+
     closest = query.closest
     reverse = query.reverse
     limit = query.limit
 
     if closest:
-        cdx_iter = cdx_sort_closest(closest, cdx_iter, limit)
+        # exact match cdx are in timestamp order
+        cdx_iter = cdx_sort_closest(closest, cdx_iter, limit,
+                                    sorted_input=query.is_exact)
 
     elif reverse:
         cdx_iter = cdx_reverse(cdx_iter, limit)
@@ -91,35 +862,324 @@ def process_cdx(cdx_iter, query):
 
 
 #=================================================================
-def create_merged_cdx_gen(sources, query):
+def create_merged_cdx_gen(sources, query, parallel=False,
+                          queue_size=256, source_timeout=None,
+                          dedup=False, dedup_stats=None):
     """
     create a generator which loads and merges cdx streams
     ensures cdxs are lazy loaded
+
+    if ``parallel`` is set, each source is loaded in its own thread,
+    see :class:`ThreadedSourceIter`
+
+    if ``dedup`` is set, the same capture listed in several sources
+    is only yielded once, see :func:`cdx_dedup`
     """
     # Optimize: no need to merge if just one input
     if len(sources) == 1:
         cdx_iter = sources[0].load_cdx(query)
+    elif parallel:
+        source_iters = [ThreadedSourceIter(src, query,
+                                           queue_size, source_timeout)
+                        for src in sources]
+        cdx_iter = merge(*source_iters)
     else:
         source_iters = map(lambda src: src.load_cdx(query), sources)
         cdx_iter = merge(*(source_iters))
 
+    if (dedup and len(sources) > 1 and
+        not query.secondary_index_only and not query.page_count):
+        cdx_iter = cdx_dedup(cdx_iter, query, dedup_stats)
+
+    try:
+        for cdx in cdx_iter:
+            yield cdx
+    finally:
+        if parallel and len(sources) > 1:
+            for source_iter in source_iters:
+                source_iter.close()
+
+
+#=================================================================
+def create_merged_reverse_cdx_gen(sources, query, dedup=False,
+                                  dedup_stats=None):
+    """
+    create a generator which loads and merges cdx streams from sources
+    in reverse order
+    """
+    if len(sources) == 1:
+        cdx_iter = sources[0].load_cdx_reverse(query)
+    else:
+        source_iters = map(lambda src: src.load_cdx_reverse(query), sources)
+        cdx_iter = merge_reverse(*source_iters)
+
+        if dedup:
+            cdx_iter = cdx_dedup(cdx_iter, query, dedup_stats)
+
     for cdx in cdx_iter:
         yield cdx
 
 
 #=================================================================
-def make_obj_iter(text_iter, query):
+def _capture_prefix(line):
+    """ Return the urlkey and timestamp of a line, with trailing space
+
+    >>> _capture_prefix('com,example)/ 20140101000000 {"url": "http://example.com/"}')
+    'com,example)/ 20140101000000 '
+    """
+    end = line.find(' ', line.find(' ') + 1)
+    if end < 0:
+        return line
+
+    return line[:end + 1]
+
+
+def _capture_location(line):
+    """ Return the (filename, offset) of the capture of a line
+
+    >>> _capture_location('com,example)/ 20140101000000 {"url": "http://example.com/", "offset": "100", "filename": "a.warc.gz"}')
+    ('a.warc.gz', '100')
+
+    >>> _capture_location('com,example)/ 20140101000000 http://example.com/ text/html 200 AAA - - 500 100 a.warc.gz\\n')
+    ('a.warc.gz', '100')
+    """
+    cdx = LazyCDXObject(line.rstrip())
+    return cdx.get(FILENAME), cdx.get(OFFSET)
+
+
+def cdx_dedup(text_iter, query, stats=None):
+    """
+    skip lines which are the same capture as the previous line: same
+    urlkey, timestamp, filename and offset, eg. a warc listed in
+    several indexes. Only adjacent lines are compared, so the same
+    capture is removed when the merged lines are in sorted order
+
+    the count of lines removed for the query is recorded in ``stats``
+
+    >>> lines = ['a 1 {"offset": "0", "filename": "f"}',
+    ...          'a 1 {"offset": "0", "filename": "f"}',
+    ...          'a 1 {"filename": "f", "offset": "0"}',
+    ...          'a 1 {"offset": "5", "filename": "f"}',
+    ...          'a 2 {"offset": "5", "filename": "f"}']
+
+    >>> stats = DedupStats()
+    >>> list(cdx_dedup(lines, CDXQuery(key='a'), stats))
+    ['a 1 {"offset": "0", "filename": "f"}', 'a 1 {"offset": "5", "filename": "f"}', 'a 2 {"offset": "5", "filename": "f"}']
+
+    >>> stats.stats()['removed']
+    2
+    """
+    prev = None
+    prev_prefix = None
+    prev_location = None
+    removed = 0
+
+    try:
+        for line in text_iter:
+            if prev is not None and line.startswith(prev_prefix):
+                if line == prev:
+                    removed += 1
+                    continue
+
+                if prev_location is None:
+                    prev_location = _capture_location(prev)
+
+                location = _capture_location(line)
+                if location == prev_location:
+                    removed += 1
+                    continue
+
+                prev_location = location
+            else:
+                prev_prefix = _capture_prefix(line)
+                prev_location = None
+
+            prev = line
+            yield line
+    finally:
+        if stats:
+            stats.record(removed)
+
+        if removed:
+            logging.debug('Removed %d duplicate captures for: %s',
+                          removed, query.key)
+
+
+#=================================================================
+class DedupStats(object):
+    """
+    Counters for removing duplicate captures from merged sources,
+    shared by all queries of a server
+
+    ``loads``: merged loads with dedup enabled
+    ``loads_with_dups``: merged loads with any duplicates removed
+    ``removed``: total duplicates removed
+    ``max_removed``: most duplicates removed from a single load
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict(loads=0,
+                           loads_with_dups=0,
+                           removed=0,
+                           max_removed=0)
+
+    def record(self, removed):
+        with self.lock:
+            self.counts['loads'] += 1
+            if removed:
+                self.counts['loads_with_dups'] += 1
+                self.counts['removed'] += removed
+                self.counts['max_removed'] = max(self.counts['max_removed'],
+                                                 removed)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+class ReverseKey(object):
+    """
+    wrapper for a line, which sorts in reverse order
+    """
+    __slots__ = ('line',)
+
+    def __init__(self, line):
+        self.line = line
+
+    def __lt__(self, other):
+        return other.line < self.line
+
+    def __eq__(self, other):
+        return self.line == other.line
+
+
+def merge_reverse(*iters):
+    """
+    merge iterators of lines, each in reverse sorted order,
+    into a single iterator in reverse sorted order
+
+    >>> list(merge_reverse(['c', 'a'], ['d', 'b', 'a']))
+    ['d', 'c', 'b', 'a', 'a']
+    """
+    iters = [itertools.imap(ReverseKey, iter_) for iter_ in iters]
+    return (key.line for key in merge(*iters))
+
+
+#=================================================================
+class ThreadedSourceIter(object):
     """
-    convert text cdx stream to CDXObject/IDXObject.
+    Iterator over the cdx lines of a single source, loaded in a
+    worker thread into a bounded queue.
+
+    The worker blocks when the queue is full, so a source is only read
+    ahead by ``queue_size`` lines of the merge.
+
+    If ``timeout`` is set, and no line is received from the source
+    within ``timeout`` seconds, the source is skipped for the remainder
+    of the query.
+
+    Any exception in the worker is re-raised in the consumer
+    """
+    END = object()
+
+    def __init__(self, source, query, queue_size=256, timeout=None):
+        self.source = source
+        self.timeout = timeout
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.done = False
+        self.closed = threading.Event()
+
+        thread = threading.Thread(target=self._run, args=(query,))
+        thread.daemon = True
+        thread.start()
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except Queue.Full:
+                pass
+
+        return False
+
+    def _run(self, query):
+        try:
+            for line in self.source.load_cdx(query):
+                if not self._put(line):
+                    return
+        except Exception:
+            self._put(sys.exc_info())
+            return
+
+        self._put(self.END)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self.done:
+            raise StopIteration
+
+        try:
+            item = self.queue.get(timeout=self.timeout)
+        except Queue.Empty:
+            logging.warn('CDX source %s timed out after %s secs, skipping',
+                         self.source, self.timeout)
+            item = self.END
+
+        if item is self.END:
+            self.close()
+            raise StopIteration
+
+        # exc_info from worker
+        if isinstance(item, tuple):
+            self.close()
+            raise item[0], item[1], item[2]
+
+        return item
+
+    def close(self):
+        """ Stop the worker thread, if still running
+        """
+        self.done = True
+        self.closed.set()
+
+
+#=================================================================
+def make_obj_iter(text_iter, query, line_filters=None):
+    """
+    convert text cdx stream to LazyCDXObject/IDXObject.
+
+    if compiled ``line_filters`` are set, lines which do not match
+    are skipped, without being converted
     """
     if query.secondary_index_only:
         cls = IDXObject
     else:
-        cls = CDXObject
+        cls = LazyCDXObject
+
+    if line_filters:
+        text_iter = itertools.ifilter(line_filters.match_line, text_iter)
 
     return (cls(line) for line in text_iter)
 
 
+def get_line_filters(query):
+    """
+    return compiled filters, if the query filters can be applied to
+    the raw cdx lines, before any other processing
+    """
+    if not query.filters:
+        return None
+
+    # revisits resolved before filtering, from unfiltered originals
+    if query.resolve_revisits:
+        return None
+
+    return CDXFilters.compile(query.filters)
+
+
 #=================================================================
 def cdx_limit(cdx_iter, limit):
     """
@@ -161,71 +1221,260 @@ def cdx_filter(cdx_iter, filter_strings):
     filter CDX by regex if each filter is :samp:`{field}:{regex}` form,
     apply filter to :samp:`cdx[{field}]`.
     """
-    # Support single strings as well
-    if isinstance(filter_strings, str):
-        filter_strings = [filter_strings]
-
-    filters = []
-
-    class Filter:
-        def __init__(self, string):
-            # invert filter
-            self.invert = string.startswith('!')
-            if self.invert:
-                string = string[1:]
-
-            # exact match
-            if string.startswith('='):
-                string = string[1:]
-                self.compare_func = self.exact
-            # contains match
-            elif string.startswith('~'):
-                string = string[1:]
-                self.compare_func = self.contains
-            else:
-                self.compare_func = self.regex
+    filters = CDXFilters.compile(filter_strings)
 
-            parts = string.split(':', 1)
-            # no field set, apply filter to entire cdx
-            if len(parts) == 1:
-                self.field = ''
-            # apply filter to cdx[field]
-            else:
-                self.field = parts[0]
-                self.field = CDXObject.CDX_ALT_FIELDS.get(self.field,
-                                                          self.field)
-                string = parts[1]
-
-            # make regex if regex mode
-            if self.compare_func == self.regex:
-                self.regex = re.compile(string)
-            else:
-                self.filter_str = string
+    for cdx in cdx_iter:
+        if filters(cdx):
+            yield cdx
+
+
+#=================================================================
+class CDXFilter(object):
+    """
+    A single filter, of the form :samp:`[!][=|~][{field}:]{value}`
+
+    ``literals`` is a tuple of strings, one of which must be in
+    any line which the filter matches, or ``None`` if not known
+
+    ``json_literals`` are the same literals, if none may be escaped
+    when json-encoded, and so must be in any matching cdxj line
+
+    >>> CDXFilter('!statuscode:(500|502|504)').literals
+    ('500', '502', '504')
+
+    >>> CDXFilter('~urlkey:example').literals
+    ('example',)
+
+    >>> CDXFilter('mimetype:text/.*').literals
+
+    >>> f = CDXFilter('~url:"quoted"')
+    >>> f.literals, f.json_literals
+    (('"quoted"',), None)
+
+    >>> CDXFilter('~url:caf\\xc3\\xa9').json_literals
+
+    >>> CDXFilter('~url:example.com/a').json_literals
+    """
+    LITERAL_RX = re.compile(r'^[A-Za-z0-9_ ,/;=-]+$')
+
+    def __init__(self, string):
+        # invert filter
+        self.invert = string.startswith('!')
+        if self.invert:
+            string = string[1:]
+
+        # exact match
+        if string.startswith('='):
+            string = string[1:]
+            self.compare_func = self.exact
+        # contains match
+        elif string.startswith('~'):
+            string = string[1:]
+            self.compare_func = self.contains
+        else:
+            self.compare_func = self.regex
+
+        parts = string.split(':', 1)
+        # no field set, apply filter to entire cdx
+        if len(parts) == 1:
+            self.field = ''
+        # apply filter to cdx[field]
+        else:
+            self.field = parts[0]
+            self.field = CDXObject.CDX_ALT_FIELDS.get(self.field,
+                                                      self.field)
+            string = parts[1]
+
+        # make regex if regex mode
+        if self.compare_func == self.regex:
+            self.regex = re.compile(string)
+            self.literals = self._regex_literals(string)
+        else:
+            self.filter_str = string
+            self.literals = (string,)
+
+        self.json_literals = self.literals
+        if self.literals and not all(map(self._is_json_safe, self.literals)):
+            self.json_literals = None
+
+    @staticmethod
+    def _is_json_safe(literal):
+        """ True if ``literal`` is not escaped in a json string.
+        '/' may optionally be escaped as '\\/', so is never safe
+        """
+        if '/' in literal:
+            return False
+
+        try:
+            return json.dumps(literal)[1:-1] == literal
+        except ValueError:
+            return False
+
+    @classmethod
+    def _regex_literals(cls, pattern):
+        """ literals, one of which must be matched by a regex
+        which is a single literal or alternation of literals
+        """
+        if pattern.startswith('(') and pattern.endswith(')'):
+            pattern = pattern[1:-1]
+
+        literals = tuple(pattern.split('|'))
+        if all(cls.LITERAL_RX.match(literal) for literal in literals):
+            return literals
+
+        return None
+
+    def __call__(self, cdx):
+        if not self.field:
+            val = str(cdx)
+        else:
+            val = cdx.get(self.field, '')
+
+        return self.match(val)
+
+    def match(self, val):
+        return self.compare_func(val) ^ self.invert
+
+    def exact(self, val):
+        return (self.filter_str == val)
+
+    def contains(self, val):
+        return (self.filter_str in val)
+
+    def regex(self, val):
+        return self.regex.match(val) is not None
+
+
+#=================================================================
+class CDXFilters(object):
+    """
+    All filters of a query, compiled once into a single predicate,
+    which can be applied to a cdx object or to a raw cdx line.
+
+    Compiled filters are cached by filter strings, see :meth:`compile`
+
+    >>> filters = CDXFilters.compile(['!statuscode:(500|502|504)', '!mimetype:-'])
+    >>> filters.match_line('com,example)/ 20140101000000 http://example.com/ text/html 200 ABC - - 100 0 a.warc.gz')
+    True
+
+    >>> filters.match_line('com,example)/ 20140101000000 http://example.com/ text/html 502 ABC - - 100 0 a.warc.gz')
+    False
+
+    >>> filters.match_line('com,example)/ 20140101000000 {"url": "http://example.com/", "mime": "-"}')
+    False
+
+    # json-escaped value in cdxj line
+    >>> CDXFilters.compile(['=title:say "hi"']).match_line('com,example)/ 20140101000000 {"title": "say \\\\"hi\\\\""}')
+    True
+
+    # json may also escape '/'
+    >>> line = 'com,example)/a/b 20140101000000 {"url": "http:\\\\/\\\\/example.com\\\\/a\\\\/b", "mime": "text\\\\/html"}'
+    >>> CDXFilters.compile(['mimetype:text/html']).match_line(line)
+    True
+
+    >>> CDXFilters.compile(['~url:example.com/a']).match_line(line)
+    True
+
+    >>> CDXFilters.compile(('!statuscode:(500|502|504)', '!mimetype:-')) is filters
+    True
+    """
+    cache = LRUCache(1000, sizeof=lambda filters: 1)
+
+    def __init__(self, filter_strings):
+        self.filters = map(CDXFilter, filter_strings)
+
+        # field indexes of each filter, by number of fields in line
+        self.field_indexes = {}
+
+    @classmethod
+    def compile(cls, filter_strings):
+        # Support single strings as well
+        if isinstance(filter_strings, str):
+            filter_strings = [filter_strings]
+
+        key = tuple(filter_strings)
+
+        filters = cls.cache.get(key)
+        if not filters:
+            filters = CDXFilters(key)
+            cls.cache.put(key, filters)
+
+        return filters
+
+    def __call__(self, cdx):
+        for cdx_filter in self.filters:
+            if not cdx_filter(cdx):
+                return False
+
+        return True
+
+    def _get_indexes(self, num_fields):
+        indexes = self.field_indexes.get(num_fields)
+        if indexes is None:
+            names = CDXObject.get_cdx_format(num_fields)
+            indexes = [names.index(f.field) if f.field in names else None
+                       for f in self.filters]
+            self.field_indexes[num_fields] = indexes
+
+        return indexes
 
-        def __call__(self, cdx):
-            if not self.field:
-                val = str(cdx)
+    def match_line(self, line):
+        """ return ``True`` if all filters match the raw cdx line.
+        The line is not split into fields if any filter can be
+        decided by its literals not being in the line
+        """
+        undecided = []
+
+        # values in json block of cdxj line may be escaped
+        fields = line.split(' ', 3)
+        is_json = len(fields) > 2 and fields[2].startswith('{')
+
+        for i, cdx_filter in enumerate(self.filters):
+            if is_json:
+                literals = cdx_filter.json_literals
             else:
-                val = cdx.get(self.field, '')
+                literals = cdx_filter.literals
 
-            matched = self.compare_func(val)
+            if (literals is not None and
+                not any(literal in line for literal in literals)):
 
-            return matched ^ self.invert
+                # filter can not match
+                if cdx_filter.invert:
+                    continue
 
-        def exact(self, val):
-            return (self.filter_str == val)
+                return False
 
-        def contains(self, val):
-            return (self.filter_str in val)
+            undecided.append(i)
 
-        def regex(self, val):
-            return self.regex.match(val) is not None
+        if not undecided:
+            return True
 
-    filters = map(Filter, filter_strings)
+        line = line.rstrip()
 
-    for cdx in cdx_iter:
-        if all(x(cdx) for x in filters):
-            yield cdx
+        if is_json:
+            # cdxj, fields from json block
+            cdx = LazyCDXObject(line)
+            return all(self.filters[i](cdx) for i in undecided)
+
+        fields = line.split(' ')
+
+        indexes = self._get_indexes(len(fields))
+
+        for i in undecided:
+            cdx_filter = self.filters[i]
+            inx = indexes[i]
+
+            if not cdx_filter.field:
+                val = line
+            elif inx is not None:
+                val = fields[inx]
+            else:
+                val = ''
+
+            if not cdx_filter.match(val):
+                return False
+
+        return True
 
 
 #=================================================================
@@ -233,20 +1482,39 @@ def cdx_clamp(cdx_iter, from_ts, to_ts):
     """
     Clamp by start and end ts
     """
+    in_range = timestamp_range_func(from_ts, to_ts)
+
+    for cdx in cdx_iter:
+        if in_range and not in_range(cdx[TIMESTAMP]):
+            continue
+
+        yield cdx
+
+
+def timestamp_range_func(from_ts, to_ts):
+    """
+    return a function which checks if a timestamp is in the
+    start and end ts range, or ``None`` if no range
+    """
+    if not from_ts and not to_ts:
+        return None
+
     if from_ts and len(from_ts) < 14:
         from_ts = pad_timestamp(from_ts, PAD_14_DOWN)
 
     if to_ts and len(to_ts) < 14:
         to_ts = pad_timestamp(to_ts, PAD_14_UP)
 
-    for cdx in cdx_iter:
-        if from_ts and cdx[TIMESTAMP] < from_ts:
-            continue
+    def in_range(timestamp):
+        if from_ts and timestamp < from_ts:
+            return False
 
-        if to_ts and cdx[TIMESTAMP] > to_ts:
-            continue
+        if to_ts and timestamp > to_ts:
+            return False
 
-        yield cdx
+        return True
+
+    return in_range
 
 
 #=================================================================
@@ -268,30 +1536,168 @@ def cdx_collapse_time_status(cdx_iter, timelen=10):
 
 
 #=================================================================
-def cdx_sort_closest(closest, cdx_iter, limit=10):
+def cdx_collapse(cdx_iter, collapse, group_count=False, uniq_count=False,
+                 last_timestamp=False):
+    """
+    collapse consecutive cdx with the same value of a field,
+    or the same first N chars of a field (``field:N``),
+    keeping the first cdx of each group.
+
+    if requested, the first cdx is given the number of cdx
+    (``groupcount``) and of distinct digests (``uniqcount``) in the group,
+    and the timestamp of the last cdx in the group (``endtimestamp``)
+
+    memory used for ``uniqcount`` is bounded, see :class:`UniqCounter`
+    """
+    field, _, length = collapse.partition(':')
+    field = CDXObject.CDX_ALT_FIELDS.get(field, field)
+
+    try:
+        length = int(length) if length else None
+    except ValueError:
+        raise CDXException('Invalid collapse: ' + collapse)
+
+    get_token = lambda cdx: cdx.get(field, '')[:length]
+
+    if not (group_count or uniq_count or last_timestamp):
+        last_token = None
+
+        for cdx in cdx_iter:
+            curr_token = get_token(cdx)
+            if curr_token != last_token:
+                last_token = curr_token
+                yield cdx
+
+        return
+
+    def set_group_fields(cdx):
+        if group_count:
+            cdx['groupcount'] = str(count)
+        if uniq_count:
+            cdx['uniqcount'] = str(len(digests))
+        if last_timestamp:
+            cdx['endtimestamp'] = end_timestamp
+
+    first = None
+
+    for cdx in cdx_iter:
+        curr_token = get_token(cdx)
+
+        if first is not None and curr_token == last_token:
+            count += 1
+            digests.add(cdx.get(DIGEST))
+            end_timestamp = cdx[TIMESTAMP]
+            continue
+
+        if first is not None:
+            set_group_fields(first)
+            yield first
+
+        first = cdx
+        last_token = curr_token
+        count = 1
+        digests = UniqCounter()
+        digests.add(cdx.get(DIGEST))
+        end_timestamp = cdx[TIMESTAMP]
+
+    if first is not None:
+        set_group_fields(first)
+        yield first
+
+
+#=================================================================
+class UniqCounter(object):
+    """
+    Number of distinct values added. Exact for up to ``max_exact``
+    distinct values, then estimated from the ``max_exact`` smallest
+    hashes of the values (k minimum values), so that memory is bounded
+
+    >>> counter = UniqCounter(max_exact=100)
+    >>> for i in xrange(1000): counter.add(str(i % 10))
+    >>> len(counter)
+    10
+
+    >>> for i in xrange(20000): counter.add(str(i))
+    >>> 18000 < len(counter) < 22000
+    True
+    """
+    DEFAULT_MAX_EXACT = 4096
+
+    # hashes are the first 60 bits of the md5
+    HASH_RANGE = float(1 << 60)
+
+    def __init__(self, max_exact=DEFAULT_MAX_EXACT):
+        self.max_exact = max_exact
+        self.values = set()
+
+        # once estimating, max heap (negated) and set of smallest hashes
+        self.heap = None
+        self.hashes = None
+
+    @staticmethod
+    def _hash(value):
+        return int(md5(str(value)).hexdigest()[:15], 16)
+
+    def add(self, value):
+        if self.heap is None:
+            self.values.add(value)
+            if len(self.values) > self.max_exact:
+                self._start_estimate()
+            return
+
+        h = self._hash(value)
+        if h >= -self.heap[0] or h in self.hashes:
+            return
+
+        self.hashes.discard(-heapq.heapreplace(self.heap, -h))
+        self.hashes.add(h)
+
+    def _start_estimate(self):
+        hashes = sorted(set(map(self._hash, self.values)))
+        self.hashes = set(hashes[:self.max_exact])
+        self.heap = [-h for h in self.hashes]
+        heapq.heapify(self.heap)
+        self.values = None
+
+    def __len__(self):
+        if self.heap is None:
+            return len(self.values)
+
+        # k-th smallest of k uniform hashes
+        return int((self.max_exact - 1) * self.HASH_RANGE / -self.heap[0])
+
+
+#=================================================================
+def cdx_sort_closest(closest, cdx_iter, limit=10, sorted_input=False):
     """
     sort CDXCaptureResult by closest to timestamp.
+
+    if ``sorted_input`` is set, the cdx are assumed to be in timestamp
+    order, and reading stops once ``limit`` cdx are found and
+    the distance has started increasing
     """
     closest_cdx = []
 
     closest_sec = timestamp_to_sec(closest)
 
-    for cdx in cdx_iter:
+    for seq, cdx in enumerate(cdx_iter):
         sec = timestamp_to_sec(cdx[TIMESTAMP])
         key = abs(closest_sec - sec)
 
-        # create tuple to sort by key
-        bisect.insort(closest_cdx, (key, cdx))
+        # cdx in ascending order and keys have started increasing,
+        # no further cdx can be closer
+        if (sorted_input and len(closest_cdx) == limit and
+            key >= closest_cdx[-1][0]):
+            break
 
-        if len(closest_cdx) == limit:
-            # assuming cdx in ascending order and keys have started increasing
-            if key > closest_cdx[-1]:
-                break
+        # create tuple to sort by key, then by input order
+        # (cdx objects themselves are not ordered)
+        bisect.insort(closest_cdx, (key, seq, cdx))
 
         if len(closest_cdx) > limit:
             closest_cdx.pop()
 
-    for cdx in itertools.imap(lambda x: x[1], closest_cdx):
+    for cdx in itertools.imap(lambda x: x[2], closest_cdx):
         yield cdx
 
 
@@ -302,7 +1708,7 @@ def cdx_sort_closest(closest, cdx_iter, limit=10):
 ORIG_TUPLE = [LENGTH, OFFSET, FILENAME]
 
 
-def cdx_resolve_revisits(cdx_iter):
+def cdx_resolve_revisits(cdx_iter, originals=None):
     """
     resolve revisits.
 
@@ -310,35 +1716,246 @@ def cdx_resolve_revisits(cdx_iter):
     and ``orig.filename``. for revisit records, these fields have corresponding
     field values in previous non-revisit (original) CDX record.
     They are all ``"-"`` for non-revisit records.
+
+    originals are kept in ``originals``, a :class:`RevisitOriginals`
     """
-    originals = {}
+    if originals is None:
+        originals = RevisitOriginals()
 
     for cdx in cdx_iter:
-        is_revisit = cdx.is_revisit()
+        originals.add(cdx)
+        originals.resolve(cdx)
+
+        yield cdx
+
+
+def fill_orig_fields(cdx, original_cdx):
+    """
+    fill the ``orig.`` fields of ``cdx`` from the ``original_cdx``
+    of a revisit, or with ``'-'`` if there is no original
+    """
+    if original_cdx:
+        fill_orig = lambda field: original_cdx.get(field, '-')
+        # Transfer mimetype and statuscode
+        if MIMETYPE in cdx:
+            cdx[MIMETYPE] = original_cdx.get(MIMETYPE, '')
+        if STATUSCODE in cdx:
+            cdx[STATUSCODE] = original_cdx.get(STATUSCODE, '')
+    else:
+        fill_orig = lambda field: '-'
+
+    # Always add either the original or empty '- - -'
+    for field in ORIG_TUPLE:
+        cdx['orig.' + field] = fill_orig(field)
+
+
+#=================================================================
+class RevisitStats(object):
+    """
+    Counters for revisit resolution, shared by all queries of a server
+
+    ``originals``: originals stored
+    ``peak_originals``: most originals held at once by a single query
+    ``evictions``: originals evicted, when over ``max_originals``
+    ``lookups``, ``lookup_hits``: digest queries for evicted originals
+    ``unresolved``: revisits with no original found
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = dict(originals=0,
+                           peak_originals=0,
+                           evictions=0,
+                           lookups=0,
+                           lookup_hits=0,
+                           unresolved=0)
+
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counts[name] += value
+
+    def peak(self, name, value):
+        with self.lock:
+            self.counts[name] = max(self.counts[name], value)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+#=================================================================
+class RevisitOriginals(object):
+    """
+    First original capture for each digest, in the order the captures
+    are added, for resolving revisits. Captures read backwards are added
+    with ``replace`` set, so that the first original in forward order
+    is kept.
+
+    At most ``max_originals`` are kept, least recently used first evicted.
+    If a ``lookup`` function is set, a revisit whose original has been
+    evicted is resolved by calling ``lookup(cdx)``.
+    If ``partial`` is set, the captures start after the start of
+    the query, and any revisit without an original is looked up.
+
+    A lookup which finds no original is not repeated for the same url
+    and digest, unless an original with that digest has since been evicted
+
+    >>> originals = RevisitOriginals(max_originals=1)
+    >>> originals.add(LazyCDXObject('a 20140101000000 - text/html 200 AAA - - 10 0 a.warc.gz'))
+    >>> originals.add(LazyCDXObject('b 20140101000000 - text/html 200 BBB - - 10 0 a.warc.gz'))
+
+    >>> originals.get('AAA'), originals.get('BBB')['urlkey']
+    (None, 'b')
+
+    >>> sorted(originals.stats.stats().items())
+    [('evictions', 1), ('lookup_hits', 0), ('lookups', 0), ('originals', 2), ('peak_originals', 1), ('unresolved', 0)]
+
+    # first original kept, even if not the earliest
+    >>> originals.add(LazyCDXObject('c 20130101000000 - text/html 200 BBB - - 10 0 a.warc.gz'))
+    >>> originals.get('BBB')['urlkey']
+    'b'
+    """
+    DEFAULT_MAX_ORIGINALS = 50000
+
+    def __init__(self, max_originals=DEFAULT_MAX_ORIGINALS, lookup=None,
+                 stats=None, partial=False):
+        self.cache = LRUCache(max_originals, sizeof=lambda cdx: 1,
+                              on_evict=self._on_evict)
+        self.lookup = lookup
+        self.stats = stats or RevisitStats()
+        self.partial = partial
+
+        # eviction count when an original was last evicted, by digest
+        self.evicted = LRUCache(max_originals, sizeof=lambda count: 1,
+                                on_evict=self._on_forget)
 
+        # latest eviction no longer tracked by digest
+        self.forgotten = 0
+
+        # eviction count when a lookup for (urlkey, digest) failed
+        self.missed = LRUCache(max_originals, sizeof=lambda count: 1)
+
+    def _on_evict(self, digest, cdx):
+        self.evicted.put(digest, self.cache.evictions)
+
+    def _on_forget(self, digest, evictions):
+        self.forgotten = max(self.forgotten, evictions)
+
+    def add(self, cdx, replace=False):
         digest = cdx.get(DIGEST)
+        if not digest or cdx.is_revisit():
+            return
 
-        original_cdx = None
+        if not replace and digest in self.cache:
+            return
+
+        evictions = self.cache.evictions
+        self.cache.put(digest, cdx)
 
-        # only set if digest is valid, otherwise no way to resolve
-        if digest:
-            original_cdx = originals.get(digest)
+        stats = self.stats
+        stats.incr('originals')
+        stats.peak('peak_originals', len(self.cache))
 
-            if not original_cdx and not is_revisit:
-                originals[digest] = cdx
+        if self.cache.evictions > evictions:
+            stats.incr('evictions', self.cache.evictions - evictions)
 
-        if original_cdx and is_revisit:
-            fill_orig = lambda field: original_cdx.get(field, '-')
-            # Transfer mimetype and statuscode
-            if MIMETYPE in cdx:
-                cdx[MIMETYPE] = original_cdx.get(MIMETYPE, '')
-            if STATUSCODE in cdx:
-                cdx[STATUSCODE] = original_cdx.get(STATUSCODE, '')
+    def get(self, digest):
+        return self.cache.get(digest)
+
+    def find(self, cdx, timestamp=None, lookup=True):
+        """ return the earliest original for revisit ``cdx``, at or before
+        ``timestamp``, if set. If ``lookup`` is set, and the original
+        may have been evicted, it is looked up
+        """
+        digest = cdx.get(DIGEST)
+        if not digest:
+            return None
+
+        original_cdx = self.get(digest)
+        if original_cdx and (not timestamp or
+                             original_cdx[TIMESTAMP] <= timestamp):
+            return original_cdx
+
+        if not original_cdx and lookup and self.lookup:
+            return self._lookup(cdx)
+
+        return None
+
+    def _lookup(self, cdx):
+        # if no longer tracked, may have been evicted up to forgotten
+        evicted = self.evicted.peek(cdx[DIGEST], self.forgotten)
+        if not self.partial and not evicted:
+            return None
+
+        # not found before, and not evicted since
+        miss_key = (cdx[URLKEY], cdx[DIGEST])
+        missed = self.missed.peek(miss_key)
+        if missed is not None and missed >= evicted:
+            return None
+
+        self.stats.incr('lookups')
+        original_cdx = self.lookup(cdx)
+        if original_cdx:
+            self.stats.incr('lookup_hits')
         else:
-            fill_orig = lambda field: '-'
+            self.missed.put(miss_key, self.cache.evictions)
 
-        # Always add either the original or empty '- - -'
-        for field in ORIG_TUPLE:
-            cdx['orig.' + field] = fill_orig(field)
+        return original_cdx
 
-        yield cdx
+    def resolve(self, cdx, find_func=None):
+        """ fill ``orig.`` fields of ``cdx``, finding the original
+        of a revisit with ``find_func``, or :meth:`find` if not set
+        """
+        original_cdx = None
+        if cdx.is_revisit():
+            original_cdx = (find_func or self.find)(cdx)
+            if not original_cdx:
+                self.stats.incr('unresolved')
+
+        fill_orig_fields(cdx, original_cdx)
+
+
+def make_revisit_originals(sources, query, revisit_opts=None):
+    """
+    create :class:`RevisitOriginals` for a query, from ``revisit_opts``:
+
+    ``max_originals``: max originals kept in memory
+    ``lookup``: if set, look up evicted originals with a digest query
+    ``stats``: :class:`RevisitStats` to update
+    ``partial``: query starts after the start of the range (a page)
+    """
+    revisit_opts = revisit_opts or {}
+
+    max_originals = (revisit_opts.get('max_originals') or
+                     RevisitOriginals.DEFAULT_MAX_ORIGINALS)
+
+    lookup = None
+    if revisit_opts.get('lookup'):
+        lookup = lambda cdx: lookup_original(sources, query, cdx)
+
+    return RevisitOriginals(max_originals, lookup,
+                            revisit_opts.get('stats'),
+                            revisit_opts.get('partial', False))
+
+
+def lookup_original(sources, query, cdx):
+    """
+    find the earliest original of revisit ``cdx``, with a query
+    for the same url, up to the revisit timestamp, filtered by digest
+    """
+    urlkey = cdx[URLKEY]
+
+    digest_query = CDXQuery(key=urlkey,
+                            end_key=urlkey + '!',
+                            to=cdx[TIMESTAMP],
+                            filter=['=digest:' + cdx[DIGEST]])
+
+    digest_query.narrow_key_by_timestamp()
+
+    line_filters = get_line_filters(digest_query)
+
+    cdx_iter = create_merged_cdx_gen(sources, digest_query)
+    for original_cdx in make_obj_iter(cdx_iter, digest_query, line_filters):
+        if not original_cdx.is_revisit():
+            return original_cdx
+
+    return None
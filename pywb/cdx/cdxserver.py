@@ -1,14 +1,18 @@
 from pywb.utils.canonicalize import UrlCanonicalizer, calc_search_range
 from pywb.utils.wbexception import NotFoundException
 
-from cdxops import cdx_load
+from cdxops import cdx_load, cdx_output, RevisitStats, RangeWorkers
+from cdxops import DedupStats
 from cdxsource import CDXSource, CDXFile, RemoteCDXSource, RedisCDXSource
 from zipnum import ZipNumCluster
 from cdxobject import CDXObject, CDXException
 from query import CDXQuery
+from querycache import create_query_cache
 from cdxdomainspecific import load_domain_specific_cdx_rules
 
 from pywb.utils.loaders import is_http
+from pywb.utils.sparseindex import is_sparse_index
+from pywb.utils.indexcatalog import IndexCatalog, is_index_catalog
 
 from itertools import chain
 import logging
@@ -35,6 +39,17 @@ class BaseCDXServer(object):
         if not self.url_canon:
             self.url_canon = UrlCanonicalizer(surt_ordered)
 
+        # custom passed in query cache, or from config
+        self.query_cache = kwargs.get('query_cache')
+        if not self.query_cache:
+            self.query_cache = create_query_cache(kwargs.get('config'))
+
+    def close(self):
+        """ Stop any threads held by the server and its sources,
+        eg. before the server is replaced on config reload
+        """
+        pass
+
     def _check_cdx_iter(self, cdx_iter, query):
         """ Check cdx iter semantics
         If `cdx_iter` is empty (no matches), check if fuzzy matching
@@ -75,10 +90,70 @@ class BaseCDXServer(object):
 
         query.set_key(key, end_key)
 
+        if self.query_cache and self.query_cache.is_cacheable(query):
+            cdx_iter = self.peek_iter(self._load_cdx_cached(query))
+            if cdx_iter:
+                return cdx_output(cdx_iter, query)
+
+            return self._check_cdx_iter(iter([]), query)
+
         cdx_iter = self._load_cdx_query(query)
 
         return self._check_cdx_iter(cdx_iter, query)
 
+    def load_cdx_batch(self, params_list):
+        """ Load results for a batch of queries, each a dict of params.
+
+        The queries are sorted by search key and loaded in that order,
+        so that each source may be read in a single forward sweep.
+
+        Yields ``(index, query, cdx_iter)`` for each query, where
+        ``index`` is the position of the query in ``params_list``.
+        Each ``cdx_iter`` must be read before the next one is loaded,
+        and is empty if no captures are found
+        """
+        queries = []
+        for params in params_list:
+            query = CDXQuery(**params)
+            query.set_key(*self._calc_search_keys(query))
+            queries.append(query)
+
+        order = sorted(xrange(len(queries)),
+                       key=lambda inx: (queries[inx].key,
+                                        queries[inx].end_key))
+
+        return self._load_cdx_batch(queries, order)
+
+    def _load_cdx_batch(self, queries, order):
+        for inx in order:
+            query = queries[inx]
+            yield inx, query, self._load_batch_query(query,
+                                                     self._load_cdx_query)
+
+    def _load_batch_query(self, query, load_func):
+        try:
+            return self._check_cdx_iter(load_func(query), query)
+        except NotFoundException:
+            return iter([])
+
+    def _load_cdx_cached(self, query):
+        """ Load cdx objects for query from the query cache, before
+        applying any custom ops and converting to the query output
+        """
+        params = dict(query.params, output='cdxobject')
+        params.pop('custom_ops', None)
+
+        return self.query_cache.load(CDXQuery(**params),
+                                     self._get_cache_version,
+                                     self._load_cdx_query)
+
+    def _get_cache_version(self, query):
+        """ Return version of the sources for query, cached results
+        are only used if the version has not changed.
+        By default, results are only expired by the cache ttl
+        """
+        return None
+
     def _load_cdx_query(self, query):  # pragma: no cover
         raise NotImplementedError('Implement in subclass')
 
@@ -104,9 +179,77 @@ class CDXServer(BaseCDXServer):
         # TODO: we could save config in member, so that other
         # methods can use it. it's bad for add_cdx_source to take
         # config argument.
-        self._create_cdx_sources(paths, kwargs.get('config'))
+        config = kwargs.get('config')
+        self._create_cdx_sources(paths, config)
+        self.dedup_stats = DedupStats()
+        self.merge_opts = self._init_merge_opts(config, self.dedup_stats)
 
-    def _load_cdx_query(self, query):
+        self.revisit_stats = RevisitStats()
+        self.revisit_opts = self._init_revisit_opts(config,
+                                                    self.revisit_stats)
+
+        self.range_workers = self._init_range_workers(config)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+        if self.range_workers:
+            self.range_workers.close()
+
+    @staticmethod
+    def _init_merge_opts(config, dedup_stats=None):
+        """ Options for merging multiple sources, from config:
+
+        ``parallel_sources``: load each source in a separate thread
+        ``source_queue_size``: max lines buffered per source when parallel
+        ``source_timeout``: secs to wait for a source before skipping it
+        ``dedup_sources``: skip the same capture listed in several sources
+        """
+        merge_opts = {}
+        if not config:
+            return merge_opts
+
+        if config.get('parallel_sources'):
+            merge_opts['parallel'] = True
+            merge_opts['queue_size'] = config.get('source_queue_size', 256)
+            merge_opts['source_timeout'] = config.get('source_timeout')
+
+        if config.get('dedup_sources'):
+            merge_opts['dedup'] = True
+            merge_opts['dedup_stats'] = dedup_stats
+
+        return merge_opts
+
+    @staticmethod
+    def _init_revisit_opts(config, stats):
+        """ Options for resolving revisits, from config:
+
+        ``revisit_max_originals``: max originals kept in memory per query
+        ``revisit_lookup``: query for originals evicted from memory
+        """
+        revisit_opts = dict(stats=stats)
+        if not config:
+            return revisit_opts
+
+        revisit_opts['max_originals'] = config.get('revisit_max_originals')
+        revisit_opts['lookup'] = config.get('revisit_lookup', False)
+        return revisit_opts
+
+    @staticmethod
+    def _init_range_workers(config):
+        """ Workers for loading non-exact queries in parallel, from config:
+
+        ``range_workers``: number of threads, disabled if less than 2
+        ``range_blocks``: number of blocks of the sources in each range
+        """
+        if not config or config.get('range_workers', 0) < 2:
+            return None
+
+        return RangeWorkers(config.get('range_workers'),
+                            config.get('range_blocks', 1))
+
+    def _load_cdx_query(self, query, sources=None):
         """
         load CDX for query parameters ``params``.
         ``key`` (or ``url``) parameter specifies URL to query,
@@ -118,16 +261,49 @@ class CDXServer(BaseCDXServer):
 
         :param query: query parameters
         :type query: :class:`~pywb.cdx.query.CDXQuery`
+        :param sources: sources to load from, if not all sources
         :rtype: iterator on :class:`~pywb.cdx.cdxobject.CDXObject`
         """
-        return cdx_load(self.sources, query)
+        # only read captures in from/to range
+        query.narrow_key_by_timestamp()
+
+        if sources is None:
+            sources = self.sources
+
+        sources = [source for source in sources
+                   if source.may_contain(query)]
+
+        return cdx_load(sources, query, merge_opts=self.merge_opts,
+                        revisit_opts=self.revisit_opts,
+                        range_workers=self.range_workers)
+
+    def _load_cdx_batch(self, queries, order):
+        # each source swept once for all queries
+        sweeps = [source.open_sweep() for source in self.sources]
+
+        def load_func(query):
+            return self._load_cdx_query(query, sweeps)
+
+        try:
+            for inx in order:
+                query = queries[inx]
+                yield inx, query, self._load_batch_query(query, load_func)
+        finally:
+            for sweep in sweeps:
+                sweep.close()
+
+    def _get_cache_version(self, query):
+        return tuple(source.cache_version() for source in self.sources
+                     if source.may_contain(query))
 
     def _create_cdx_sources(self, paths, config):
         """
         build CDXSource instances for each of path in ``paths``.
 
         :param paths: list of sources or single source.
-        each source may be either string or CDXSource instance. value
+        each source may be either string, CDXSource instance, or a dict
+        with the source ``path`` and config options for that source only,
+        eg. ``{path: index.cdxj, cdx_use_mmap: true}``. value
         of any other types will be silently ignored.
         :param config: config object passed to :method:`add_cdx_source`.
         """
@@ -151,27 +327,71 @@ class CDXServer(BaseCDXServer):
         self.sources.append(source)
 
     def add_cdx_source(self, source, config):
+        if isinstance(source, dict):
+            # per-source options, server config as the default
+            source_config = dict(config) if config else {}
+            source_config.update(source)
+            source = source_config.pop('path', None)
+            config = source_config
+
         if isinstance(source, CDXSource):
             self._add_cdx_source(source)
 
         elif isinstance(source, str):
             if os.path.isdir(source):
+                catalog = self._load_catalog(source, config)
+
                 for fn in os.listdir(source):
-                    self._add_cdx_source(self._create_cdx_source(
-                        os.path.join(source, fn), config))
+                    cdx_source = self._create_cdx_source(
+                        os.path.join(source, fn), config)
+
+                    if catalog and isinstance(cdx_source, CDXFile):
+                        cdx_source.catalog = catalog
+
+                    self._add_cdx_source(cdx_source)
             else:
                 self._add_cdx_source(self._create_cdx_source(
                     source, config))
 
+    def _load_catalog(self, dirname, config):
+        """ Load key-range catalog for index dir, if one exists,
+        unless disabled with ``use_index_catalog: false``
+        """
+        if config and not config.get('use_index_catalog', True):
+            return None
+
+        check_interval = IndexCatalog.DEFAULT_CHECK_INTERVAL
+        if config:
+            check_interval = config.get('version_check_interval',
+                                        check_interval)
+
+        catalog = IndexCatalog(dirname, check_interval)
+        if not catalog.exists():
+            return None
+
+        try:
+            return catalog.load()
+        except Exception as e:
+            logging.warn('Ignoring invalid index catalog %s: %s',
+                         catalog.filename, e)
+            return None
+
     def _create_cdx_source(self, filename, config):
         if is_http(filename):
-            return RemoteCDXSource(filename)
+            return RemoteCDXSource(filename, config=config)
 
         if filename.startswith('redis://'):
             return RedisCDXSource(filename, config)
 
         if filename.endswith(('.cdx', '.cdxj')):
-            return CDXFile(filename)
+            return CDXFile(filename, config)
+
+        # sparse index sidecar for a .cdx/.cdxj, not a source itself
+        if is_sparse_index(filename):
+            return None
+
+        if is_index_catalog(filename):
+            return None
 
         if filename.endswith(('.summary', '.idx')):
             return ZipNumCluster(filename, config)
@@ -197,13 +417,17 @@ class RemoteCDXServer(BaseCDXServer):
         if isinstance(source, RemoteCDXSource):
             self.source = source
         elif (isinstance(source, str) and is_http(source)):
-            self.source = RemoteCDXSource(source, remote_processing=True)
+            self.source = RemoteCDXSource(source, remote_processing=True,
+                                          config=kwargs.get('config'))
         else:
             raise Exception('Invalid remote cdx source: ' + str(source))
 
     def _load_cdx_query(self, query):
         return cdx_load([self.source], query, process=False)
 
+    def close(self):
+        self.source.close()
+
 
 #=================================================================
 def create_cdx_server(config, ds_rules_file=None, server_cls=None):
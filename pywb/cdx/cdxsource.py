@@ -1,46 +1,369 @@
-from pywb.utils.binsearch import iter_range
+from pywb.utils.binsearch import iter_range, iter_range_reverse
+from pywb.utils.binsearch import find_line_offset
+from pywb.utils.mmapcache import shared_mmap_cache
+from pywb.utils.filepool import shared_file_pool
+from pywb.utils.sparseindex import SparseIndexLoader, SampledBlockKeys
 
 from pywb.utils.wbexception import AccessException, NotFoundException
 from pywb.utils.wbexception import BadRequestException, WbException
 
 from query import CDXQuery
 
+import requests
 import urllib
-import urllib2
-import itertools
+import os
+import threading
+import time
 
 
 #=================================================================
 class CDXSource(object):
     """
     Represents any cdx index source
+
+    A ``seekable`` source returns only lines in the range of
+    ``query.key`` and ``query.end_key``, and can efficiently start
+    from any key, in either direction
     """
+    seekable = False
+
+    # if set, source handles page queries itself, when the only source
+    paged = False
+
     def load_cdx(self, query):  # pragma: no cover
         raise NotImplementedError('Implement in subclass')
 
+    def load_cdx_reverse(self, query):
+        """ Load cdx lines in the query range, in reverse order.
+        By default, all lines are loaded and then reversed
+        """
+        return reversed(list(self.load_cdx(query)))
+
+    def may_contain(self, query):
+        """ Return False if this source is known to not contain
+        any results for query, and can be skipped
+        """
+        return True
+
+    def cache_version(self):
+        """ Return a value which changes whenever the contents of
+        this source change, for invalidating cached query results,
+        or None if not known
+        """
+        return None
+
+    def close(self):
+        """ Stop any threads held by this source, once no queries are
+        in progress. They are started again if the source is used again
+        """
+        pass
+
+    def get_block_keys(self, query):
+        """ Return sorted keys which split the lines in the query range
+        into blocks of about the same size, for paging, or None if
+        not supported
+        """
+        return None
+
+    def get_unpaged_end_key(self, query):
+        """ Return the end of the key range read by a query without
+        a page, which may be less than ``query.end_key`` for a
+        ``paged`` source
+        """
+        return query.end_key
+
+    def open_sweep(self):
+        """ Return a :class:`CDXSourceSweep` for loading a batch of
+        queries, in key order, from this source
+        """
+        return CDXSourceSweep(self)
+
+
+#=================================================================
+class CDXSourceSweep(object):
+    """
+    Loads a batch of queries, sorted by key, from a single source.
+
+    The results of each query must be read before loading the next one.
+    By default, each query is loaded separately from the source
+    """
+    def __init__(self, source):
+        self.source = source
+
+    def load_cdx(self, query):
+        return self.source.load_cdx(query)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
 
 #=================================================================
 class CDXFile(CDXSource):
     """
     Represents a local plain-text .cdx file
+
+    If ``use_mmap`` is set, the file is searched through a
+    shared read-only memory mapping instead of being opened
+    for each query. The mapping is reloaded if the file changes.
+
+    Otherwise, if a sparse index sidecar (eg. ``index.cdxj.idx``)
+    exists and is up-to-date, it is used to find the starting offset
+    instead of a binary search over the file.
+
+    If an :class:`~pywb.utils.indexcatalog.IndexCatalog` is set,
+    the file is skipped for any query outside of its key range.
     """
-    def __init__(self, filename):
+    use_mmap = False
+    catalog = None
+    seekable = True
+
+    # loaded on first use, if created from yaml config
+    sparse_index = None
+
+    # size of each page block, if no sparse index
+    DEFAULT_PAGE_BLOCK_SIZE = 128 * 1024
+    page_block_size = DEFAULT_PAGE_BLOCK_SIZE
+
+    # max bytes read forward to the next key of a batch, before seeking
+    DEFAULT_SWEEP_SCAN_SIZE = 32 * 1024
+    sweep_scan_size = DEFAULT_SWEEP_SCAN_SIZE
+
+    # secs before the file is checked again for a changed cache version
+    DEFAULT_VERSION_CHECK_INTERVAL = 2
+    version_check_interval = DEFAULT_VERSION_CHECK_INTERVAL
+
+    last_version = None
+    last_version_check = 0
+
+    def __init__(self, filename, config=None, catalog=None):
         self.filename = filename
+        self.sparse_index = SparseIndexLoader(filename)
+        self.catalog = catalog
+
+        if config:
+            self.use_mmap = config.get('cdx_use_mmap', self.use_mmap)
+            self.page_block_size = config.get('page_block_size',
+                                              self.page_block_size)
+            self.sweep_scan_size = config.get('sweep_scan_size',
+                                              self.sweep_scan_size)
+            self.version_check_interval = config.get(
+                                              'version_check_interval',
+                                              self.version_check_interval)
+
+    def may_contain(self, query):
+        if not self.catalog:
+            return True
+
+        return self.catalog.may_contain(self.filename,
+                                        query.key, query.end_key)
+
+    def cache_version(self):
+        # not checked on every query, including cached results
+        now = time.time()
+        if now - self.last_version_check < self.version_check_interval:
+            return self.last_version
+
+        try:
+            stat = os.stat(self.filename)
+            version = (stat.st_mtime, stat.st_size)
+        except OSError:
+            version = None
+
+        self.last_version = version
+        self.last_version_check = now
+        return version
 
     def load_cdx(self, query):
-        return self._do_load_file(self.filename, query)
+        if self.use_mmap:
+            return self._do_load_mmap(self.filename, query)
+
+        start_offset = None
+
+        sparse_index = self._get_sparse_index()
+        if sparse_index:
+            start_offset = sparse_index.find_offset(query.key)
+
+        return self._do_load_file(self.filename, query, start_offset)
+
+    def load_cdx_reverse(self, query):
+        if self.use_mmap:
+            mm = shared_mmap_cache.get(self.filename)
+            if not mm:
+                return iter([])
+
+            return iter_range_reverse(mm, query.key, query.end_key)
+
+        end_offset = None
+
+        sparse_index = self._get_sparse_index()
+        if sparse_index:
+            end_offset = sparse_index.find_offset(query.end_key)
+
+        return self._do_load_file_reverse(self.filename, query, end_offset)
+
+    def get_block_keys(self, query):
+        """ Split query range by the sparse index keys, if any,
+        or else into blocks of ``page_block_size`` bytes
+        """
+        sparse_index = self._get_sparse_index()
+        if sparse_index:
+            return sparse_index.block_keys(query.key, query.end_key)
+
+        with shared_file_pool.open(self.filename) as fh:
+            start_offset = find_line_offset(fh, query.key)
+            end_offset = find_line_offset(fh, query.end_key)
+
+        return SampledBlockKeys(self.filename, start_offset, end_offset,
+                                query.end_key, self.page_block_size)
+
+    def open_sweep(self):
+        # mmap search does not re-read the file for each query
+        if self.use_mmap:
+            return CDXSourceSweep(self)
+
+        return CDXFileSweep(self)
+
+    def _get_sparse_index(self):
+        if not self.sparse_index:
+            self.sparse_index = SparseIndexLoader(self.filename)
+
+        return self.sparse_index.get()
 
     @staticmethod
-    def _do_load_file(filename, query):
-        with open(filename, 'rb') as source:
-            gen = iter_range(source, query.key, query.end_key)
+    def _do_load_file(filename, query, start_offset=None):
+        with shared_file_pool.open(filename) as source:
+            gen = iter_range(source, query.key, query.end_key,
+                             start_offset=start_offset)
             for line in gen:
                 yield line
 
+    @staticmethod
+    def _do_load_file_reverse(filename, query, end_offset=None):
+        with shared_file_pool.open(filename) as source:
+            gen = iter_range_reverse(source, query.key, query.end_key,
+                                     end_offset=end_offset)
+            for line in gen:
+                yield line
+
+    @staticmethod
+    def _do_load_mmap(filename, query):
+        mm = shared_mmap_cache.get(filename)
+        if not mm:
+            return iter([])
+
+        return iter_range(mm, query.key, query.end_key)
+
     def __str__(self):
         return 'CDX File - ' + self.filename
 
 
+#=================================================================
+class CDXFileSweep(CDXSourceSweep):
+    """
+    Loads a batch of queries, sorted by key, in a single forward pass
+    over one open cdx file.
+
+    The next key is found by reading forward from the end of the
+    previous query, unless it is more than ``sweep_scan_size`` bytes
+    ahead (or before the current position), when a search is
+    performed instead
+    """
+    def __init__(self, source):
+        super(CDXFileSweep, self).__init__(source)
+        self.fh = None
+
+        # offset of next unread line, all lines before it <= last_line
+        self.offset = 0
+        self.last_line = None
+
+        # only the latest query may read from the file
+        self.curr_id = 0
+
+        self.seeks = 0
+        self.scans = 0
+
+    def load_cdx(self, query):
+        if not self.fh:
+            self.fh = shared_file_pool.open(self.source.filename)
+
+        self.curr_id += 1
+        return self._iter_range(query.key, query.end_key, self.curr_id)
+
+    def _find_start(self, key):
+        if self.last_line is not None and key > self.last_line:
+            self.fh.seek(self.offset)
+            offset = self.offset
+
+            while offset - self.offset < self.source.sweep_scan_size:
+                line = self.fh.readline()
+                if not line or line.rstrip() >= key:
+                    self.scans += 1
+                    return offset
+
+                offset += len(line)
+
+        self.seeks += 1
+
+        start_offset = None
+        sparse_index = self.source._get_sparse_index()
+        if sparse_index:
+            start_offset = sparse_index.find_offset(key)
+
+        return find_line_offset(self.fh, key, start_offset=start_offset)
+
+    def _iter_range(self, key, end_key, curr_id):
+        if curr_id != self.curr_id:
+            return
+
+        self.offset = self._find_start(key)
+
+        # all lines before the start are < key
+        self.last_line = key
+
+        self.fh.seek(self.offset)
+
+        while curr_id == self.curr_id:
+            line = self.fh.readline()
+            if not line:
+                break
+
+            line = line.rstrip()
+            if line >= end_key:
+                break
+
+            self.offset = self.fh.tell()
+            self.last_line = line
+            yield line
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+
+#=================================================================
+def iter_chunk_lines(chunks):
+    """ Split a stream of chunks into lines, each ending in a newline
+    except possibly the last
+
+    >>> list(iter_chunk_lines(['a b\\nc', ' d\\n\\ne', 'f']))
+    ['a b\\n', 'c d\\n', '\\n', 'ef']
+    """
+    partial = ''
+    for chunk in chunks:
+        lines = (partial + chunk).split('\n')
+        partial = lines.pop()
+
+        for line in lines:
+            yield line + '\n'
+
+    if partial:
+        yield partial
+
+
 #=================================================================
 class RemoteCDXSource(CDXSource):
     """
@@ -48,12 +371,66 @@ class RemoteCDXSource(CDXSource):
 
     Only ``url`` and ``match_type`` params are proxied at this time,
     the stream is passed through all other filters locally.
+
+    Requests are sent through a pool of keep-alive connections,
+    configured with ``remote_pool_size``, ``remote_timeout`` (secs)
+    and ``remote_retries`` (for failed connections).
+    The response is read in ``READ_CHUNK_SIZE`` chunks and split into lines
     """
-    def __init__(self, filename, cookie=None, remote_processing=False):
+    DEFAULT_POOL_SIZE = 10
+    DEFAULT_TIMEOUT = 30
+    DEFAULT_RETRIES = 2
+
+    READ_CHUNK_SIZE = 65536
+
+    # defaults, if created from yaml config
+    pool_size = DEFAULT_POOL_SIZE
+    timeout = DEFAULT_TIMEOUT
+    retries = DEFAULT_RETRIES
+
+    # created on first use
+    session = None
+    session_lock = threading.Lock()
+
+    def __init__(self, filename, cookie=None, remote_processing=False,
+                 config=None):
         self.remote_url = filename
         self.cookie = cookie
         self.remote_processing = remote_processing
 
+        if config:
+            self.pool_size = config.get('remote_pool_size', self.pool_size)
+            self.timeout = config.get('remote_timeout', self.timeout)
+            self.retries = config.get('remote_retries', self.retries)
+
+    def _get_session(self):
+        session = self.session
+        if session:
+            return session
+
+        with self.session_lock:
+            session = self.session
+            if not session:
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size,
+                    max_retries=self.retries)
+
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.session = session
+
+        return session
+
+    def close(self):
+        with self.session_lock:
+            session = self.session
+            self.session = None
+
+        if session:
+            session.close()
+
     def load_cdx(self, query):
         if self.remote_processing:
             remote_query = query
@@ -64,27 +441,44 @@ class RemoteCDXSource(CDXSource):
 
         urlparams = remote_query.urlencode()
 
-        try:
-            request = urllib2.Request(self.remote_url + '?' + urlparams)
-
-            if self.cookie:
-                request.add_header('Cookie', self.cookie)
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
 
-            response = urllib2.urlopen(request)
-
-        except urllib2.HTTPError as e:
-            if e.code == 403:
+        try:
+            response = self._get_session().get(self.remote_url + '?' +
+                                               urlparams,
+                                               headers=headers,
+                                               timeout=self.timeout,
+                                               stream=True)
+        except requests.RequestException as e:
+            raise WbException('Error connecting to remote cdx server: ' +
+                              str(e))
+
+        if response.status_code != 200:
+            response.close()
+
+            if response.status_code == 403:
                 raise AccessException('Access Denied')
-            elif e.code == 404:
+            elif response.status_code == 404:
                 # return empty list for consistency with other cdx sources
                 # will be converted to 404 if no other retry
                 return []
-            elif e.code == 400:
+            elif response.status_code == 400:
                 raise BadRequestException()
             else:
                 raise WbException('Invalid response from remote cdx server')
 
-        return iter(response)
+        return self._iter_response_lines(response)
+
+    def _iter_response_lines(self, response):
+        try:
+            chunks = response.iter_content(self.READ_CHUNK_SIZE)
+            for line in iter_chunk_lines(chunks):
+                yield line
+        finally:
+            # if fully read, connection is already returned to pool
+            response.close()
 
     def __str__(self):
         if self.remote_processing:
@@ -95,7 +489,17 @@ class RemoteCDXSource(CDXSource):
 
 #=================================================================
 class RedisCDXSource(CDXSource):
+    """
+    Represents cdx lines stored in redis, either in a single sorted
+    set (``cdx_key``) or in a sorted set per urlkey.
+
+    Lines are loaded in pages of ``redis_page_size``, so that a large
+    range does not block redis or is held in memory all at once.
+    The connection pool is configured with ``redis_max_connections``
+    and ``redis_socket_timeout`` (secs)
+    """
     DEFAULT_KEY_PREFIX = 'c:'
+    DEFAULT_PAGE_SIZE = 1000
 
     def __init__(self, redis_url, config=None):
         import redis
@@ -107,11 +511,39 @@ class RedisCDXSource(CDXSource):
         else:
             self.cdx_key = None
 
+        self.page_size = self.DEFAULT_PAGE_SIZE
+
+        pool_opts = {}
+        if config:
+            self.page_size = config.get('redis_page_size', self.page_size)
+
+            if config.get('redis_max_connections'):
+                pool_opts['max_connections'] = config.get(
+                    'redis_max_connections')
+
+            if config.get('redis_socket_timeout'):
+                pool_opts['socket_timeout'] = config.get(
+                    'redis_socket_timeout')
+
         self.redis_url = redis_url
-        self.redis = redis.StrictRedis.from_url(redis_url)
+        self.redis = redis.StrictRedis.from_url(redis_url, **pool_opts)
+
+        # sorted range lookups only if cdx key is set
+        self.seekable = self.cdx_key is not None
 
         self.key_prefix = self.DEFAULT_KEY_PREFIX
 
+        # key updated by writers whenever the index changes
+        self.version_key = None
+        if config:
+            self.version_key = config.get('redis_version_key')
+
+    def cache_version(self):
+        if not self.version_key:
+            return None
+
+        return self.redis.get(self.version_key)
+
     def load_cdx(self, query):
         """
         Load cdx from redis cache, from an ordered list
@@ -128,22 +560,81 @@ class RedisCDXSource(CDXSource):
         else:
             return self.load_single_key(query.key)
 
+    def load_cdx_reverse(self, query):
+        if self.cdx_key:
+            return self.load_sorted_range_reverse(query, self.cdx_key)
+        else:
+            return super(RedisCDXSource, self).load_cdx_reverse(query)
+
+    def load_sorted_range_reverse(self, query, cdx_key):
+        max_ = '(' + query.end_key
+
+        while True:
+            cdx_list = self.redis.zrevrangebylex(cdx_key,
+                                                 max_,
+                                                 '[' + query.key,
+                                                 start=0,
+                                                 num=self.page_size)
+            for cdx in cdx_list:
+                yield cdx
+
+            if len(cdx_list) < self.page_size:
+                break
+
+            # continue before last line
+            max_ = '(' + cdx_list[-1]
+
     def load_sorted_range(self, query, cdx_key):
-        cdx_list = self.redis.zrangebylex(cdx_key,
-                                          '[' + query.key,
-                                          '(' + query.end_key)
+        min_ = '[' + query.key
+
+        while True:
+            cdx_list = self.redis.zrangebylex(cdx_key,
+                                              min_,
+                                              '(' + query.end_key,
+                                              start=0,
+                                              num=self.page_size)
+            for cdx in cdx_list:
+                yield cdx
 
-        return iter(cdx_list)
+            if len(cdx_list) < self.page_size:
+                break
+
+            # continue after last line
+            min_ = '(' + cdx_list[-1]
 
     def load_single_key(self, key):
         # ensure only url/surt is part of key
         key = key.split(' ')[0]
-        cdx_list = self.redis.zrange(self.key_prefix + key, 0, -1)
+        redis_key = self.key_prefix + key
 
         # key is not part of list, so prepend to each line
         key += ' '
-        cdx_list = itertools.imap(lambda x: key + x, cdx_list)
-        return cdx_list
+
+        # lines scored by timestamp, so paged by score rather than by
+        # offset, to not skip or repeat lines added or removed meanwhile
+        min_ = '-inf'
+        while True:
+            cdx_list = self.redis.zrangebyscore(redis_key,
+                                                min_,
+                                                '+inf',
+                                                start=0,
+                                                num=self.page_size,
+                                                withscores=True)
+            for cdx, score in cdx_list:
+                yield key + cdx
+
+            if len(cdx_list) < self.page_size:
+                break
+
+            last, score = cdx_list[-1]
+
+            # rest of the lines with the same timestamp, after last line
+            for cdx in self.redis.zrangebyscore(redis_key, score, score):
+                if cdx > last:
+                    yield key + cdx
+
+            # continue after last timestamp
+            min_ = '(' + repr(score)
 
     def __str__(self):
         return 'Redis - ' + self.redis_url
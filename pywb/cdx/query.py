@@ -1,5 +1,6 @@
 from urllib import urlencode
 from cdxobject import CDXException
+from pywb.utils.timeutils import pad_timestamp, PAD_14_DOWN, PAD_14_UP
 
 
 #=================================================================
@@ -23,10 +24,66 @@ class CDXQuery(object):
     def end_key(self):
         return self.params['end_key']
 
+    @property
+    def url_key(self):
+        """ search key of the url, before any narrowing
+        of the key range by timestamp
+        """
+        return self.params.get('url_key', self.key)
+
     def set_key(self, key, end_key):
         self.params['key'] = key
         self.params['end_key'] = end_key
 
+    def narrow_key_by_timestamp(self):
+        """ For exact match, the timestamp is the second sort field,
+        so the key range can be narrowed to the from/to timestamps
+
+        >>> q = CDXQuery(url='example.com', to='2014', key='com,example)/',
+        ...              end_key='com,example)/!')
+        >>> q.narrow_key_by_timestamp()
+        >>> q.key, q.end_key, q.url_key
+        ('com,example)/', 'com,example)/ 20141231235959!', 'com,example)/')
+
+        >>> q = CDXQuery(url='example.com', key='com,example)/',
+        ...              end_key='com,example)/!', **{'from': '201401'})
+        >>> q.narrow_key_by_timestamp()
+        >>> q.key, q.end_key
+        ('com,example)/ 20140101000000', 'com,example)/!')
+
+        # not narrowed for prefix query
+        >>> q = CDXQuery(url='example.com/*', key='com,example)/',
+        ...              end_key='com,example)0', **{'from': '201401'})
+        >>> q.narrow_key_by_timestamp()
+        >>> q.key, q.end_key
+        ('com,example)/', 'com,example)0')
+        """
+        if not self.is_exact:
+            return
+
+        from_ts = self.from_ts
+        to_ts = self.to_ts
+
+        if not from_ts and not to_ts:
+            return
+
+        url_key = self.url_key
+        self.params['url_key'] = url_key
+
+        key = self.key
+        end_key = self.end_key
+
+        if from_ts:
+            from_ts = pad_timestamp(from_ts, PAD_14_DOWN)
+            key = max(key, url_key + ' ' + from_ts)
+
+        if to_ts:
+            to_ts = pad_timestamp(to_ts, PAD_14_UP)
+            # include captures at to_ts
+            end_key = min(end_key, url_key + ' ' + to_ts + '!')
+
+        self.set_key(key, end_key)
+
     @property
     def url(self):
         try:
@@ -59,6 +116,22 @@ class CDXQuery(object):
     def collapse_time(self):
         return self.params.get('collapseTime')
 
+    @property
+    def collapse(self):
+        return self.params.get('collapse')
+
+    @property
+    def show_group_count(self):
+        return self._get_bool('showGroupCount')
+
+    @property
+    def show_uniq_count(self):
+        return self._get_bool('showUniqCount')
+
+    @property
+    def last_skip_timestamp(self):
+        return self._get_bool('lastSkipTimestamp')
+
     @property
     def resolve_revisits(self):
         return self._get_bool('resolveRevisits')
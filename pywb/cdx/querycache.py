@@ -0,0 +1,355 @@
+"""
+Cache of cdx query results, keyed by the normalized query params
+
+Results are stored after all processing (sorting, filtering,
+revisit resolution), but before any ``custom_ops`` and the conversion
+to the query output, so that queries which differ only in output or
+``fl`` share the same entry.
+
+Results which were not read to the end (eg. only the closest capture
+was needed), or have more than ``max_lines`` lines, are stored up to
+the last line read, as a partial entry. The rest of the results are
+only loaded again if read past the end of the entry.
+
+Each entry also stores a version of the sources the query was
+loaded from. An entry is stale, and not used, if the version no longer
+matches, eg. a cdx file has changed or a zipnum summary has been reloaded.
+"""
+
+from cdxobject import LazyCDXObject
+from query import CDXQuery
+
+from pywb.utils.lrucache import LRUCache
+from pywb.utils.timeutils import pad_timestamp, PAD_14_DOWN, PAD_14_UP
+
+from hashlib import md5
+from urllib import urlencode
+
+import itertools
+import marshal
+import threading
+import time
+import zlib
+
+
+#=================================================================
+# params which only affect the output of cached results
+OUTPUT_PARAMS = ('custom_ops', 'output', 'fl', 'fields', 'url')
+
+# timestamp params, normalized to 14 digits
+TIMESTAMP_PARAMS = {'from': PAD_14_DOWN,
+                    'to': PAD_14_UP,
+                    'closest': PAD_14_DOWN}
+
+
+#=================================================================
+def make_cache_key(query):
+    """ Return cache key for the normalized params of ``query``
+
+    >>> q1 = CDXQuery(url='http://example.com/', key='com,example)/',
+    ...               end_key='com,example)/!', closest='2014',
+    ...               filter=['!mime:warc/revisit', 'status:200'])
+
+    >>> q2 = CDXQuery(url='example.com', key='com,example)/',
+    ...               end_key='com,example)/!', output='json',
+    ...               closest='20140101000000',
+    ...               filter=['status:200', '!mime:warc/revisit'])
+
+    >>> make_cache_key(q1) == make_cache_key(q2)
+    True
+
+    >>> make_cache_key(q1) == make_cache_key(CDXQuery(limit=1, **q1.params))
+    False
+    """
+    params = dict(query.params)
+
+    if 'from_ts' in params:
+        params.setdefault('from', params.pop('from_ts'))
+
+    for name in OUTPUT_PARAMS:
+        params.pop(name, None)
+
+    for name, pad in TIMESTAMP_PARAMS.iteritems():
+        if params.get(name):
+            params[name] = pad_timestamp(params[name], pad)
+
+    if params.get('filter'):
+        params['filter'] = sorted(params['filter'])
+
+    return md5(urlencode(sorted(params.items()), True)).hexdigest()
+
+
+#=================================================================
+def encode_results(cdx_list):
+    """ Compact serialization of a list of cdx objects
+
+    Unchanged objects are stored as the original cdx line, others
+    as a list of values, with each distinct list of field names
+    stored only once.
+
+    >>> cdx = LazyCDXObject('com,example)/ 20140101000000 {"url": "http://example.com/"}')
+    >>> cdx2 = LazyCDXObject('com,example)/ 20140102000000 http://example.com/ text/html 200 AAA - - 100 0 a.warc.gz')
+    >>> cdx2['orig.filename'] = '-'
+
+    >>> results, complete = decode_results(encode_results([cdx, cdx2]))
+    >>> map(str, results) == map(str, [cdx, cdx2]), complete
+    (True, True)
+
+    >>> results[1]['orig.filename'], results[1].keys() == cdx2.keys()
+    ('-', True)
+    """
+    encoder = ResultsEncoder()
+    for cdx in cdx_list:
+        encoder.add(cdx)
+
+    return encoder.encode()
+
+
+def decode_results(data):
+    """ Return list of cdx objects, and whether the list is complete
+    """
+    names_table, rows, complete = marshal.loads(zlib.decompress(data))
+
+    # field names shared by all objects of same format
+    names_table = [list(names) for names in names_table]
+
+    results = []
+    for row in rows:
+        if isinstance(row, str):
+            results.append(LazyCDXObject(row))
+        else:
+            inx, from_json, values = row
+            results.append(LazyCDXObject.from_fields(names_table[inx],
+                                                     values, from_json))
+
+    return results, complete
+
+
+#=================================================================
+class ResultsEncoder(object):
+    """ Builds the serialized results one cdx object at a time
+    """
+    def __init__(self):
+        self.names_table = []
+        self.names_index = {}
+        self.rows = []
+
+    def add(self, cdx):
+        if cdx.cdxline:
+            self.rows.append(cdx.cdxline)
+            return
+
+        names = tuple(cdx.keys())
+        inx = self.names_index.get(names)
+        if inx is None:
+            inx = self.names_index[names] = len(self.names_table)
+            self.names_table.append(names)
+
+        from_json = getattr(cdx, '_from_json', False)
+        self.rows.append((inx, from_json, tuple(cdx.values())))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def encode(self, complete=True):
+        return zlib.compress(marshal.dumps((self.names_table, self.rows,
+                                            complete)))
+
+
+#=================================================================
+class InMemoryCacheBackend(object):
+    """ In-process cache backend, bounded by total size of
+    all entries, least recently used first evicted
+    """
+    def __init__(self, max_size):
+        self.cache = LRUCache(max_size, sizeof=lambda entry: len(entry[2]))
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if not entry:
+            return None
+
+        expires, version, data = entry
+        if expires and expires < time.time():
+            self.cache.pop(key)
+            return None
+
+        return version, data
+
+    def put(self, key, version, data, ttl):
+        expires = time.time() + ttl if ttl else 0
+        self.cache.put(key, (expires, version, data))
+
+    def delete(self, key):
+        self.cache.pop(key)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+#=================================================================
+class RedisCacheBackend(object):
+    """ Cache backend shared by all processes using the same redis,
+    with expiry of entries handled by redis
+    """
+    DEFAULT_KEY_PREFIX = 'cdxq:'
+
+    def __init__(self, redis_url, key_prefix=DEFAULT_KEY_PREFIX):
+        import redis
+
+        self.redis = redis.StrictRedis.from_url(redis_url)
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        entry = self.redis.get(self.key_prefix + key)
+        if not entry:
+            return None
+
+        return marshal.loads(entry)
+
+    def put(self, key, version, data, ttl):
+        entry = marshal.dumps((version, data))
+        if ttl:
+            self.redis.setex(self.key_prefix + key, ttl, entry)
+        else:
+            self.redis.set(self.key_prefix + key, entry)
+
+    def delete(self, key):
+        self.redis.delete(self.key_prefix + key)
+
+    def stats(self):
+        return {}
+
+
+#=================================================================
+class CDXQueryCache(object):
+    """
+    Cache of cdx query results, with ``backend`` storing the
+    serialized results, up to ``max_lines`` lines
+    """
+    DEFAULT_TTL = 60
+    DEFAULT_MAX_LINES = 1000
+
+    def __init__(self, backend, ttl=DEFAULT_TTL, max_lines=DEFAULT_MAX_LINES):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_lines = max_lines
+
+        self.lock = threading.Lock()
+        self.counts = dict(hits=0, misses=0, stale=0, stores=0, too_large=0,
+                           partial_stores=0, partial_misses=0)
+
+    def _incr(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def is_cacheable(self, query):
+        return not query.page_count and not query.secondary_index_only
+
+    def load(self, query, version_func, load_func):
+        """ Return cdx objects for ``query``, from the cache if there is
+        a current entry, or from ``load_func(query)``, stored in the
+        cache up to the last line read
+        """
+        key = make_cache_key(query)
+        version = str(version_func(query))
+
+        entry = self.backend.get(key)
+        if entry:
+            cached_version, data = entry
+            if cached_version == version:
+                self._incr('hits')
+                results, complete = decode_results(data)
+                if complete:
+                    return iter(results)
+
+                return self._resume_iter(results, key, version,
+                                         query, load_func)
+
+            self._incr('stale')
+            self.backend.delete(key)
+
+        self._incr('misses')
+        return self._store_iter(key, version, load_func(query))
+
+    def _resume_iter(self, results, key, version, query, load_func):
+        """ Yield the results of a partial entry, then load the results
+        again if read further, skipping those already yielded
+        """
+        for cdx in results:
+            yield cdx
+
+        self._incr('partial_misses')
+        cdx_iter = self._store_iter(key, version, load_func(query))
+        for cdx in itertools.islice(cdx_iter, len(results), None):
+            yield cdx
+
+    def _store_iter(self, key, version, cdx_iter):
+        encoder = ResultsEncoder()
+        stored = False
+
+        try:
+            for cdx in cdx_iter:
+                if not stored:
+                    # encoded before yielding, may be changed by custom ops
+                    if len(encoder) < self.max_lines:
+                        encoder.add(cdx)
+                    else:
+                        self._incr('too_large')
+                        self._store(key, version, encoder, False)
+                        stored = True
+
+                yield cdx
+
+        except GeneratorExit:
+            # not read to the end, lines read so far may be reused
+            if not stored:
+                self._store(key, version, encoder, False)
+            raise
+
+        if not stored:
+            self._store(key, version, encoder, True)
+
+    def _store(self, key, version, encoder, complete):
+        if not complete and not len(encoder):
+            return
+
+        self.backend.put(key, version, encoder.encode(complete), self.ttl)
+        self._incr('stores' if complete else 'partial_stores')
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+
+        stats['backend'] = self.backend.stats()
+        return stats
+
+
+#=================================================================
+def create_query_cache(config):
+    """ Create :class:`CDXQueryCache` from config, if enabled:
+
+    ``query_cache``: ``memory``, a redis url for a shared cache,
+    or a backend object with ``get``, ``put`` and ``delete``
+    ``query_cache_size``: max bytes of the in-memory cache
+    ``query_cache_ttl``: secs before an entry expires
+    ``query_cache_max_lines``: max lines of a result stored
+    """
+    if not config:
+        return None
+
+    backend = config.get('query_cache')
+    if not backend:
+        return None
+
+    if backend == 'memory':
+        backend = InMemoryCacheBackend(config.get('query_cache_size',
+                                                  32 * 1024 * 1024))
+    elif isinstance(backend, str) and backend.startswith('redis://'):
+        backend = RedisCacheBackend(backend)
+
+    return CDXQueryCache(backend,
+                         config.get('query_cache_ttl',
+                                    CDXQueryCache.DEFAULT_TTL),
+                         config.get('query_cache_max_lines',
+                                    CDXQueryCache.DEFAULT_MAX_LINES))
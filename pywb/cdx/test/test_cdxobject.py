@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 from pywb.cdx.cdxobject import CDXObject, IDXObject, CDXException
+from pywb.cdx.cdxobject import LazyCDXObject
+from pywb import get_test_dir
 from pytest import raises
 
 def test_empty_cdxobject():
@@ -34,6 +36,43 @@ def test_unicode_url():
     assert x['timestamp'] == '123'
     assert x['url'] == 'http://example.com/caf%C3%A9/path'
 
+def test_lazy_unicode_url():
+    x = LazyCDXObject('com,example,cafe)/ 123 {"url": "http://example.com/café/path"}')
+    assert x['url'] == 'http://example.com/caf%C3%A9/path'
+
+def test_lazy_invalid_cdx_format():
+    x = LazyCDXObject('a b c')
+    with raises(CDXException):
+        x['urlkey']
+
+def _assert_same(line):
+    x = CDXObject(line)
+    y = LazyCDXObject(line)
+
+    assert y == x
+    assert y.items() == x.items()
+    assert str(y) == str(x)
+    assert y.to_text() == x.to_text()
+    assert y.to_json() == x.to_json()
+    assert y.to_text(['timestamp', 'url']) == x.to_text(['timestamp', 'url'])
+    assert y.to_json(['url', 'urlkey']) == x.to_json(['url', 'urlkey'])
+    assert y.is_revisit() == x.is_revisit()
+
+    x['orig.filename'] = y['orig.filename'] = '-'
+    x['timestamp'] = y['timestamp'] = '2014'
+
+    assert y.items() == x.items()
+    assert str(y) == str(x)
+    assert y.to_json() == x.to_json()
+
+def test_lazy_same_as_cdxobject():
+    for filename in ['cdx/iana.cdx', 'cdxj/example.cdxj', 'cdx/dupes.cdx',
+                     'cdx/example-arc-test.cdx']:
+        with open(get_test_dir() + filename) as fh:
+            for line in fh:
+                if not line.startswith((' CDX', '!')):
+                    _assert_same(line)
+
 def test_invalid_idx_format():
     with raises(CDXException):
         x = IDXObject('a b c')
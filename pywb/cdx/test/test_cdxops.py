@@ -107,6 +107,43 @@ org,iana)/_css/2013.1/screen.css 20140126201054 http://www.iana.org/_css/2013.1/
 org,iana)/_css/2013.1/screen.css 20140126200625 http://www.iana.org/_css/2013.1/screen.css text/css 200 BUAEPXZNN44AIX3NLXON4QDV6OY2H5QD - - 8754 41238 iana.warc.gz - - -
 org,iana)/_css/2013.1/screen.css 20140126201054 http://www.iana.org/_css/2013.1/screen.css text/css 200 BUAEPXZNN44AIX3NLXON4QDV6OY2H5QD - - 543 706476 iana.warc.gz 8754 41238 iana.warc.gz
 
+# Collapse by urlkey
+>>> cdx_ops_test(url = 'http://iana.org/_css/', matchType = 'prefix', collapse = 'urlkey', fields = 'urlkey,timestamp')
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826
+org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200625
+org,iana)/_css/2013.1/fonts/opensans-regular.ttf 20140126200626
+org,iana)/_css/2013.1/fonts/opensans-semibold.ttf 20140126200654
+org,iana)/_css/2013.1/print.css 20140126200625
+org,iana)/_css/2013.1/screen.css 20140126200625
+
+# Collapse by urlkey, with group counts and last timestamp
+>>> cdx_ops_test(url = 'http://iana.org/_css/', matchType = 'prefix', collapse = 'urlkey', showGroupCount = True, showUniqCount = True, lastSkipTimestamp = True, fields = 'urlkey,timestamp,endtimestamp,groupcount,uniqcount')
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 20140126201249 5 1
+org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200625 20140126201308 16 1
+org,iana)/_css/2013.1/fonts/opensans-regular.ttf 20140126200626 20140126201308 16 1
+org,iana)/_css/2013.1/fonts/opensans-semibold.ttf 20140126200654 20140126201308 15 1
+org,iana)/_css/2013.1/print.css 20140126200625 20140126201307 16 1
+org,iana)/_css/2013.1/screen.css 20140126200625 20140126201307 16 1
+
+# Collapse by urlkey prefix
+>>> cdx_ops_test(url = 'http://iana.org/_css/', matchType = 'prefix', collapse = 'urlkey:23', showGroupCount = True, fields = 'urlkey,groupcount')
+org,iana)/_css/2013.1/fonts/inconsolata.otf 52
+org,iana)/_css/2013.1/print.css 16
+org,iana)/_css/2013.1/screen.css 16
+
+>>> cdx_ops_test(url = 'http://iana.org/_css/', matchType = 'prefix', collapse = 'urlkey:x')
+Traceback (most recent call last):
+CDXException: Invalid collapse: urlkey:x
+
+# Sample one capture per minute
+>>> cdx_ops_test(url = 'http://iana.org/_css/2013.1/fonts/opensans-bold.ttf', collapse = 'timestamp:12', fields = 'timestamp', **{'from': '201401262008'})
+20140126200805
+20140126200912
+20140126201055
+20140126201128
+20140126201228
+20140126201308
+
 # Sort by closest timestamp + field select output
 >>> cdx_ops_test(closest = '20140126200826', url = 'http://iana.org/_css/2013.1/fonts/opensans-bold.ttf', fields = 'timestamp', limit = 10)
 20140126200826
@@ -174,14 +211,45 @@ org,iana)/domains/root/db 20140126200928 http://www.iana.org/domains/root/db tex
 {"urlkey": "com,example)/?example=1", "timestamp": "20140103030341", "url": "http://example.com?example=1", "length": "553", "filename": "example.warc.gz", "mime": "warc/revisit", "offset": "1864", "orig.length": "-", "orig.offset": "-", "orig.filename": "-"}
 
 
+# Text output, no processing -- lines passed through as is
+>>> cdx_ops_test('http://iana.org/_css/2013.1/fonts/inconsolata.otf', output='text', limit=2)
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200826 http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf application/octet-stream 200 LNMEDYOENSOEI5VPADCKL3CB6N3GWXPR - - 34054 620049 iana.warc.gz
+org,iana)/_css/2013.1/fonts/inconsolata.otf 20140126200912 http://www.iana.org/_css/2013.1/fonts/Inconsolata.otf warc/revisit - LNMEDYOENSOEI5VPADCKL3CB6N3GWXPR - - 546 667073 iana.warc.gz
+
+# Text output, fields projected from raw line
+>>> cdx_ops_test('http://iana.org/_css/2013.1/fonts/inconsolata.otf', output='text', fl='timestamp,length', limit=2)
+20140126200826 34054
+20140126200912 546
 
+# Text output, fields projected from cdxj
+>>> cdx_ops_test(url = 'http://example.com/?example=1', sources=[get_test_dir() + 'cdxj/example.cdxj'], output='text', fl='timestamp,offset')
+20140103030321 333
+20140103030341 1864
+
+>>> cdx_ops_test('http://iana.org/_css/2013.1/fonts/inconsolata.otf', output='text', fl='timestamp,foo')
+Traceback (most recent call last):
+CDXException: Invalid field "foo" found in fields= argument
 
 """
 
 #=================================================================
 from pywb.cdx.cdxserver import CDXServer
+from pywb.cdx.cdxops import is_text_passthrough, is_closest_seek
+from pywb.cdx.cdxops import is_reverse_seek, is_collapse_seek
+from pywb.cdx.cdxops import CDXFilters, RevisitOriginals
+from pywb.cdx.cdxobject import LazyCDXObject, DIGEST
+from pywb.cdx.query import CDXQuery
+from pywb.cdx.cdxsource import CDXFile
+from pywb.cdx.cdxobject import CDXException
+from pywb.utils.sparseindex import write_sparse_index
+from pywb.utils.wbexception import NotFoundException
+import json
 import os
+import pytest
+import shutil
 import sys
+import tempfile
+import threading
 
 from pywb import get_test_dir
 
@@ -207,6 +275,540 @@ def cdx_ops_test(url, sources = [test_cdx_dir + 'iana.cdx'], **kwparams):
         sys.stdout.write(l)
 
 
+def test_text_passthrough_same_output():
+    server = CDXServer([test_cdx_dir + 'iana.cdx', test_cdx_dir + 'dupes.cdx'])
+    no_op = lambda cdx_iter, query: cdx_iter
+
+    for fl in [None, 'urlkey,timestamp,filename', 'digest']:
+        params = dict(url='iana.org/', matchType='domain', output='text')
+        if fl:
+            params['fl'] = fl
+
+        assert is_text_passthrough(CDXQuery(**params))
+
+        # custom op requires cdx objects
+        expected = list(server.load_cdx(custom_ops=[no_op], **params))
+        assert list(server.load_cdx(**params)) == expected
+
+
+def test_no_text_passthrough():
+    assert not is_text_passthrough(CDXQuery(url='a', output='json'))
+    assert not is_text_passthrough(CDXQuery(url='a', filter='=status:200'))
+    assert not is_text_passthrough(CDXQuery(url='a', resolveRevisits=True))
+    assert not is_text_passthrough(CDXQuery(url='a', closest='2014'))
+    assert not is_text_passthrough(CDXQuery(url='a', sort='reverse'))
+    assert is_text_passthrough(CDXQuery(url='a', sort='reverse'), process=False)
+
+
+def load_full_scan(server, **params):
+    seekable = [source.seekable for source in server.sources]
+    try:
+        for source in server.sources:
+            source.seekable = False
+
+        return list(server.load_cdx(**params))
+    finally:
+        for source, value in zip(server.sources, seekable):
+            source.seekable = value
+
+
+def assert_same_as_full_scan(server, queries, **extra_params):
+    """ each query, loaded by seeking in the sources if possible,
+    returns the same text lines as a full scan of the sources
+    """
+    for params in queries:
+        params = dict(params, output='text', **extra_params)
+
+        expected = load_full_scan(server, **params)
+        assert list(server.load_cdx(**params)) == expected, params
+
+
+def iter_seek_servers():
+    """ servers over plain cdx files, searched with and without mmap
+    """
+    for config in [None, {'cdx_use_mmap': True}]:
+        yield CDXServer([test_cdx_dir + 'iana.cdx',
+                         test_cdx_dir + 'dupes.cdx'], config=config)
+
+
+CLOSEST_QUERIES = [
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200700', limit=3),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', limit=100, resolveRevisits=True),
+    dict(url='http://iana.org/_css/2013.1/fonts/inconsolata.otf',
+         closest='20140126201249', limit=2, resolveRevisits=True),
+    dict(url='http://iana.org/_css/2013.1/fonts/inconsolata.otf',
+         closest='2015', resolveRevisits=True,
+         filter=['!mimetype:warc/revisit']),
+    dict(url='http://iana.org/', closest='2014', resolveRevisits=True),
+    dict(url='http://iana.org/', closest='2000', limit=1),
+    dict(url='http://iana.org/dnssec', closest='20140126201307',
+         resolveRevisits=True, filter=['!statuscode:(500|502|504)']),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826',
+         **{'from': '201401262007', 'to': '201401262009'}),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', **{'to': '201401262008'}),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', sort='reverse', limit=4),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', collapse='timestamp:8'),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', collapse='timestamp:12',
+         showGroupCount=True, showUniqCount=True),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', collapse='urlkey', limit=1),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', fl='timestamp,status',
+         filter=['~status:2']),
+]
+
+
+def test_closest_seek_same_output():
+    for server in iter_seek_servers():
+        assert_same_as_full_scan(server, CLOSEST_QUERIES)
+
+
+def test_no_closest_seek():
+    sources = CDXServer(test_cdx_dir + 'iana.cdx').sources
+    assert is_closest_seek(sources, CDXQuery(url='a', closest='2014'))
+    assert not is_closest_seek(sources, CDXQuery(url='a'))
+    assert not is_closest_seek(sources, CDXQuery(url='a', closest='2014',
+                                                 matchType='prefix'))
+    assert not is_closest_seek(sources, CDXQuery(url='a', closest='2014',
+                                                 collapseTime=10))
+    assert not is_closest_seek(sources, CDXQuery(url='a', closest='2014',
+                                                 collapse='timestamp:8'))
+    assert not is_closest_seek(['not seekable'], CDXQuery(url='a',
+                                                          closest='2014'))
+
+
+REVERSE_QUERIES = [
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         sort='reverse', limit=1, resolveRevisits=True),
+    dict(url='http://iana.org/_css/2013.1/fonts/inconsolata.otf',
+         sort='reverse', resolveRevisits=True),
+    dict(url='http://iana.org/', sort='reverse', resolveRevisits=True),
+    dict(url='http://iana.org/', sort='reverse', limit=2,
+         filter=['mimetype:warc/revisit']),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         sort='reverse', **{'from': '201401262007', 'to': '201401262009'}),
+    dict(url='iana.org/_css/', matchType='prefix', sort='reverse',
+         limit=20),
+    dict(url='iana.org/', matchType='domain', sort='reverse'),
+    dict(url='iana.org/_css/', matchType='prefix', sort='reverse',
+         collapse='urlkey', showGroupCount=True),
+    dict(url='iana.org/_css/', matchType='prefix', sort='reverse',
+         collapse='urlkey', limit=3),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         sort='reverse', collapse='timestamp:8', showUniqCount=True),
+]
+
+
+def test_reverse_seek_same_output():
+    for server in iter_seek_servers():
+        assert_same_as_full_scan(server, REVERSE_QUERIES)
+
+
+def test_no_reverse_seek():
+    sources = CDXServer(test_cdx_dir + 'iana.cdx').sources
+    assert is_reverse_seek(sources, CDXQuery(url='a', sort='reverse'))
+    assert is_reverse_seek(sources, CDXQuery(url='a', sort='reverse',
+                                             matchType='prefix'))
+    assert not is_reverse_seek(sources, CDXQuery(url='a'))
+    assert not is_reverse_seek(sources, CDXQuery(url='a', sort='reverse',
+                                                 closest='2014'))
+    assert not is_reverse_seek(sources, CDXQuery(url='a', sort='reverse',
+                                                 matchType='prefix',
+                                                 resolveRevisits=True))
+    assert not is_reverse_seek(sources, CDXQuery(url='a', sort='reverse',
+                                                 collapse='timestamp:8'))
+
+
+class CountingCDXFile(CDXFile):
+    def load_cdx(self, query):
+        self.keys = (query.key, query.end_key)
+        self.count = 0
+        for line in super(CountingCDXFile, self).load_cdx(query):
+            self.count += 1
+            yield line
+
+
+def test_from_to_narrow_key():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+    server = CDXServer([source])
+
+    url = 'http://iana.org/_css/2013.1/fonts/opensans-bold.ttf'
+
+    all_lines = list(server.load_cdx(url=url, output='text'))
+    assert source.count == len(all_lines)
+
+    expected = [line for line in all_lines
+                if '20140126200700' <= line.split(' ')[1] <= '20140126200859']
+
+    res = list(server.load_cdx(url=url, output='text',
+                               **{'from': '201401262007', 'to': '201401262008'}))
+
+    assert len(res) > 0
+    assert res == expected
+
+    # only captures in range read
+    assert source.count == len(res)
+    key = 'org,iana)/_css/2013.1/fonts/opensans-bold.ttf '
+    assert source.keys == (key + '20140126200700', key + '20140126200859!')
+
+
+COLLAPSE_QUERIES = [
+    dict(url='iana.org/', matchType='domain', collapse='urlkey'),
+    dict(url='iana.org/_css/', matchType='prefix', collapse='urlkey',
+         limit=3),
+    dict(url='iana.org/', matchType='prefix', collapse='urlkey'),
+    dict(url='iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         collapse='timestamp:12'),
+    dict(url='iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         collapse='timestamp:11', **{'from': '201401262007'}),
+    dict(url='iana.org/_css/', matchType='prefix',
+         collapse='timestamp:11'),
+]
+
+
+def test_collapse_seek_same_output():
+    for server in iter_seek_servers():
+        assert_same_as_full_scan(server, COLLAPSE_QUERIES)
+
+
+def test_collapse_seek_skip_lines():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+    server = CDXServer([source])
+
+    params = dict(url='iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+                  matchType='prefix', output='text')
+
+    all_lines = list(server.load_cdx(**params))
+    assert len(all_lines) == 16
+
+    res = list(server.load_cdx(collapse='urlkey', **params))
+    assert res == all_lines[:1]
+
+    # stopped reading after max_scan lines
+    assert source.count < len(all_lines)
+
+
+def test_sample_seek_skip_lines():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'sample.cdx')
+
+        # one capture every 3 hours, over 4 years
+        with open(filename, 'wb') as fh:
+            for year in xrange(2010, 2014):
+                for month in xrange(1, 13):
+                    for day in xrange(1, 29):
+                        for hour in xrange(0, 24, 3):
+                            fh.write('com,example)/ {0}{1:02d}{2:02d}{3:02d}'
+                                     '0000 http://example.com/ text/html 200'
+                                     ' AAA - - 100 0 a.warc.gz\n'.
+                                     format(year, month, day, hour))
+
+        source = CountingCDXFile(filename)
+        server = CDXServer([source])
+
+        params = dict(url='example.com/', collapse='timestamp:6',
+                      output='text', fl='timestamp')
+
+        res = list(server.load_cdx(**params))
+        assert len(res) == 48
+        assert res[:2] == ['20100101000000\n', '20100201000000\n']
+
+        assert load_full_scan(server, **params) == res
+
+        res = list(server.load_cdx(to='201103', **params))
+        assert len(res) == 15
+        assert res[-1] == '20110301000000\n'
+
+        # each month read from its first capture
+        assert source.count < 15 * 10
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_no_collapse_seek():
+    sources = CDXServer(test_cdx_dir + 'iana.cdx').sources
+    query = dict(url='a/', matchType='prefix', collapse='urlkey')
+
+    assert is_collapse_seek(sources, CDXQuery(**query))
+    assert not is_collapse_seek(sources, CDXQuery(url='a/',
+                                                  matchType='prefix'))
+    assert not is_collapse_seek(sources, CDXQuery(collapse='urlkey:10',
+                                                  url='a/',
+                                                  matchType='prefix'))
+    assert not is_collapse_seek(sources, CDXQuery(showGroupCount=True,
+                                                  **query))
+    assert not is_collapse_seek(sources, CDXQuery(filter=['status:200'],
+                                                  **query))
+
+    assert is_collapse_seek(sources, CDXQuery(url='a/',
+                                              collapse='timestamp:6'))
+    assert not is_collapse_seek(sources, CDXQuery(url='a/',
+                                                  collapse='timestamp'))
+    assert not is_collapse_seek(sources, CDXQuery(url='a/',
+                                                  collapse='urlkey'))
+
+
+def test_line_filters_same_output():
+    server = CDXServer([test_cdx_dir + 'iana.cdx',
+                        test_cdx_dir + 'example.cdx',
+                        get_test_dir() + 'cdxj/example.cdxj'])
+
+    queries = [dict(url='example.com', matchType='domain', output='text'),
+               dict(url='iana.org', matchType='domain', output='text')]
+
+    for filters in [['!statuscode:(500|502|504)', '!mimetype:-'],
+                    ['mimetype:warc/revisit'],
+                    ['statuscode:(200|302)', '~urlkey:domains'],
+                    ['=mime:text/html'],
+                    ['!~filename:example'],
+                    ['~screen.css 20140126200625'],
+                    ['mimetype:text/.*'],
+                    ['!=blah:']]:
+
+        cdx_filters = CDXFilters.compile(filters)
+
+        for params in queries:
+            all_lines = list(server.load_cdx(**params))
+
+            expected = [line for line in all_lines
+                        if cdx_filters(LazyCDXObject(line))]
+
+            assert [line for line in all_lines
+                    if cdx_filters.match_line(line)] == expected
+
+            if expected:
+                assert list(server.load_cdx(filter=filters,
+                                            **params)) == expected
+
+
+def test_bounded_revisit_originals():
+    sources = [test_cdx_dir + 'dupes.cdx', test_cdx_dir + 'iana.cdx']
+    params = dict(url='iana.org/', matchType='domain', output='text',
+                  resolveRevisits=True)
+
+    expected = list(CDXServer(sources).load_cdx(**params))
+
+    # only most recent original kept, some revisits not resolved
+    server = CDXServer(sources, config={'revisit_max_originals': 1})
+    assert list(server.load_cdx(**params)) != expected
+
+    stats = server.revisit_stats.stats()
+    assert stats['peak_originals'] == 1
+    assert stats['evictions'] > 0
+    assert stats['unresolved'] > 0
+    assert stats['lookups'] == 0
+
+    # evicted originals looked up
+    server = CDXServer(sources, config={'revisit_max_originals': 1,
+                                        'revisit_lookup': True})
+
+    assert list(server.load_cdx(**params)) == expected
+
+    for query in REVERSE_QUERIES + CLOSEST_QUERIES:
+        if not query.get('resolveRevisits'):
+            continue
+
+        assert (list(server.load_cdx(**query)) ==
+                list(CDXServer(sources).load_cdx(**query)))
+
+    stats = server.revisit_stats.stats()
+    assert stats['peak_originals'] == 1
+    assert stats['lookups'] > 0
+    assert stats['lookup_hits'] > 0
+
+
+def test_revisit_lookup_evicted_only():
+    lookups = []
+
+    def lookup(cdx):
+        lookups.append(cdx[DIGEST])
+        return None
+
+    originals = RevisitOriginals(max_originals=1, lookup=lookup)
+
+    def revisit(digest):
+        return LazyCDXObject('a 20140102000000 - warc/revisit - ' + digest +
+                             ' - - 10 0 a.warc.gz')
+
+    originals.add(LazyCDXObject('a 20140101000000 - text/html 200 AAA'
+                                ' - - 10 0 a.warc.gz'))
+    originals.add(LazyCDXObject('b 20140101000000 - text/html 200 BBB'
+                                ' - - 10 0 a.warc.gz'))
+
+    # never seen, not evicted
+    assert originals.find(revisit('CCC')) is None
+    assert lookups == []
+
+    # evicted, only looked up once
+    assert originals.find(revisit('AAA')) is None
+    assert originals.find(revisit('AAA')) is None
+    assert lookups == ['AAA']
+
+    # looked up again once evicted again
+    originals.add(LazyCDXObject('a 20140101000000 - text/html 200 AAA'
+                                ' - - 10 0 a.warc.gz'))
+    originals.add(LazyCDXObject('b 20140101000000 - text/html 200 BBB'
+                                ' - - 10 0 a.warc.gz'))
+
+    assert originals.find(revisit('AAA')) is None
+    assert lookups == ['AAA', 'AAA']
+
+
+def load_pages(server, **params):
+    num_pages = json.loads(next(server.load_cdx(showNumPages=True,
+                                                **params)))
+
+    pages = []
+    for page in xrange(num_pages['pages']):
+        # all captures of page may be filtered out
+        try:
+            pages.append(list(server.load_cdx(page=page, **params)))
+        except NotFoundException:
+            pages.append([])
+
+    return num_pages, pages
+
+
+PAGED_QUERIES = [
+    dict(url='iana.org/', matchType='domain', output='text'),
+    dict(url='iana.org/_css/', matchType='prefix', output='text',
+         pageSize=2, filter=['!mimetype:warc/revisit']),
+    dict(url='example.com', matchType='domain', output='text', pageSize=1),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         output='text', pageSize=1),
+    dict(url='iana.org/', matchType='domain', output='text',
+         resolveRevisits=True, pageSize=3),
+    dict(url='iana.org/', matchType='domain', output='text',
+         resolveRevisits=True, pageSize=3, sort='reverse'),
+]
+
+
+def test_paged_plain_cdx():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for name in ['iana.cdx', 'dupes.cdx']:
+            shutil.copy(test_cdx_dir + name, tmpdir)
+
+        # split by sparse index of iana.cdx, and byte blocks
+        write_sparse_index(os.path.join(tmpdir, 'iana.cdx'), interval=10)
+
+        for paths in [os.path.join(tmpdir, 'iana.cdx'),
+                      tmpdir,
+                      [tmpdir, test_cdx_dir + 'example.cdx']]:
+
+            server = CDXServer(paths, config={'page_block_size': 2048})
+
+            for params in PAGED_QUERIES:
+                try:
+                    expected = list(server.load_cdx(**params))
+                except NotFoundException:
+                    expected = []
+
+                num_pages, pages = load_pages(server, **params)
+
+                # pages in key order, each page in reverse
+                if params.get('sort') == 'reverse':
+                    pages.reverse()
+
+                assert sum(pages, []) == expected
+
+                if len(expected) > 20:
+                    assert len(pages) > 1
+
+        # each page loads only its own key range
+        source = CountingCDXFile(os.path.join(tmpdir, 'iana.cdx'))
+        server = CDXServer([source])
+
+        lines = list(server.load_cdx(url='iana.org/', matchType='domain',
+                                     pageSize=2, page=1, output='text'))
+        assert len(lines) == source.count == 20
+
+        # no captures
+        assert load_pages(server, url='iana.org/not_found') == (
+            dict(pages=0, blocks=0, pageSize=10), [])
+
+        with pytest.raises(CDXException):
+            list(server.load_cdx(url='iana.org/', matchType='domain',
+                                 pageSize=2, page=9))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+RANGE_QUERIES = [
+    dict(url='iana.org/', matchType='domain'),
+    dict(url='iana.org/_css/', matchType='prefix', output='json',
+         filter=['!mimetype:warc/revisit']),
+    dict(url='iana.org/', matchType='domain', resolveRevisits=True,
+         limit=30),
+    dict(url='iana.org/', matchType='domain', collapse='urlkey'),
+    dict(url='iana.org/', matchType='domain', sort='reverse', limit=5),
+    dict(url='example.com', matchType='host'),
+]
+
+
+class RangeCountingCDXFile(CDXFile):
+    loads = 0
+
+    def load_cdx(self, query):
+        self.loads += 1
+        return super(RangeCountingCDXFile, self).load_cdx(query)
+
+
+def test_range_parallel_same_output():
+    sources = [test_cdx_dir + 'iana.cdx', test_cdx_dir + 'example.cdx']
+    config = {'page_block_size': 2048}
+
+    num_threads = threading.active_count()
+
+    server = CDXServer(sources)
+    range_server = CDXServer(sources, config=dict(config, range_workers=3))
+
+    assert range_server.range_workers.num_workers == 3
+
+    for params in RANGE_QUERIES:
+        expected = list(server.load_cdx(**params))
+        assert list(range_server.load_cdx(**params)) == expected
+
+    assert range_server.range_workers.pool
+
+    # worker threads stopped
+    range_server.close()
+    assert range_server.range_workers.pool is None
+
+    # one load per range
+    source = RangeCountingCDXFile(test_cdx_dir + 'iana.cdx', config)
+    range_server = CDXServer([source], config=dict(range_workers=2))
+
+    assert len(list(range_server.load_cdx(url='iana.org/',
+                                          matchType='domain'))) > 100
+    num_ranges = source.loads
+    assert num_ranges > 3
+
+    # not split: exact query, or workers disabled
+    source.loads = 0
+    list(range_server.load_cdx(url='http://www.iana.org/'))
+    list(CDXServer([source], config=dict(range_workers=1)).load_cdx(
+         url='iana.org/', matchType='domain'))
+    assert source.loads == 2
+
+    # at limit, only ranges already started by workers are loaded
+    source.loads = 0
+    assert len(list(range_server.load_cdx(url='iana.org/', matchType='domain',
+                                          limit=1))) == 1
+    assert source.loads <= 3
+
+    range_server.close()
+    assert threading.active_count() == num_threads
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
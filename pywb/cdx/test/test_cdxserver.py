@@ -1,16 +1,17 @@
 from pywb.apps.cdx_server import application
 from pywb.cdx.cdxserver import CDXServer, RemoteCDXServer
+from pywb.cdx.cdxsource import CDXFile
 import pywb.cdx.cdxobject as obj
 
 from pywb.utils.dsrules import DEFAULT_RULES_FILE
 from pywb.utils.wbexception import AccessException, NotFoundException
 from pywb.utils.wbexception import BadRequestException, WbException
 
-from urllib2 import HTTPError
-
 from mock import patch
+from requests import ConnectionError
 from pytest import raises
 import webtest
+import json
 
 from pywb import get_test_dir
 
@@ -39,30 +40,41 @@ def setup_module(self):
     testapp = webtest.TestApp(application)
 
 
-def mock_urlopen(req):
-    resp = testapp.get(req.get_full_url())
-    return resp.body.split('\n')
+class MockResponse(object):
+    def __init__(self, status_code, body=''):
+        self.status_code = status_code
+        self.body = body
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        # small chunks, to test splitting lines across chunks
+        for i in xrange(0, len(self.body), 100):
+            yield self.body[i:i + 100]
+
+    def close(self):
+        self.closed = True
+
 
-def mock_urlopen_err(err):
-    def make_err(req):
-        raise HTTPError(req.get_full_url(), err, None, None, None)
+def mock_get(session, url, **kwargs):
+    resp = testapp.get(url)
+    return MockResponse(200, resp.body)
+
+def mock_get_err(err):
+    def make_err(session, url, **kwargs):
+        return MockResponse(err)
     return make_err
 
 # First time expect a 404 when called with 'exact',
 # Second time expect a 200 for fuzzy match
-def mock_urlopen_fuzzy(req):
+def mock_get_fuzzy(session, url, **kwargs):
     status = 200
-    if 'exact' in req.get_full_url():
+    if 'exact' in url:
         status = 404
 
-    resp = testapp.get(req.get_full_url(), status=status)
-
-    if status == 200:
-        return resp.body.split('\n')
-    else:
-        raise mock_urlopen_err(404)(req)
+    resp = testapp.get(url, status=status)
+    return MockResponse(status, resp.body)
 
-@patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen)
+@patch('requests.Session.get', mock_get)
 def assert_cdx_match(server):
     x = server.load_cdx(url='example.com',
                         limit=2,
@@ -71,8 +83,8 @@ def assert_cdx_match(server):
     assert x.next().items() == CDX_RESULT
 
 
-def assert_cdx_fuzzy_match(server, mock=mock_urlopen):
-    with patch('pywb.cdx.cdxsource.urllib2.urlopen', mock):
+def assert_cdx_fuzzy_match(server, mock=mock_get):
+    with patch('requests.Session.get', mock):
         x = server.load_cdx(url='http://example.com?_=123',
                             limit=2,
                             output='cdxobject',
@@ -81,22 +93,22 @@ def assert_cdx_fuzzy_match(server, mock=mock_urlopen):
     assert x.next().items() == CDX_RESULT
 
 
-@patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen_err(404))
+@patch('requests.Session.get', mock_get_err(404))
 def assert_404(server):
     server.load_cdx(url='http://notfound.example.com')
 
 
-@patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen_err(403))
+@patch('requests.Session.get', mock_get_err(403))
 def assert_403(server):
     server.load_cdx(url='http://notfound.example.com')
 
 
-@patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen_err(400))
+@patch('requests.Session.get', mock_get_err(400))
 def assert_400(server):
     server.load_cdx(url='http://notfound.example.com')
 
 
-@patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen_err(502))
+@patch('requests.Session.get', mock_get_err(502))
 def assert_502(server):
     server.load_cdx(url='http://notfound.example.com')
 
@@ -122,7 +134,7 @@ def test_fuzzy_match():
     # then fuzzy with 200
     assert_cdx_fuzzy_match(CDXServer(CDX_SERVER_URL,
                            ds_rules_file=DEFAULT_RULES_FILE),
-                           mock_urlopen_fuzzy)
+                           mock_get_fuzzy)
 
     # Remote CDX Query (Remote Filtering)
     # fuzzy match handled on remote, single response
@@ -131,7 +143,7 @@ def test_fuzzy_match():
 
 def test_fuzzy_no_match_1():
     # no match, no fuzzy
-    with patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen):
+    with patch('requests.Session.get', mock_get):
         server = CDXServer([TEST_CDX_DIR], ds_rules_file=DEFAULT_RULES_FILE)
         with raises(NotFoundException):
             server.load_cdx(url='http://notfound.example.com/',
@@ -141,7 +153,7 @@ def test_fuzzy_no_match_1():
 
 def test_fuzzy_no_match_2():
     # fuzzy rule, but no actual match
-    with patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen):
+    with patch('requests.Session.get', mock_get):
         server = CDXServer([TEST_CDX_DIR], ds_rules_file=DEFAULT_RULES_FILE)
         with raises(NotFoundException):
             server.load_cdx(url='http://notfound.example.com/?_=1234',
@@ -153,7 +165,7 @@ def test_fuzzy_no_match_2():
 def test2_fuzzy_no_match_3():
     # special fuzzy rule, matches prefix test.example.example.,
     # but doesn't match rule regex
-    with patch('pywb.cdx.cdxsource.urllib2.urlopen', mock_urlopen):
+    with patch('requests.Session.get', mock_get):
         server = CDXServer([TEST_CDX_DIR], ds_rules_file=DEFAULT_RULES_FILE)
         with raises(NotFoundException):
             server.load_cdx(url='http://test.example.example/',
@@ -181,3 +193,140 @@ def test_err_400():
 
 def test_err_502():
     assert_error(assert_502, WbException)
+
+def test_err_connect():
+    def mock_get_conn_err(session, url, **kwargs):
+        raise ConnectionError('Connection refused')
+
+    with patch('requests.Session.get', mock_get_conn_err):
+        with raises(WbException):
+            CDXServer(CDX_SERVER_URL).load_cdx(url='example.com')
+
+def test_remote_pool():
+    server = RemoteCDXServer(CDX_SERVER_URL,
+                             config={'remote_pool_size': 4,
+                                     'remote_timeout': 5,
+                                     'remote_retries': 1})
+
+    source = server.source
+    session = source._get_session()
+    assert source._get_session() is session
+
+    adapter = session.get_adapter(CDX_SERVER_URL)
+    assert adapter._pool_maxsize == 4
+    assert adapter.max_retries.total == 1
+
+    responses = []
+    def mock_get_timeout(session, url, **kwargs):
+        assert kwargs['timeout'] == 5
+        resp = mock_get(session, url)
+        responses.append(resp)
+        return resp
+
+    with patch('requests.Session.get', mock_get_timeout):
+        x = server.load_cdx(url='iana.org/', matchType='domain')
+        assert x.next().startswith('org,iana)/ ')
+
+    # response closed when not fully read
+    assert not responses[0].closed
+    del x
+    assert responses[0].closed
+
+    server.close()
+    assert source.session is None
+    assert source._get_session() is not session
+
+
+#=================================================================
+class SweepCDXFile(CDXFile):
+    def open_sweep(self):
+        self.sweep = super(SweepCDXFile, self).open_sweep()
+        return self.sweep
+
+
+BATCH_QUERIES = [
+    dict(url='http://www.iana.org/_css/2013.1/screen.css'),
+    dict(url='http://example.com/?example=1', limit='1'),
+    dict(url='iana.org/_css/', matchType='prefix', collapse='urlkey'),
+    dict(url='http://www.iana.org/_css/2013.1/print.css', output='json'),
+    dict(url='http://www.iana.org/_img/2013.1/iana-logo-homepage.png',
+         closest='20140126200912', resolveRevisits='true'),
+    dict(url='http://www.iana.org/_css/2013.1/screen.css', sort='reverse'),
+    dict(url='http://example.com/not-found'),
+    dict(url='http://www.iana.org/about/'),
+]
+
+
+def test_batch_load():
+    server = CDXServer([TEST_CDX_DIR + 'iana.cdx'])
+    batch_server = CDXServer([SweepCDXFile(TEST_CDX_DIR + 'iana.cdx')])
+
+    results = {}
+    for inx, query, cdx_iter in batch_server.load_cdx_batch(BATCH_QUERIES):
+        results[inx] = list(cdx_iter)
+
+    assert sorted(results.keys()) == range(len(BATCH_QUERIES))
+
+    for inx, params in enumerate(BATCH_QUERIES):
+        try:
+            expected = list(server.load_cdx(**params))
+        except NotFoundException:
+            expected = []
+
+        assert results[inx] == expected
+
+    # most keys read forward from the previous query
+    sweep = batch_server.sources[0].sweep
+    assert sweep.scans > sweep.seeks
+    assert sweep.fh is None
+
+
+def test_batch_load_seek():
+    source = SweepCDXFile(TEST_CDX_DIR + 'iana.cdx',
+                          config=dict(sweep_scan_size=0))
+
+    batch_server = CDXServer([source])
+    results = batch_server.load_cdx_batch(BATCH_QUERIES[:2])
+    assert sum(len(list(cdx_iter)) for inx, query, cdx_iter in results) > 0
+
+    # all keys too far ahead, seek to each
+    assert source.sweep.scans == 0
+    assert source.sweep.seeks == 2
+
+
+def test_batch_api():
+    urls = ['http://www.iana.org/_css/2013.1/screen.css',
+            {'url': 'http://example.com/?example=1', 'limit': 1},
+            {'url': 'iana.org/', 'matchType': 'domain', 'limit': 2}]
+
+    resp = testapp.post('/pywb-cdx?filter=!mime:warc/revisit',
+                        json.dumps(urls),
+                        content_type='application/json')
+
+    assert resp.content_type == 'text/plain'
+    lines = resp.body.splitlines()
+
+    # grouped in key order
+    assert lines[0] == '# 1 http://example.com/?example=1'
+    assert lines[1].startswith('com,example)/?example=1 ')
+    assert lines[2] == '# 2 iana.org/'
+    assert lines[5] == '# 0 http://www.iana.org/_css/2013.1/screen.css'
+    assert all(line.startswith('org,iana)/_css/2013.1/screen.css ')
+               for line in lines[6:])
+    assert all('warc/revisit' not in line for line in lines)
+
+    resp = testapp.post('/pywb-cdx?output=json', json.dumps(urls[:1]),
+                        content_type='application/json')
+
+    lines = map(json.loads, resp.body.splitlines())
+    assert lines[0] == dict(index=0, url=urls[0])
+    assert lines[1]['urlkey'] == 'org,iana)/_css/2013.1/screen.css'
+
+
+def test_batch_api_invalid():
+    resp = testapp.post('/pywb-cdx', 'not json', expect_errors=True)
+    assert resp.status_int == 400
+
+    resp = testapp.post('/pywb-cdx', json.dumps([{'matchType': 'prefix'}]),
+                        expect_errors=True)
+    assert resp.status_int == 400
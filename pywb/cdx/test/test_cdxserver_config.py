@@ -1,10 +1,17 @@
 import yaml
 from pywb.cdx.cdxserver import create_cdx_server, CDXServer, RemoteCDXServer
-from pywb.cdx.cdxsource import CDXFile, RemoteCDXSource, RedisCDXSource
+from pywb.cdx.cdxsource import CDXSource, CDXFile, RemoteCDXSource, RedisCDXSource
 from pywb.cdx.zipnum import ZipNumCluster
 
 from pywb import get_test_dir
 
+import os
+import shutil
+import tempfile
+import time
+
+from pytest import raises
+
 yaml_config = r"""
 test_1:
     index_paths:
@@ -107,6 +114,15 @@ def test_single_cdx():
     assert type(sources[0]) == CDXFile
     assert sources[0].filename.endswith('example.cdx')
 
+def test_cdx_file_from_yaml():
+    # created without __init__
+    source = yaml.load('!!python/object:pywb.cdx.cdxsource.CDXFile ' +
+                       '{{filename: {0}cdx/example.cdx}}'.format(get_test_dir()))
+
+    params = dict(url='example.com', matchType='prefix', output='text')
+    expected = list(CDXServer(source.filename).load_cdx(**params))
+    assert list(CDXServer([source]).load_cdx(**params)) == expected
+
 def test_invalid_config():
     config = yaml.load(yaml_config)
     cdxserver = create_cdx_server(config.get('test_6'))
@@ -115,3 +131,161 @@ def test_invalid_config():
     assert len(sources) == 0
 
 
+
+def test_cdx_mmap():
+    cdxserver = create_cdx_server({'index_paths': get_test_dir() + 'cdx/iana.cdx',
+                                   'cdx_use_mmap': True})
+    assert cdxserver.sources[0].use_mmap == True
+
+    results = list(cdxserver.load_cdx(url='http://www.iana.org/'))
+    assert len(results) == 1
+    assert '20140126200624' in results[0]
+
+
+def test_cdx_mmap_per_source():
+    config = {'index_paths': [get_test_dir() + 'cdx/example.cdx',
+                              {'path': get_test_dir() + 'cdx/iana.cdx',
+                               'cdx_use_mmap': True}],
+              'page_block_size': 1024}
+
+    cdxserver = create_cdx_server(config)
+    assert [source.use_mmap for source in cdxserver.sources] == [False, True]
+
+    # server config still the default for other options
+    assert cdxserver.sources[1].page_block_size == 1024
+
+    results = list(cdxserver.load_cdx(url='http://www.iana.org/'))
+    assert len(results) == 1
+
+    # per-source option overrides server-wide option
+    config['cdx_use_mmap'] = True
+    config['index_paths'][1]['cdx_use_mmap'] = False
+
+    cdxserver = create_cdx_server(config)
+    assert [source.use_mmap for source in cdxserver.sources] == [True, False]
+
+
+def test_cdx_mmap_reload():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test.cdx')
+        lines = open(get_test_dir() + 'cdx/iana.cdx', 'rb').readlines()
+
+        with open(filename, 'wb') as fh:
+            fh.writelines(lines[:10])
+
+        cdxserver = create_cdx_server({'index_paths': filename,
+                                       'cdx_use_mmap': True})
+
+        results = list(cdxserver.load_cdx(url='iana.org/', matchType='domain'))
+        assert len(results) == 9
+
+        with open(filename, 'wb') as fh:
+            fh.writelines(lines)
+
+        # ensure mtime differs on filesystems with coarse timestamps
+        os.utime(filename, (0, 0))
+
+        results = list(cdxserver.load_cdx(url='iana.org/', matchType='domain'))
+        assert len(results) == len(lines) - 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+class SlowCDXSource(CDXSource):
+    def __init__(self, lines, delay=0, exc=None):
+        self.lines = lines
+        self.delay = delay
+        self.exc = exc
+
+    def load_cdx(self, query):
+        for line in self.lines:
+            time.sleep(self.delay)
+            yield line
+
+        if self.exc:
+            raise self.exc
+
+def test_parallel_sources():
+    paths = [get_test_dir() + 'cdx/iana.cdx',
+             get_test_dir() + 'cdx/dupes.cdx',
+             get_test_dir() + 'zipcdx/zipnum-sample.idx']
+
+    params = dict(url='iana.org/', matchType='domain', output='text')
+
+    serial = create_cdx_server({'index_paths': paths})
+    parallel = create_cdx_server({'index_paths': paths,
+                                  'parallel_sources': True,
+                                  'source_queue_size': 4})
+
+    assert parallel.merge_opts['parallel']
+
+    expected = list(serial.load_cdx(**params))
+    assert list(parallel.load_cdx(**params)) == expected
+
+    # limit stops consuming early
+    params['limit'] = 5
+    assert list(parallel.load_cdx(**params)) == expected[:5]
+
+def test_parallel_source_timeout():
+    lines = open(get_test_dir() + 'cdx/iana.cdx', 'rb').readlines()[1:]
+    slow = SlowCDXSource(['org,iana)/ 20140126200624 slow\n'], delay=2.0)
+
+    cdxserver = CDXServer([SlowCDXSource(lines), slow],
+                          config={'parallel_sources': True,
+                                  'source_timeout': 0.2})
+
+    results = list(cdxserver.load_cdx(url='iana.org/', matchType='domain',
+                                      output='text'))
+
+    # slow source skipped
+    assert len(results) == len(lines)
+
+def test_parallel_source_error():
+    lines = open(get_test_dir() + 'cdx/iana.cdx', 'rb').readlines()[1:]
+    cdxserver = CDXServer([SlowCDXSource(lines),
+                           SlowCDXSource([], exc=IOError('source failed'))],
+                          config={'parallel_sources': True})
+
+    with raises(IOError):
+        list(cdxserver.load_cdx(url='iana.org/', matchType='domain'))
+
+def test_dedup_sources():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # same warcs in two indexes
+        shutil.copy(get_test_dir() + 'cdx/iana.cdx', tmpdir)
+        shutil.copy(get_test_dir() + 'cdx/iana.cdx',
+                    os.path.join(tmpdir, 'iana-nightly.cdx'))
+
+        single = create_cdx_server({'index_paths':
+                                    get_test_dir() + 'cdx/iana.cdx'})
+
+        dupes = create_cdx_server({'index_paths': tmpdir})
+        dedup = create_cdx_server({'index_paths': tmpdir,
+                                   'dedup_sources': True,
+                                   'range_workers': 2})
+
+        queries = [dict(url='iana.org/', matchType='domain'),
+                   dict(url='http://www.iana.org/_css/2013.1/screen.css',
+                        resolveRevisits=True),
+                   dict(url='http://www.iana.org/_css/2013.1/screen.css',
+                        closest='20140126201054', sort='closest', limit=3),
+                   dict(url='http://www.iana.org/_css/2013.1/screen.css',
+                        sort='reverse'),
+                   dict(url='iana.org/_css/', matchType='prefix',
+                        output='json', fl='urlkey,timestamp,filename')]
+
+        for params in queries:
+            expected = list(single.load_cdx(**params))
+            assert list(dupes.load_cdx(**params)) != expected
+            assert list(dedup.load_cdx(**params)) == expected
+
+        stats = dedup.dedup_stats.stats()
+        assert stats['removed'] > 0
+        assert stats['max_removed'] <= stats['removed']
+        assert stats['loads'] >= stats['loads_with_dups'] > 0
+
+        dedup.close()
+    finally:
+        shutil.rmtree(tmpdir)
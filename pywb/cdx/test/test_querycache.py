@@ -0,0 +1,226 @@
+from pywb.cdx.cdxserver import CDXServer
+from pywb.cdx.cdxsource import CDXFile
+from pywb.cdx.querycache import CDXQueryCache, InMemoryCacheBackend
+from pywb.cdx.querycache import RedisCacheBackend
+from pywb.utils.wbexception import NotFoundException
+
+from pywb import get_test_dir
+
+from fakeredis import FakeStrictRedis
+from mock import patch
+
+import os
+import pytest
+import shutil
+import tempfile
+import time
+
+
+#=================================================================
+test_cdx_dir = get_test_dir() + 'cdx/'
+
+CACHE_CONFIG = {'query_cache': 'memory'}
+
+
+class CountingCDXFile(CDXFile):
+    count = 0
+
+    def load_cdx(self, query):
+        self.count += 1
+        return super(CountingCDXFile, self).load_cdx(query)
+
+
+def add_field_op(cdx_iter, query):
+    for cdx in cdx_iter:
+        cdx['coll'] = query.params.get('coll', '-')
+        yield cdx
+
+
+QUERIES = [
+    dict(url='http://iana.org/_css/2013.1/screen.css'),
+    dict(url='http://iana.org/_css/2013.1/screen.css', output='json',
+         fl='timestamp,digest'),
+    dict(url='iana.org/', matchType='domain', limit=20,
+         filter=['!mimetype:warc/revisit']),
+    dict(url='http://iana.org/_css/2013.1/fonts/opensans-bold.ttf',
+         closest='20140126200826', resolveRevisits=True),
+    dict(url='http://iana.org/_css/2013.1/fonts/inconsolata.otf',
+         sort='reverse', resolveRevisits=True, fl='timestamp,orig.offset'),
+    dict(url='iana.org/_css/', matchType='prefix', collapse='urlkey',
+         showGroupCount=True),
+    dict(url='http://example.com?example=1', output='cdxobject'),
+    dict(url='example.com/', matchType='prefix',
+         custom_ops=[add_field_op], coll='a',
+         output='text'),
+]
+
+
+def load_text(server, **params):
+    return [str(cdx) for cdx in server.load_cdx(**params)]
+
+
+def test_cached_same_output():
+    sources = [test_cdx_dir + 'iana.cdx', test_cdx_dir + 'example.cdx',
+               get_test_dir() + 'cdxj/example.cdxj']
+
+    server = CDXServer(sources)
+    cached = CDXServer(sources, config=CACHE_CONFIG)
+
+    for params in QUERIES:
+        expected = load_text(server, **params)
+
+        # first miss, then hit
+        assert load_text(cached, **params) == expected
+        assert load_text(cached, **params) == expected
+
+    # first two queries differ only in output
+    stats = cached.query_cache.stats()
+    assert stats['stores'] == len(QUERIES) - 1
+    assert stats['hits'] == len(QUERIES) + 1
+
+
+def test_cache_hit_no_load():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+    server = CDXServer([source], config=CACHE_CONFIG)
+
+    url = 'http://iana.org/_css/2013.1/screen.css'
+
+    text = load_text(server, url=url, filter=['status:200', '!mime:-'])
+    assert source.count == 1
+
+    # same normalized query, different output and filter order
+    assert load_text(server, url='iana.org/_css/2013.1/screen.css',
+                     filter=['!mime:-', 'status:200']) == text
+
+    json = load_text(server, url=url, output='json',
+                     filter=['status:200', '!mime:-'])
+    assert len(json) == len(text)
+
+    assert source.count == 1
+
+    # different query
+    load_text(server, url=url, limit=1)
+    assert source.count == 2
+
+
+def test_cache_not_found():
+    server = CDXServer([test_cdx_dir + 'iana.cdx'], config=CACHE_CONFIG)
+
+    for i in xrange(2):
+        with pytest.raises(NotFoundException):
+            load_text(server, url='http://iana.org/not_found')
+
+
+def test_cache_invalidate_file_changed():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'test.cdx')
+        with open(test_cdx_dir + 'example.cdx', 'rb') as fh:
+            lines = [line for line in fh if line.startswith('com,example)/')]
+
+        with open(filename, 'wb') as fh:
+            fh.write(''.join(lines))
+
+        server = CDXServer([filename], config=CACHE_CONFIG)
+
+        url = 'http://example.com?example=1'
+        assert len(load_text(server, url=url)) == 2
+
+        with open(filename, 'ab') as fh:
+            fh.write('com,example)/?example=1 20150101000000 ' +
+                     'http://example.com?example=1 text/html 200 AAA ' +
+                     '- - 100 0 example.warc.gz\n')
+
+        # file not checked again until version check interval passed
+        assert len(load_text(server, url=url)) == 2
+
+        now = time.time() + CDXFile.DEFAULT_VERSION_CHECK_INTERVAL
+        with patch('time.time', lambda: now):
+            assert len(load_text(server, url=url)) == 3
+
+        assert server.query_cache.stats()['stale'] == 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_cache_ttl_and_max_lines():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+    cache = CDXQueryCache(InMemoryCacheBackend(1000000), ttl=60, max_lines=5)
+    server = CDXServer([source], query_cache=cache)
+
+    url = 'iana.org/'
+
+    # too many lines to store, first lines stored
+    assert len(load_text(server, url=url, matchType='domain')) > 5
+    assert len(load_text(server, url=url, matchType='domain')) > 5
+    assert source.count == 2
+    assert cache.stats()['too_large'] == 2
+    assert cache.stats()['partial_misses'] == 1
+
+    # read no further than stored lines, not loaded
+    expected = load_text(CDXServer([test_cdx_dir + 'iana.cdx']),
+                         url=url, matchType='domain')
+
+    cdx_iter = server.load_cdx(url=url, matchType='domain', output='text')
+    assert [next(cdx_iter) for i in xrange(5)] == expected[:5]
+    assert source.count == 2
+
+    assert len(load_text(server, url=url, matchType='domain', limit=5)) == 5
+    assert source.count == 3
+
+    with patch('time.time', lambda: 1e10):
+        load_text(server, url=url, matchType='domain', limit=5)
+
+    # expired
+    assert source.count == 4
+
+
+def test_cache_partial_read():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+    server = CDXServer([source], config=CACHE_CONFIG)
+
+    params = dict(url='iana.org/', matchType='domain', output='text',
+                  closest='20140126200826', filter=['!mimetype:warc/revisit'])
+
+    expected = load_text(CDXServer([test_cdx_dir + 'iana.cdx']), **params)
+
+    # only closest capture read, first lines stored
+    cdx_iter = server.load_cdx(**params)
+    assert next(cdx_iter) == expected[0]
+    del cdx_iter
+
+    assert server.query_cache.stats()['partial_stores'] == 1
+
+    cdx_iter = server.load_cdx(**params)
+    assert next(cdx_iter) == expected[0]
+    assert source.count == 1
+
+    # read past stored lines, loaded again
+    assert [expected[0]] + list(cdx_iter) == expected
+    assert source.count == 2
+    assert server.query_cache.stats()['partial_misses'] == 1
+
+    # now stored in full
+    assert load_text(server, **params) == expected
+    assert source.count == 2
+
+
+@patch('redis.StrictRedis', FakeStrictRedis)
+def test_redis_backend():
+    source = CountingCDXFile(test_cdx_dir + 'iana.cdx')
+
+    # shared by both servers
+    config = {'query_cache': 'redis://127.0.0.1:6379/2'}
+    server = CDXServer([source], config=config)
+    server2 = CDXServer([source], config=config)
+
+    assert isinstance(server.query_cache.backend, RedisCacheBackend)
+
+    url = 'http://iana.org/_css/2013.1/screen.css'
+    expected = load_text(CDXServer([test_cdx_dir + 'iana.cdx']), url=url)
+
+    assert load_text(server, url=url) == expected
+    assert load_text(server2, url=url) == expected
+    assert source.count == 1
+
+    server.query_cache.backend.redis.flushdb()
@@ -4,8 +4,10 @@ com,example)/ 20130729195151 http://test@example.com/ warc/revisit - B2LTWWPUOYA
 com,example)/ 20140127171200 http://example.com text/html 200 B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 1046 334 dupes.warc.gz
 com,example)/ 20140127171251 http://example.com warc/revisit - B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 553 11875 dupes.warc.gz
 
-# TODO: enable when FakeRedis supports zrangebylex!
-#>>> redis_cdx(redis_cdx_server_key, 'http://example.com')
+>>> redis_cdx(redis_cdx_server_key, 'http://example.com')
+com,example)/ 20130729195151 http://test@example.com/ warc/revisit - B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 591 355 example-url-agnostic-revisit.warc.gz
+com,example)/ 20140127171200 http://example.com text/html 200 B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 1046 334 dupes.warc.gz
+com,example)/ 20140127171251 http://example.com warc/revisit - B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 553 11875 dupes.warc.gz
 
 """
 
@@ -67,6 +69,94 @@ def init_redis_server_key_file():
     return CDXServer([source])
 
 
+def load_lines(cdx_server, page_size, **params):
+    cdx_server.sources[0].page_size = page_size
+    try:
+        return list(cdx_server.load_cdx(**params))
+    finally:
+        cdx_server.sources[0].page_size = RedisCDXSource.DEFAULT_PAGE_SIZE
+
+
+def test_paged_load():
+    queries = [dict(url='iana.org/', matchType='domain'),
+               dict(url='iana.org/', matchType='domain', sort='reverse'),
+               dict(url='http://iana.org/_css/2013.1/screen.css')]
+
+    for params in queries:
+        expected = load_lines(redis_cdx_server_key, 1000, **params)
+        assert len(expected) > 3
+
+        # page boundaries before, at and after end of results
+        for page_size in (1, 2, 3, len(expected)):
+            assert load_lines(redis_cdx_server_key, page_size,
+                              **params) == expected
+
+    url = 'http://iana.org/_css/2013.1/screen.css'
+    expected = load_lines(redis_cdx_server, 1000, url=url)
+    assert len(expected) > 3
+
+    for page_size in (1, 2, len(expected)):
+        assert load_lines(redis_cdx_server, page_size, url=url) == expected
+
+
+def test_paged_load_changed():
+    url = 'http://iana.org/_css/2013.1/screen.css'
+    source = redis_cdx_server.sources[0]
+
+    expected = load_lines(redis_cdx_server, 1000, url=url)
+
+    first = expected[0]
+    redis_key, member = first.split(' ', 1)
+    redis_key = source.key_prefix + redis_key
+
+    source.page_size = 2
+    try:
+        cdx_iter = redis_cdx_server.load_cdx(url=url)
+        lines = [cdx_iter.next(), cdx_iter.next()]
+
+        # line removed from page already read
+        source.redis.zrem(redis_key, member)
+
+        lines.extend(cdx_iter)
+    finally:
+        source.page_size = RedisCDXSource.DEFAULT_PAGE_SIZE
+        zadd_cdx(source, first, None)
+
+    assert lines == expected
+
+
+def test_paged_load_same_timestamp():
+    source = redis_cdx_server.sources[0]
+    redis_key = source.key_prefix + 'com,example,same)/'
+
+    members = ['20140101000000 http://same.example.com/ ' + str(i) + '\n'
+               for i in xrange(5)]
+
+    for member in members:
+        source.redis.zadd(redis_key, timestamp_to_sec(member[:14]), member)
+
+    try:
+        for page_size in (1, 2, 3, 5):
+            assert load_lines(redis_cdx_server, page_size,
+                              url='same.example.com/') == [
+                'com,example,same)/ ' + member for member in members]
+    finally:
+        source.redis.delete(redis_key)
+
+
+@patch('redis.StrictRedis.from_url')
+def test_pool_config(from_url):
+    source = RedisCDXSource('redis://127.0.0.1:6379/0',
+                            config=dict(redis_page_size=50,
+                                        redis_max_connections=5,
+                                        redis_socket_timeout=10))
+
+    assert source.page_size == 50
+    from_url.assert_called_with('redis://127.0.0.1:6379/0',
+                                max_connections=5,
+                                socket_timeout=10)
+
+
 def redis_cdx(cdx_server, url, **params):
     cdx_iter = cdx_server.load_cdx(url=url, **params)
     for cdx in cdx_iter:
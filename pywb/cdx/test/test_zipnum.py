@@ -161,12 +161,17 @@ Exception: No Locations Found for: foo2
 """
 
 from test_cdxops import cdx_ops_test
+from test_cdxops import CLOSEST_QUERIES, REVERSE_QUERIES, COLLAPSE_QUERIES
+from test_cdxops import assert_same_as_full_scan
 from pywb import get_test_dir
 from pywb.cdx.cdxserver import CDXServer
 
+from mock import patch
 
 import shutil
 import tempfile
+import threading
+import time
 import os
 import json
 
@@ -219,6 +224,287 @@ def test_zip_prefix_load():
         shutil.rmtree(tmpdir)
 
 
+def test_zip_summary_reload():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        summary = os.path.join(tmpdir, 'zipnum-sample.idx')
+
+        with open(test_zipnum, 'rb') as fh:
+            lines = fh.readlines()
+
+        with open(summary, 'wb') as fh:
+            fh.writelines(lines[:2])
+
+        shutil.copy(get_test_dir() + 'zipcdx/zipnum-sample.cdx.gz',
+                    os.path.join(tmpdir, 'zipnum'))
+
+        config = {}
+        config['shard_index_loc'] = dict(match='(.*)',
+                                         replace=r'\1')
+
+        server = CDXServer(summary, config=config)
+        cluster = server.sources[0]
+
+        results = list(server.load_cdx(url='iana.org/', matchType='domain',
+                                       showPagedIndex=True))
+        assert len(results) == 2
+
+        # summary held in memory, not checked until reload interval passed
+        with open(summary, 'wb') as fh:
+            fh.writelines(lines)
+
+        os.utime(summary, (0, 0))
+
+        results = list(server.load_cdx(url='iana.org/', matchType='domain',
+                                       showPagedIndex=True))
+        assert len(results) == 2
+
+        now = time.time() + cluster.reload_interval
+        with patch('time.time', lambda: now):
+            # reload already in progress, query does not wait for it
+            with cluster.reload_lock:
+                results = list(server.load_cdx(url='iana.org/',
+                                               matchType='domain',
+                                               showNumPages=True))
+
+                assert json.loads(results[0])['blocks'] == 2
+
+            assert cluster.reload_thread is None
+
+            # reload started in background thread
+            list(server.load_cdx(url='iana.org/', matchType='domain'))
+
+            reload_thread = cluster.reload_thread
+            reload_thread.join()
+
+            # no further reload within the interval
+            list(server.load_cdx(url='iana.org/', matchType='domain'))
+            assert cluster.reload_thread is reload_thread
+
+        results = list(server.load_cdx(url='iana.org/', matchType='domain',
+                                       showNumPages=True))
+
+        assert json.loads(results[0])['blocks'] == len(lines)
+        assert not reload_thread.is_alive()
+
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_zip_block_cache():
+    server = CDXServer(test_zipnum, config=dict(block_cache_size=100000))
+    cluster = server.sources[0]
+
+    loads = []
+    orig_load = cluster.blk_loader.load
+
+    def load(url, offset, length):
+        # first location in sample .loc is invalid
+        if 'zipnum-sample' in url:
+            loads.append((offset, length))
+        return orig_load(url, offset, length)
+
+    cluster.blk_loader.load = load
+
+    results = list(server.load_cdx(url='iana.org/domains/', matchType='prefix'))
+    assert cluster.block_cache.misses == 3
+    assert cluster.block_cache.hits == 0
+    assert loads == [(8517, 1114)]
+
+    # all blocks cached, no loads
+    assert list(server.load_cdx(url='iana.org/domains/', matchType='prefix')) == results
+    assert cluster.block_cache.hits == 3
+    assert len(loads) == 1
+
+    # only fetch uncached blocks, adjacent to cached
+    results = list(server.load_cdx(url='iana.org/', matchType='domain',
+                                   pageSize=100))
+    assert len(results) > 20
+    # (groups of at most max_blocks)
+    assert loads[1:] == [(0, 2706), (2706, 2324), (5030, 2441), (7471, 1046),
+                         (9631, 166)]
+
+
+def test_zip_blocks_closed():
+    readers = []
+
+    server = CDXServer(test_zipnum)
+    cluster = server.sources[0]
+    orig_load = cluster.blk_loader.load
+
+    def load(url, offset, length):
+        reader = orig_load(url, offset, length)
+        readers.append(reader)
+        return reader
+
+    cluster.blk_loader.load = load
+
+    for params in [dict(url='iana.org/', matchType='domain'),
+                   dict(url='iana.org/', matchType='domain', limit=1)]:
+        list(server.load_cdx(**params))
+
+    # block readers closed once read, or when not read to the end
+    assert len(readers) == 2
+    assert all(reader.stream.closed for reader in readers)
+
+
+def test_zip_prefetch():
+    params = dict(url='iana.org/', matchType='domain', pageSize=100)
+
+    expected = list(CDXServer(test_zipnum).load_cdx(**params))
+
+    num_threads = threading.active_count()
+
+    config = dict(prefetch_depth=2, block_cache_size=100000)
+    server = CDXServer(test_zipnum, config=config)
+    cluster = server.sources[0]
+
+    assert list(server.load_cdx(**params)) == expected
+    assert cluster.prefetch_pool
+
+    # cached and prefetched blocks
+    params['url'] = 'iana.org/domains/'
+    assert list(server.load_cdx(**params)) == expected
+    assert cluster.block_cache.hits > 0
+
+    # prefetch threads stopped, started again if needed
+    server.close()
+    assert cluster.prefetch_pool is None
+    assert threading.active_count() == num_threads
+
+    assert list(server.load_cdx(**params)) == expected
+    server.close()
+
+
+def test_zip_range_parallel():
+    server = CDXServer(test_zipnum)
+    range_server = CDXServer(test_zipnum, config=dict(range_workers=4))
+
+    # unpaged query only reads max_blocks, as before
+    for params in [dict(url='iana.org/', matchType='domain'),
+                   dict(url='iana.org/', matchType='domain', pageSize=100),
+                   dict(url='iana.org/_css/', matchType='prefix',
+                        output='text', pageSize=3)]:
+        expected = list(server.load_cdx(**params))
+        assert list(range_server.load_cdx(**params)) == expected
+
+
+def test_zip_location_health():
+    params = dict(url='iana.org/', matchType='domain', pageSize=100)
+
+    expected = list(CDXServer(test_zipnum).load_cdx(**params))
+
+    server = CDXServer(test_zipnum)
+    cluster = server.sources[0]
+    health = cluster.location_health
+
+    bad_loc, good_loc = cluster.loc_resolver.loc_map['zipnum']
+
+    assert list(server.load_cdx(**params)) == expected
+
+    # bad path failed, moved to end of list until cooldown expires
+    assert health.failures[bad_loc] == 1
+    assert health.in_cooldown(bad_loc)
+    assert health.order([bad_loc, good_loc]) == [good_loc, bad_loc]
+
+    # bad path not retried
+    assert list(server.load_cdx(**params)) == expected
+    assert health.failures[bad_loc] == 1
+    assert len(health.latencies) > 0
+
+
+def test_zip_hedged():
+    params = dict(url='iana.org/', matchType='domain', pageSize=100)
+
+    expected = list(CDXServer(test_zipnum).load_cdx(**params))
+
+    server = CDXServer(test_zipnum, config=dict(hedge_percentile=95))
+    cluster = server.sources[0]
+
+    assert list(server.load_cdx(**params)) == expected
+    assert list(server.load_cdx(**params)) == expected
+
+    bad_loc, good_loc = cluster.loc_resolver.loc_map['zipnum']
+
+    called = []
+    read_blocks = cluster.read_blocks
+
+    def slow_read_blocks(location, blocks, ranges):
+        called.append(location)
+        if location == good_loc:
+            time.sleep(0.05)
+        return read_blocks(location, blocks, ranges)
+
+    cluster.read_blocks = slow_read_blocks
+
+    # no hedging with a delay of 0
+    # (enough samples that slow reads do not change the percentile)
+    health = cluster.location_health
+    health.latencies.clear()
+    health.latencies.extend([0.0] * 190)
+    assert health.hedge_delay(95) is None
+
+    assert list(server.load_cdx(**params)) == expected
+    assert cluster.hedges == 0
+    assert set(called) == set([good_loc])
+
+    # hedging starts once enough latencies have been recorded
+    health.latencies.clear()
+    health.latencies.extend([0.01] * 20)
+    assert health.hedge_delay(95) == 0.01
+
+    del called[:]
+    assert list(server.load_cdx(**params)) == expected
+
+    # no response from first location within hedge delay,
+    # second request issued to next location
+    assert cluster.hedges > 0
+    assert called[:2] == [good_loc, bad_loc]
+
+
+def test_zip_closest_seek():
+    for sources in [test_zipnum,
+                    [test_zipnum, get_test_dir() + 'cdx/dupes.cdx']]:
+        assert_same_as_full_scan(CDXServer(sources), CLOSEST_QUERIES)
+
+
+def test_zip_reverse_seek():
+    for sources in [test_zipnum,
+                    [test_zipnum, get_test_dir() + 'cdx/dupes.cdx']]:
+        server = CDXServer(sources)
+
+        # reverse reads bounded by same page as forward reads
+        for page_size in [None, 3, 100]:
+            assert_same_as_full_scan(server, REVERSE_QUERIES,
+                                     pageSize=page_size)
+
+
+def test_zip_collapse_seek():
+    server = CDXServer([test_zipnum, get_test_dir() + 'cdx/dupes.cdx'])
+    assert_same_as_full_scan(server, COLLAPSE_QUERIES, pageSize=100)
+
+
+def test_zip_latest_last_block():
+    server = CDXServer(test_zipnum)
+    cluster = server.sources[0]
+
+    fetched = []
+    fetch_blocks = cluster.fetch_blocks
+
+    def count_fetch_blocks(blocks, ranges, query):
+        fetched.extend(ranges)
+        return fetch_blocks(blocks, ranges, query)
+
+    cluster.fetch_blocks = count_fetch_blocks
+
+    res = list(server.load_cdx(url='iana.org/', matchType='domain',
+                               sort='reverse', limit=1, output='text',
+                               pageSize=100))
+
+    assert len(res) == 1
+    assert res[0].startswith('org,iana)/time-zones/y ')
+    assert len(fetched) == 1
+
 
 if __name__ == "__main__":
     import doctest
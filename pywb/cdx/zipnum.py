@@ -2,16 +2,24 @@ import os
 import collections
 import itertools
 import logging
+import threading
+import time
+import sys
+import Queue
 from io import BytesIO
-import datetime
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from array import array
+from bisect import bisect_left, bisect_right
 import json
 
 from cdxsource import CDXSource
 from cdxobject import IDXObject, CDXException
 
-from pywb.utils.loaders import BlockLoader, read_last_line
+from pywb.utils.loaders import BlockLoader
+from pywb.utils.lrucache import LRUCache
 from pywb.utils.bufferedreaders import gzip_decompressor
-from pywb.utils.binsearch import iter_range, linearsearch, search
+from pywb.utils.binsearch import linearsearch
 
 
 #=================================================================
@@ -48,14 +56,18 @@ class LocMapResolver(object):
         if (new_mtime == self.loc_mtime):
             return
 
-        # update loc file mtime
-        self.loc_mtime = new_mtime
-
         logging.debug('Loading loc from: ' + self.loc_filename)
+        loc_map = {}
         with open(self.loc_filename, 'rb') as fh:
             for line in fh:
                 parts = line.rstrip().split('\t')
-                self.loc_map[parts[0]] = parts[1:]
+                loc_map[parts[0]] = parts[1:]
+
+        # replace whole map, as may be in use by other threads
+        self.loc_map = loc_map
+
+        # update loc file mtime
+        self.loc_mtime = new_mtime
 
     def __call__(self, part, query):
         return self.loc_map[part]
@@ -80,19 +92,168 @@ class LocPrefixResolver(object):
         return [self.prefix + part]
 
 
+#=================================================================
+class LocationHealth(object):
+    """ Track latency and failures of shard locations, to order
+    locations for failover and to compute the hedged request delay.
+
+    A location which fails, or is slower than the hedge delay, is
+    deprioritized for a cooldown period (in seconds)
+    """
+    MIN_SAMPLES = 10
+
+    def __init__(self, cooldown=60, window=200):
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.failures = collections.defaultdict(int)
+        self.cooldown_until = {}
+
+    def record_success(self, location, latency):
+        self.latencies.append(latency)
+        self.failures.pop(location, None)
+        self.cooldown_until.pop(location, None)
+
+    def record_failure(self, location):
+        self.failures[location] += 1
+        self.penalize(location)
+
+    def penalize(self, location):
+        # cooldown grows with consecutive failures, up to 8x
+        factor = min(2 ** max(self.failures.get(location, 1) - 1, 0), 8)
+        self.cooldown_until[location] = time.time() + self.cooldown * factor
+
+    def in_cooldown(self, location, now=None):
+        until = self.cooldown_until.get(location)
+        return until is not None and until > (now or time.time())
+
+    def order(self, locations):
+        """ Return locations with those in cooldown moved to the end,
+        otherwise preserving the original order
+        """
+        if not self.cooldown_until:
+            return locations
+
+        now = time.time()
+        return sorted(locations, key=lambda loc: self.in_cooldown(loc, now))
+
+    def hedge_delay(self, percentile):
+        """ Return the latency at the given percentile of recent requests
+        or None, for no hedging, if not enough requests have been made yet
+        or the latency is not > 0
+        """
+        latencies = list(self.latencies)
+        if len(latencies) < self.MIN_SAMPLES:
+            return None
+
+        latencies.sort()
+        inx = int(round((len(latencies) - 1) * percentile / 100.0))
+
+        # a delay of 0 would hedge every request
+        return latencies[inx] if latencies[inx] > 0 else None
+
+
+#=================================================================
+class ZipNumSummary(object):
+    """ In-memory secondary index (the .summary/.idx file) of a
+    zipnum cluster, stored as parallel sorted arrays of
+    keys, part ids, offsets, lengths and line numbers.
+
+    Each key is the first field of the summary line
+    (urlkey and timestamp) and may be searched with bisect
+    """
+    NUM_REQ_FIELDS = IDXObject.NUM_REQ_FIELDS
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.mtime = os.path.getmtime(filename)
+
+        self.keys = []
+        self.parts = []
+        self.part_ids = array('i')
+        self.offsets = array('l')
+        self.lengths = array('l')
+        self.linenos = array('l')
+
+        part_map = {}
+
+        with open(filename, 'rb') as fh:
+            for line in fh:
+                fields = line.rstrip().split('\t')
+                if len(fields) < self.NUM_REQ_FIELDS:
+                    msg = 'invalid idx format: {0} fields found, {1} required'
+                    raise CDXException(msg.format(len(fields),
+                                                  self.NUM_REQ_FIELDS))
+
+                part_id = part_map.get(fields[1])
+                if part_id is None:
+                    part_id = part_map[fields[1]] = len(self.parts)
+                    self.parts.append(fields[1])
+
+                self.keys.append(fields[0])
+                self.part_ids.append(part_id)
+                self.offsets.append(int(fields[2]))
+                self.lengths.append(int(fields[3]))
+
+                if len(fields) > self.NUM_REQ_FIELDS and fields[4]:
+                    self.linenos.append(int(fields[4]))
+                else:
+                    self.linenos.append(-1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def bisect(self, key):
+        """ Return index of first entry >= key
+        """
+        return bisect_left(self.keys, key)
+
+    def part(self, i):
+        return self.parts[self.part_ids[i]]
+
+    def line(self, i):
+        """ Recreate summary line for entry i
+        """
+        fields = [self.keys[i],
+                  self.part(i),
+                  str(self.offsets[i]),
+                  str(self.lengths[i])]
+
+        if self.linenos[i] >= 0:
+            fields.append(str(self.linenos[i]))
+
+        return '\t'.join(fields)
+
+
 #=================================================================
 class ZipNumCluster(CDXSource):
+    seekable = True
+    paged = True
+
     DEFAULT_RELOAD_INTERVAL = 10  # in minutes
     DEFAULT_MAX_BLOCKS = 10
+    DEFAULT_BLOCK_CACHE_SIZE = 0  # in bytes, disabled by default
+
+    # number of block ranges to fetch ahead, disabled by default
+    prefetch_depth = 0
+    prefetch_threads = 0
+
+    # if set, send a hedged request to the next location if the
+    # current one has not answered within this latency percentile
+    hedge_percentile = None
+
+    DEFAULT_LOCATION_COOLDOWN = 60  # in seconds
 
     def __init__(self, summary, config=None):
         self.max_blocks = self.DEFAULT_MAX_BLOCKS
+        self.prefetch_pool = None
 
         self.loc_resolver = None
 
         loc = None
         cookie_maker = None
         reload_ival = self.DEFAULT_RELOAD_INTERVAL
+        block_cache_size = self.DEFAULT_BLOCK_CACHE_SIZE
+        location_cooldown = self.DEFAULT_LOCATION_COOLDOWN
 
         if config:
             loc = config.get('shard_index_loc')
@@ -102,6 +263,32 @@ class ZipNumCluster(CDXSource):
 
             reload_ival = config.get('reload_interval', reload_ival)
 
+            block_cache_size = config.get('block_cache_size',
+                                          block_cache_size)
+
+            self.prefetch_depth = config.get('prefetch_depth',
+                                             self.prefetch_depth)
+
+            self.prefetch_threads = config.get('prefetch_threads',
+                                               self.prefetch_depth)
+
+            self.hedge_percentile = config.get('hedge_percentile',
+                                               self.hedge_percentile)
+
+            location_cooldown = config.get('location_cooldown',
+                                           location_cooldown)
+
+        self.location_health = LocationHealth(location_cooldown)
+
+        # number of hedged requests made to a further location
+        self.hedges = 0
+        self.hedges_lock = threading.Lock()
+
+        # cache of decompressed blocks, keyed by (part, offset, length)
+        if block_cache_size > 0:
+            self.block_cache = LRUCache(block_cache_size)
+        else:
+            self.block_cache = None
 
         if isinstance(loc, dict):
             self.loc_resolver = LocPrefixResolver(summary, loc)
@@ -109,43 +296,155 @@ class ZipNumCluster(CDXSource):
             self.loc_resolver = LocMapResolver(summary, loc)
 
         self.summary = summary
+        self.summary_index = None
+        self.summary_lock = threading.Lock()
+
+        # reload interval, in seconds
+        # if <= 0, check for changes on every query instead
+        self.reload_interval = reload_ival * 60
+        self.last_reload_check = time.time()
 
-        # reload interval
-        self.loc_update_time = datetime.datetime.now()
-        self.reload_interval = datetime.timedelta(minutes=reload_ival)
+        # held while a reload is in progress
+        self.reload_lock = threading.Lock()
+        self.reload_thread = None
 
         self.blk_loader = BlockLoader(cookie_maker=cookie_maker)
 
-#    @staticmethod
-#    def reload_timed(timestamp, val, delta, func):
-#        now = datetime.datetime.now()
-#        if now - timestamp >= delta:
-#            func()
-#            return now
-#        return None
-#
-#    def reload_loc(self):
-#        reload_time = self.reload_timed(self.loc_update_time,
-#                                        self.loc_map,
-#                                        self.reload_interval,
-#                                        self.load_loc)
-#
-#        if reload_time:
-#            self.loc_update_time = reload_time
+    def _check_reload(self):
+        """ Check for changes at most once per reload interval, on access.
+        The check runs in a background thread, queries meanwhile use the
+        current summary
+        """
+        if self.reload_interval <= 0:
+            self._try_reload()
+            return
 
-    def load_cdx(self, query):
+        if time.time() - self.last_reload_check < self.reload_interval:
+            return
+
+        # only one reload at a time, other queries do not wait
+        if not self.reload_lock.acquire(False):
+            return
+
+        try:
+            now = time.time()
+            if now - self.last_reload_check < self.reload_interval:
+                self.reload_lock.release()
+                return
+
+            self.last_reload_check = now
+
+            thread = threading.Thread(target=self._reload_in_background)
+            thread.daemon = True
+            thread.start()
+            self.reload_thread = thread
+        except:
+            self.reload_lock.release()
+            raise
+
+    def _reload_in_background(self):
+        try:
+            self._try_reload()
+        finally:
+            self.reload_lock.release()
+
+    def _try_reload(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logging.warn('Error reloading {0}: {1}'.format(self, e))
+
+    def reload(self):
+        """ Reload the .loc and summary if either has changed
+        """
         self.loc_resolver.load_loc()
-        return self._do_load_cdx(self.summary, query)
 
-    def _do_load_cdx(self, filename, query):
-        reader = open(filename, 'rb')
+        if self.summary_index:
+            if os.path.getmtime(self.summary) != self.summary_index.mtime:
+                self._load_summary()
 
-        idx_iter = self.compute_page_range(reader, query)
+    def _load_summary(self):
+        with self.summary_lock:
+            logging.debug('Loading summary from: ' + self.summary)
+            summary_index = ZipNumSummary(self.summary)
+            self.summary_index = summary_index
+            return summary_index
 
-        if query.secondary_index_only or query.page_count:
+    def get_summary_index(self):
+        summary_index = self.summary_index
+        if not summary_index:
+            summary_index = self._load_summary()
+
+        return summary_index
+
+    def get_block_keys(self, query):
+        summary_index = self.get_summary_index()
+        keys = summary_index.keys
+
+        return keys[bisect_right(keys, query.key):
+                    bisect_left(keys, query.end_key)]
+
+    def get_unpaged_end_key(self, query):
+        """ A query without a page reads only the first ``pageSize``
+        (or ``max_blocks``) blocks in range
+        """
+        summary_index = self.get_summary_index()
+        first, end_inx = self.compute_block_range(summary_index, query)
+
+        page_size = int(query.page_size or self.max_blocks)
+        if first + page_size >= end_inx:
+            return query.end_key
+
+        return min(query.end_key, summary_index.keys[first + page_size])
+
+    def cache_version(self):
+        # changed when summary is reloaded
+        self._check_reload()
+
+        return self.get_summary_index().mtime
+
+    def load_cdx(self, query):
+        self._check_reload()
+
+        return self._do_load_cdx(self.get_summary_index(), query)
+
+    def load_cdx_reverse(self, query):
+        """ Load cdx lines in reverse order, reading one block at a time
+        starting from the last block in range.
+
+        The same blocks are read as for a forward query, bounded by
+        the current page, as lines are consumed
+        """
+        self._check_reload()
+
+        summary_index = self.get_summary_index()
+        idxs = list(self.compute_page_range(summary_index, query))
+
+        for i in reversed(idxs):
+            group = next(self._iter_block_groups([i], summary_index))
+
+            if isinstance(group, tuple):
+                buffs = self.fetch_blocks(group[0], group[1], query)
+            else:
+                buffs = [group]
+
+            lines = itertools.chain.from_iterable(itertools.imap(BytesIO,
+                                                                 buffs))
+            lines = list(self._bound_lines(lines, query))
+
+            for line in reversed(lines):
+                yield line
+
+    def _do_load_cdx(self, summary_index, query):
+        idx_iter = self.compute_page_range(summary_index, query)
+
+        if query.secondary_index_only:
+            return itertools.imap(summary_index.line, idx_iter)
+
+        if query.page_count:
             return idx_iter
 
-        blocks = self.idx_to_cdx(idx_iter, query)
+        blocks = self.idx_to_cdx(idx_iter, query, summary_index)
 
         def gen_cdx():
             for blk in blocks:
@@ -161,60 +460,67 @@ class ZipNumCluster(CDXSource):
                     blocks=blocks)
         return json.dumps(info) + '\n'
 
-    def compute_page_range(self, reader, query):
+    def compute_block_range(self, summary_index, query):
+        """ Return (first, end) indexes of the summary entries whose blocks
+        may contain lines in the query range, end exclusive
+        """
+        num_lines = len(summary_index)
+
+        end_inx = summary_index.bisect(query.end_key)
+
+        start_inx = summary_index.bisect(query.key)
+        first = max(start_inx - 1, 0)
+
+        if start_inx == num_lines:
+            # past last line, but may still have captures in last block
+            first = num_lines - 1
+
+        if (num_lines == 0 or
+            (first >= end_inx and start_inx < num_lines)):
+            return 0, 0
+
+        return first, max(end_inx, first + 1)
+
+    def compute_page_range(self, summary_index, query):
+        """ Yield indexes of the summary entries for the current page,
+        or the page info, if a page count query
+        """
         pagesize = query.page_size
         if not pagesize:
             pagesize = self.max_blocks
         else:
             pagesize = int(pagesize)
 
-        last_line = None
-
-        # Get End
-        end_iter = search(reader, query.end_key, prev_size=1)
+        num_lines = len(summary_index)
 
-        try:
-            end_line = end_iter.next()
-        except StopIteration:
-            last_line = read_last_line(reader)
-            end_line = last_line
+        # Get End -- line before the first line >= end_key
+        end_inx = summary_index.bisect(query.end_key)
+        end = max(end_inx - 1, 0)
 
-        # Get Start
-        first_iter = iter_range(reader,
-                                query.key,
-                                query.end_key,
-                                prev_size=1)
+        # Get Start -- line before the first line >= key
+        start_inx = summary_index.bisect(query.key)
+        first = max(start_inx - 1, 0)
 
-        try:
-            first_line = first_iter.next()
-        except StopIteration:
-            if end_line == last_line and query.key >= last_line:
-                first_line = last_line
-            else:
-                reader.close()
-                if query.page_count:
-                    yield self._page_info(0, pagesize, 0)
-                    return
-                else:
-                    raise
+        if start_inx == num_lines:
+            # past last line, but may still have captures in last block
+            first = num_lines - 1
 
-        first = IDXObject(first_line)
+        if (num_lines == 0 or
+            (first >= end_inx and start_inx < num_lines)):
+            if query.page_count:
+                yield self._page_info(0, pagesize, 0)
+            return
 
-        end = IDXObject(end_line)
-
-        try:
-            blocks = end['lineno'] - first['lineno']
-            total_pages = blocks / pagesize + 1
-        except:
-            blocks = -1
-            total_pages = 1
+        blocks = end - first
+        total_pages = blocks / pagesize + 1
 
         if query.page_count:
             # same line, so actually need to look at cdx
             # to determine if it exists
             if blocks == 0:
                 try:
-                    block_cdx_iter = self.idx_to_cdx([first_line], query)
+                    block_cdx_iter = self.idx_to_cdx([first], query,
+                                                     summary_index)
                     block = block_cdx_iter.next()
                     cdx = block.next()
                 except StopIteration:
@@ -222,112 +528,299 @@ class ZipNumCluster(CDXSource):
                     blocks = -1
 
             yield self._page_info(total_pages, pagesize, blocks + 1)
-            reader.close()
             return
 
         curr_page = query.page
         if curr_page >= total_pages or curr_page < 0:
             msg = 'Page {0} invalid: First Page is 0, Last Page is {1}'
-            reader.close()
             raise CDXException(msg.format(curr_page, total_pages - 1))
 
         startline = curr_page * pagesize
-        endline = startline + pagesize - 1
-        if blocks >= 0:
-            endline = min(endline, blocks)
+        endline = min(startline + pagesize - 1, blocks)
+
+        start = first + startline
 
         if curr_page == 0:
-            yield first_line
-        else:
-            startline -= 1
+            yield first
+            start += 1
 
-        idxiter = itertools.islice(first_iter, startline, endline)
-        for idx in idxiter:
-            yield idx
+        for i in xrange(start, min(first + endline + 1, end_inx)):
+            yield i
 
-        reader.close()
+    def idx_to_cdx(self, idx_iter, query, summary_index):
+        """ Yield a cdx line iterator for each block or range of
+        adjacent blocks. Blocks already in the block cache are served
+        from cache, and only uncached blocks are merged into ranges to fetch
 
+        If prefetch is enabled, the next ``prefetch_depth`` ranges are
+        fetched concurrently while the current one is being read
+        """
+        groups = self._iter_block_groups(idx_iter, summary_index)
 
-    def search_by_line_num(self, reader, line):  # pragma: no cover
-        def line_cmp(line1, line2):
-            line1_no = int(line1.rsplit('\t', 1)[-1])
-            line2_no = int(line2.rsplit('\t', 1)[-1])
-            return cmp(line1_no, line2_no)
+        if self.prefetch_depth > 0:
+            return self._prefetch_groups(groups, query)
 
-        line_iter = search(reader, line, compare_func=line_cmp)
-        yield line_iter.next()
+        return self._load_groups(groups, query)
 
-    def idx_to_cdx(self, idx_iter, query):
+    def _iter_block_groups(self, idx_iter, summary_index):
+        """ Yield either a cached decompressed block, or a tuple of
+        (ZipBlocks, ranges) for a range of adjacent uncached blocks
+        """
         blocks = None
         ranges = []
 
-        for idx in idx_iter:
-            idx = IDXObject(idx)
+        for i in idx_iter:
+            part = summary_index.part(i)
+            offset = summary_index.offsets[i]
+            length = summary_index.lengths[i]
+
+            if self.block_cache is not None:
+                buff = self.block_cache.get((part, offset, length))
+                if buff is not None:
+                    if blocks:
+                        yield blocks, ranges
+                        blocks = None
 
-            if (blocks and blocks.part == idx['part'] and
-                blocks.offset + blocks.length == idx['offset'] and
+                    yield buff
+                    continue
+
+            if (blocks and blocks.part == part and
+                blocks.offset + blocks.length == offset and
                 blocks.count < self.max_blocks):
 
-                    blocks.length += idx['length']
+                    blocks.length += length
                     blocks.count += 1
-                    ranges.append(idx['length'])
+                    ranges.append(length)
 
             else:
                 if blocks:
-                    yield self.block_to_cdx_iter(blocks, ranges, query)
+                    yield blocks, ranges
 
-                blocks = ZipBlocks(idx['part'],
-                                   idx['offset'],
-                                   idx['length'],
-                                   1)
+                blocks = ZipBlocks(part, offset, length, 1)
 
                 ranges = [blocks.length]
 
         if blocks:
-            yield self.block_to_cdx_iter(blocks, ranges, query)
+            yield blocks, ranges
 
-    def block_to_cdx_iter(self, blocks, ranges, query):
-        last_exc = None
-        last_traceback = None
+    def _load_groups(self, groups, query):
+        for group in groups:
+            if isinstance(group, tuple):
+                yield self.block_to_cdx_iter(group[0], group[1], query)
+            else:
+                yield self._bound_lines(BytesIO(group), query)
+
+    def _prefetch_groups(self, groups, query):
+        """ Fetch up to ``prefetch_depth`` block ranges ahead on a thread
+        pool, yielding results in key order
+        """
+        pool = self._get_prefetch_pool()
+        pending = deque()
+
+        def submit(group):
+            if isinstance(group, tuple):
+                pending.append(pool.apply_async(self.fetch_blocks,
+                                                (group[0], group[1], query)))
+            else:
+                pending.append([group])
+
+        for group in itertools.islice(groups, self.prefetch_depth):
+            submit(group)
+
+        while pending:
+            buffs = pending.popleft()
+            if not isinstance(buffs, list):
+                buffs = buffs.get()
+
+            # issue next fetch before current is processed
+            for group in itertools.islice(groups, 1):
+                submit(group)
+
+            lines = itertools.chain.from_iterable(itertools.imap(BytesIO,
+                                                                 buffs))
+            yield self._bound_lines(lines, query)
+
+    def _get_prefetch_pool(self):
+        if not self.prefetch_pool:
+            with self.summary_lock:
+                if not self.prefetch_pool:
+                    num_threads = self.prefetch_threads or self.prefetch_depth
+                    self.prefetch_pool = ThreadPool(num_threads)
+
+        return self.prefetch_pool
+
+    def close(self):
+        with self.summary_lock:
+            pool = self.prefetch_pool
+            self.prefetch_pool = None
 
+        if pool:
+            pool.close()
+            pool.join()
+
+    def _get_locations(self, blocks, query):
         try:
             locations = self.loc_resolver(blocks.part, query)
         except:
             raise Exception('No Locations Found for: ' + blocks.part)
 
-        for location in self.loc_resolver(blocks.part, query):
+        if not locations:
+            raise Exception('No Locations Found for: ' + blocks.part)
+
+        return self.location_health.order(locations)
+
+    def _call_location(self, location, func, *args):
+        """ Call func(location, *args), recording latency or failure
+        """
+        start = time.time()
+        try:
+            result = func(location, *args)
+        except Exception:
+            self.location_health.record_failure(location)
+            raise
+
+        self.location_health.record_success(location, time.time() - start)
+        return result
+
+    def _call_locations(self, blocks, query, func, *args):
+        """ Call func(location, *args) with each location for the block
+        part in turn, until one succeeds. Locations which have recently
+        failed or were slow are tried last
+        """
+        last_exc = None
+        last_traceback = None
+
+        for location in self._get_locations(blocks, query):
             try:
-                return self.load_blocks(location, blocks, ranges, query)
+                return self._call_location(location, func, *args)
             except Exception as exc:
                 last_exc = exc
-                import sys
                 last_traceback = sys.exc_info()[2]
 
-        if last_exc:
-            raise last_exc, None, last_traceback
-        else:
-            raise Exception('No Locations Found for: ' + blocks.part)
+        raise last_exc, None, last_traceback
 
-    def load_blocks(self, location, blocks, ranges, query):
-        """ Load one or more blocks of compressed cdx lines, return
-        a line iterator which decompresses and returns one line at a time,
-        bounded by query.key and query.end_key
+    def _call_locations_hedged(self, blocks, query, func, *args):
+        """ Call func(location, *args) with first location. If it has not
+        answered within the hedge delay, also call with the next location,
+        and so on, and use whichever result arrives first.
+        On failure, the next location is tried immediately
+        """
+        locations = self._get_locations(blocks, query)
+        results = Queue.Queue()
+
+        def run(location):
+            try:
+                res = self._call_location(location, func, *args)
+                results.put((True, res))
+            except Exception:
+                results.put((False, sys.exc_info()))
+
+        def start_next():
+            location = locations[len(started)]
+            started.append(location)
+            thread = threading.Thread(target=run, args=(location,))
+            thread.daemon = True
+            thread.start()
+
+        started = []
+        pending = 0
+        last_exc_info = None
+
+        while pending > 0 or len(started) < len(locations):
+            if pending == 0:
+                start_next()
+                pending += 1
+                continue
+
+            timeout = None
+            if len(started) < len(locations):
+                timeout = self.location_health.hedge_delay(
+                                self.hedge_percentile)
+
+            try:
+                success, res = results.get(timeout=timeout)
+            except Queue.Empty:
+                logging.debug('Hedging request to {0}, no response from {1}'.
+                              format(locations[len(started)], started[-1]))
+
+                self.location_health.penalize(started[-1])
+                with self.hedges_lock:
+                    self.hedges += 1
+                start_next()
+                pending += 1
+                continue
+
+            pending -= 1
+            if success:
+                return res
+
+            last_exc_info = res
+
+        raise last_exc_info[0], last_exc_info[1], last_exc_info[2]
+
+    def block_to_cdx_iter(self, blocks, ranges, query):
+        if self.hedge_percentile:
+            buffs = self.fetch_blocks(blocks, ranges, query)
+            lines = itertools.chain.from_iterable(itertools.imap(BytesIO,
+                                                                 buffs))
+            return self._bound_lines(lines, query)
+
+        return self._call_locations(blocks, query, self.load_blocks,
+                                    blocks, ranges, query)
+
+    def fetch_blocks(self, blocks, ranges, query):
+        """ Fully read and decompress a range of blocks,
+        returning a list of decompressed blocks
         """
+        if self.hedge_percentile:
+            call_func = self._call_locations_hedged
+        else:
+            call_func = self._call_locations
 
+        return call_func(blocks, query, self.read_blocks, blocks, ranges)
+
+    def read_blocks(self, location, blocks, ranges):
+        reader = self._open_blocks(location, blocks)
+        return list(self._decompress_blocks(reader, blocks, ranges))
+
+    def _open_blocks(self, location, blocks):
         if (logging.getLogger().getEffectiveLevel() <= logging.DEBUG):
             msg = 'Loading {b.count} blocks from {loc}:{b.offset}+{b.length}'
             logging.debug(msg.format(b=blocks, loc=location))
 
-        reader = self.blk_loader.load(location, blocks.offset, blocks.length)
+        return self.blk_loader.load(location, blocks.offset, blocks.length)
 
-        def decompress_block(range_):
-            decomp = gzip_decompressor()
-            buff = decomp.decompress(reader.read(range_))
-            for line in BytesIO(buff):
-                yield line
+    def _decompress_blocks(self, reader, blocks, ranges):
+        offset = blocks.offset
+        try:
+            for length in ranges:
+                decomp = gzip_decompressor()
+                buff = decomp.decompress(reader.read(length))
+
+                if self.block_cache is not None:
+                    self.block_cache.put((blocks.part, offset, length), buff)
 
-        iter_ = itertools.chain(*itertools.imap(decompress_block, ranges))
+                offset += length
+                yield buff
 
+        finally:
+            reader.close()
+
+    def load_blocks(self, location, blocks, ranges, query):
+        """ Load one or more blocks of compressed cdx lines, return
+        a line iterator which decompresses and returns one line at a time,
+        bounded by query.key and query.end_key
+        """
+
+        reader = self._open_blocks(location, blocks)
+
+        buffs = self._decompress_blocks(reader, blocks, ranges)
+        iter_ = itertools.chain.from_iterable(itertools.imap(BytesIO, buffs))
+        return self._bound_lines(iter_, query)
+
+    def _bound_lines(self, iter_, query):
+        """ Bound an iterator of cdx lines by query.key and query.end_key
+        """
         # start bound
         iter_ = linearsearch(iter_, query.key)
 
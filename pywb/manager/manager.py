@@ -13,6 +13,8 @@ from argparse import ArgumentParser, RawTextHelpFormatter
 
 from pywb.utils.loaders import load_yaml_config
 from pywb.utils.timeutils import timestamp20_now
+from pywb.utils.sparseindex import write_sparse_index
+from pywb.utils.indexcatalog import write_index_catalog
 
 from pywb import DEFAULT_CONFIG
 
@@ -118,16 +120,18 @@ directory structure expected by pywb
     def reindex(self):
         cdx_file = os.path.join(self.indexes_dir, self.DEF_INDEX_FILE)
         logging.info('Indexing ' + self.archive_dir + ' to ' + cdx_file)
-        self._cdx_index(cdx_file, [self.archive_dir])
+        self._cdx_index(cdx_file, [self.archive_dir], sparse_index=True)
+        write_index_catalog(self.indexes_dir)
 
-    def _cdx_index(self, out, input_, rel_root=None):
+    def _cdx_index(self, out, input_, rel_root=None, sparse_index=False):
         from pywb.warc.cdxindexer import write_multi_cdx_index
 
         options = dict(append_post=True,
                        cdxj=True,
                        sort=True,
                        recurse=True,
-                       rel_root=rel_root)
+                       rel_root=rel_root,
+                       sparse_index=sparse_index)
 
         write_multi_cdx_index(out, input_, **options)
 
@@ -162,6 +166,8 @@ directory structure expected by pywb
         # no existing file, so just make it the new file
         if not os.path.isfile(cdx_file):
             shutil.move(temp_file, cdx_file)
+            write_sparse_index(cdx_file)
+            write_index_catalog(self.indexes_dir)
             return
 
         merged_file = temp_file + '.merged'
@@ -180,6 +186,9 @@ directory structure expected by pywb
         #os.rename(merged_file, cdx_file)
         os.remove(temp_file)
 
+        write_sparse_index(cdx_file)
+        write_index_catalog(self.indexes_dir)
+
     def set_metadata(self, namevalue_pairs):
         metadata_yaml = os.path.join(self.curr_coll_dir, 'metadata.yaml')
         metadata = None
@@ -31,7 +31,7 @@ def _create_cdx_perms_filter(perms_checker):
         :param query: request parameters (CDXQuery)
         :param perms_checker: object implementing permission checker
         """
-        if not perms_checker.allow_url_lookup(query.key):
+        if not perms_checker.allow_url_lookup(query.url_key):
             if query.is_exact:
                 raise AccessException('Excluded')
 
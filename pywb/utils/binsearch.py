@@ -4,6 +4,7 @@ Utility functions for performing binary search over a sorted text file
 
 from collections import deque
 import itertools
+import mmap
 
 
 #=================================================================
@@ -51,12 +52,18 @@ def binsearch(reader, key, compare_func=cmp, block_size=8192):
     if min_ > 0:
         reader.readline()  # skip partial line
 
-    def gen_iter(line):
-        while line:
-            yield line.rstrip()
-            line = reader.readline()
+    return iter_lines(reader)
 
-    return gen_iter(reader.readline())
+
+#=================================================================
+def iter_lines(reader):
+    """
+    Iterate over lines from current position of reader
+    """
+    line = reader.readline()
+    while line:
+        yield line.rstrip()
+        line = reader.readline()
 
 
 #=================================================================
@@ -89,6 +96,76 @@ def linearsearch(iter_, key, prev_size=0, compare_func=cmp):
     return itertools.chain(prev_deque, iter_)
 
 
+#=================================================================
+def mmap_search_offset(mm, key, compare_func=cmp):
+    """
+    Find offset of the first line which is >= 'key' in a memory-mapped
+    sorted file. The search bisects directly on byte offsets,
+    slicing lines from the mapping rather than reading through
+    a file object.
+
+    If all lines are less than 'key', the size of the mapping is returned
+    """
+    min_ = 0
+    max_ = len(mm)
+
+    while min_ < max_:
+        mid = min_ + ((max_ - min_) / 2)
+
+        start = mm.rfind('\n', 0, mid) + 1
+        end = mm.find('\n', start)
+        if end < 0:
+            end = len(mm)
+
+        if compare_func(key, mm[start:end]) > 0:
+            min_ = end + 1
+        else:
+            max_ = start
+
+    return min(min_, len(mm))
+
+
+#=================================================================
+def mmap_iter_lines(mm, offset):
+    """
+    Iterate over lines of a memory-mapped file, starting at 'offset'
+    """
+    size = len(mm)
+
+    while offset < size:
+        end = mm.find('\n', offset)
+        if end < 0:
+            end = size
+
+        yield mm[offset:end].rstrip()
+        offset = end + 1
+
+
+#=================================================================
+def mmap_search(mm, key, prev_size=0, compare_func=cmp):
+    """
+    Perform a binary search for the first line matching 'key' directly
+    over a memory-mapped file, and return an iterator starting at
+    that line.
+
+    Up to N previous lines before the first matching line are also
+    returned, consistent with :func:`search`
+    """
+    offset = mmap_search_offset(mm, key, compare_func)
+
+    # no matches, so return empty iterator
+    if offset >= len(mm):
+        return iter([])
+
+    for _ in xrange(prev_size):
+        if offset == 0:
+            break
+
+        offset = mm.rfind('\n', 0, offset - 1) + 1
+
+    return mmap_iter_lines(mm, offset)
+
+
 #=================================================================
 def search(reader, key, prev_size=0, compare_func=cmp, block_size=8192):
     """
@@ -98,7 +175,13 @@ def search(reader, key, prev_size=0, compare_func=cmp, block_size=8192):
 
     When performin_g linear search, keep track of up to N previous lines before
     first matching line.
+
+    If 'reader' is a memory-mapped file, the search is performed
+    directly over the mapping with :func:`mmap_search`
     """
+    if isinstance(reader, mmap.mmap):
+        return mmap_search(reader, key, prev_size, compare_func)
+
     iter_ = binsearch(reader, key, compare_func, block_size)
     iter_ = linearsearch(iter_,
                          key, prev_size=prev_size,
@@ -107,13 +190,35 @@ def search(reader, key, prev_size=0, compare_func=cmp, block_size=8192):
 
 
 #=================================================================
-def iter_range(reader, start, end, prev_size=0):
+def search_from_offset(reader, key, offset, prev_size=0, compare_func=cmp):
+    """
+    Perform a linear search for a specified key, starting at a known line
+    'offset' (eg. from a sparse index) instead of a binary search.
+
+    The offset must be the start of a line at or before the first
+    matching line. Previous lines are only tracked from the offset onward.
+    """
+    reader.seek(offset)
+    return linearsearch(iter_lines(reader),
+                        key, prev_size=prev_size,
+                        compare_func=compare_func)
+
+
+#=================================================================
+def iter_range(reader, start, end, prev_size=0, start_offset=None):
     """
     Creates an iterator which iterates over lines where
     start <= line < end (end exclusive)
+
+    If 'start_offset' is specified, the search begins
+    at that offset instead of performing a binary search
     """
 
-    iter_ = search(reader, start, prev_size=prev_size)
+    if start_offset is not None and not isinstance(reader, mmap.mmap):
+        iter_ = search_from_offset(reader, start, start_offset,
+                                   prev_size=prev_size)
+    else:
+        iter_ = search(reader, start, prev_size=prev_size)
 
     end_iter = itertools.takewhile(
         lambda line: line < end,
@@ -122,6 +227,106 @@ def iter_range(reader, start, end, prev_size=0):
     return end_iter
 
 
+#=================================================================
+def find_line_offset(reader, key, start_offset=None, compare_func=cmp,
+                     block_size=8192):
+    """
+    Find the offset of the first line which is >= 'key', or the size
+    of the file if all lines are less than 'key'.
+
+    If 'start_offset' is specified, a linear search is performed from
+    that offset (which must be the start of a line at or before the
+    first matching line) instead of a binary search
+    """
+    if isinstance(reader, mmap.mmap):
+        return mmap_search_offset(reader, key, compare_func)
+
+    if start_offset is None:
+        offset = binsearch_offset(reader, key, compare_func, block_size)
+        reader.seek(offset)
+
+        if offset > 0:
+            offset += len(reader.readline())  # skip partial line
+    else:
+        offset = start_offset
+        reader.seek(offset)
+
+    for line in iter(reader.readline, ''):
+        if compare_func(line.rstrip(), key) >= 0:
+            break
+
+        offset += len(line)
+
+    return offset
+
+
+#=================================================================
+def iter_lines_reverse(reader, offset, block_size=8192):
+    """
+    Iterate over lines of a file in reverse order, starting with the
+    line ending just before 'offset'. The file is read backwards
+    in 'block_size' chunks
+    """
+    if isinstance(reader, mmap.mmap):
+        return mmap_iter_lines_reverse(reader, offset)
+
+    return _iter_file_lines_reverse(reader, offset, block_size)
+
+
+def _iter_file_lines_reverse(reader, offset, block_size):
+    partial = ''
+
+    while offset > 0:
+        read_size = min(block_size, offset)
+        offset -= read_size
+
+        reader.seek(offset)
+        lines = (reader.read(read_size) + partial).split('\n')
+
+        # first line may be incomplete, unless at start of file
+        partial = lines[0]
+
+        for line in reversed(lines[1:]):
+            if line:
+                yield line.rstrip()
+
+    if partial:
+        yield partial.rstrip()
+
+
+#=================================================================
+def mmap_iter_lines_reverse(mm, offset):
+    """
+    Iterate over lines of a memory-mapped file in reverse order,
+    starting with the line ending just before 'offset'
+    """
+    end = min(offset, len(mm))
+
+    while end > 0:
+        start = mm.rfind('\n', 0, end - 1) + 1
+        line = mm[start:end].rstrip()
+        if line:
+            yield line
+
+        end = start
+
+
+#=================================================================
+def iter_range_reverse(reader, start, end, end_offset=None):
+    """
+    Creates an iterator which iterates, in reverse order, over lines where
+    start <= line < end (end exclusive)
+
+    If 'end_offset' is specified, the search for the end of the range
+    begins at that offset instead of performing a binary search
+    """
+    offset = find_line_offset(reader, end, start_offset=end_offset)
+
+    return itertools.takewhile(
+        lambda line: line >= start,
+        iter_lines_reverse(reader, offset))
+
+
 #=================================================================
 def iter_prefix(reader, key):
     """
@@ -0,0 +1,253 @@
+"""
+Process-wide pool of shared, read-only file descriptors.
+
+Each file is opened once and its descriptor shared by all readers (and
+threads). Each reader keeps its own position and buffer, and reads at
+that position with the descriptor locked, so that readers never move
+the position of another reader.
+
+At most ``max_handles`` descriptors are kept open: the least recently
+used is closed when another file is opened, and a descriptor is closed
+when its file is replaced or changed. A reader of a closed descriptor
+reopens it on its next read, unless the file has changed since the
+reader was opened.
+"""
+
+try:  # pragma: no cover
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    from ordereddict import OrderedDict
+
+import errno
+import io
+import os
+import stat
+import threading
+
+
+#=================================================================
+class SharedFile(object):
+    """
+    A single read-only file descriptor, read concurrently with
+    :meth:`pread` until closed by the pool.
+
+    ``version`` is the ``(inode, mtime, size)`` of the file when opened
+    """
+    def __init__(self, filename, version):
+        self.filename = filename
+        self.version = version
+        self.fd = os.open(filename, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        self.lock = threading.Lock()
+
+    def pread(self, length, offset):
+        """ Read up to ``length`` bytes at ``offset``, or None if closed
+        """
+        # no os.pread in python 2, position set and read under lock
+        with self.lock:
+            if self.fd is None:
+                return None
+
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, length)
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+#=================================================================
+class PooledFileIO(io.RawIOBase):
+    """
+    Unbuffered reader of a file in a :class:`FileHandlePool`, with its
+    own position. Wrapped in an ``io.BufferedReader`` by the pool
+    """
+    # checked by the buffered reader on each read, a plain attribute
+    # is much faster than the inherited property
+    closed = False
+
+    def __init__(self, pool, shared):
+        super(PooledFileIO, self).__init__()
+        self.pool = pool
+        self.shared = shared
+        self.name = shared.filename
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=0):
+        self._checkClosed()
+
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += self.shared.version[2]
+
+        if offset < 0:
+            raise IOError(errno.EINVAL, 'Invalid argument')
+
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        self._checkClosed()
+        return self.pos
+
+    def readinto(self, b):
+        self._checkClosed()
+
+        buff = self.shared.pread(len(b), self.pos)
+
+        # descriptor closed by pool, reopen same file
+        while buff is None:
+            shared = self.pool.get(self.name)
+            if shared.version != self.shared.version:
+                raise IOError(errno.ESTALE, 'File changed since opened',
+                              self.name)
+
+            self.shared = shared
+            buff = shared.pread(len(b), self.pos)
+
+        length = len(buff)
+        b[:length] = buff
+        self.pos += length
+        return length
+
+    def fileno(self):
+        """ The shared descriptor, eg. for ``fstat()`` or ``mmap``.
+        It is not positioned at this reader's position
+        """
+        self._checkClosed()
+
+        fd = self.shared.fd
+        if fd is None:
+            fd = self.pool.get(self.name).fd
+
+        return fd
+
+    def close(self):
+        self.closed = True
+
+
+#=================================================================
+class FileHandlePool(object):
+    """
+    Pool of at most ``max_handles`` open :class:`SharedFile` descriptors,
+    by filename.
+
+    >>> import tempfile
+    >>> pool = FileHandlePool(max_handles=1)
+    >>> with tempfile.NamedTemporaryFile() as temp:
+    ...     temp.write('abc\\ndef\\n'); temp.flush()
+    ...     with pool.open(temp.name) as fh:
+    ...         fh.readline(), fh.tell(), fh.read(2), fh.readline()
+    ...     with pool.open(temp.name) as fh:
+    ...         fh.seek(-4, 2); fh.read()
+    ('abc\\n', 4L, 'de', 'f\\n')
+    4L
+    'def\\n'
+
+    >>> sorted(pool.stats().items())
+    [('evictions', 0), ('hits', 1), ('misses', 1), ('open', 1)]
+    """
+    DEFAULT_MAX_HANDLES = 256
+
+    def __init__(self, max_handles=DEFAULT_MAX_HANDLES):
+        self.max_handles = max_handles
+
+        # open files, least recently used first
+        self.handles = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        Return the :class:`SharedFile` for ``filename``, reopening if
+        the file has been replaced or changed since opened.
+
+        Raises ``IOError``, as for ``open()``, if the file can not be opened
+        """
+        try:
+            st = os.stat(filename)
+            if stat.S_ISDIR(st.st_mode):
+                raise OSError(errno.EISDIR, os.strerror(errno.EISDIR))
+
+            version = (st.st_ino, st.st_mtime, st.st_size)
+
+            with self.lock:
+                shared = self.handles.pop(filename, None)
+                if shared:
+                    # reinsert as most recently used
+                    self.handles[filename] = shared
+
+                    if shared.version == version:
+                        self.hits += 1
+                        return shared
+
+            opened = SharedFile(filename, version)
+
+        except OSError as e:
+            raise IOError(e.errno, e.strerror, filename)
+
+        closing = []
+
+        with self.lock:
+            shared = self.handles.pop(filename, None)
+
+            if shared and shared.version == version:
+                # opened by another reader meanwhile
+                closing.append(opened)
+            else:
+                if shared:
+                    closing.append(shared)
+
+                shared = opened
+                self.misses += 1
+
+            self.handles[filename] = shared
+
+            while len(self.handles) > self.max_handles:
+                closing.append(self.handles.popitem(last=False)[1])
+                self.evictions += 1
+
+        for old in closing:
+            old.close()
+
+        return shared
+
+    def open(self, filename, buffer_size=io.DEFAULT_BUFFER_SIZE):
+        """ Return a new buffered reader of ``filename``, at the start
+        of the file
+        """
+        raw = PooledFileIO(self, self.get(filename))
+        return io.BufferedReader(raw, buffer_size)
+
+    def remove(self, filename):
+        """ Close the descriptor for ``filename``, if open
+        """
+        with self.lock:
+            shared = self.handles.pop(filename, None)
+
+        if shared:
+            shared.close()
+
+    def stats(self):
+        with self.lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions,
+                        open=len(self.handles))
+
+
+#=================================================================
+# process-wide file handle pool
+shared_file_pool = FileHandlePool()
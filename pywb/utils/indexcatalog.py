@@ -0,0 +1,375 @@
+"""
+Key-range catalog for a directory of sorted, plain-text index files
+(such as per-WARC .cdx/.cdxj files)
+
+The catalog is a single json file, stored in the index directory,
+which records, for each index file, the min and max key in the file,
+and optionally a Bloom filter of all the SURT hosts in the file.
+
+It is used to skip index files which can not contain any lines
+in the search range of a query, without opening them.
+
+An entry is recomputed if the index file has been changed since
+the catalog was written. Index files are checked for changes at most
+every few seconds, not on every query.
+"""
+
+from hashlib import md5
+from array import array
+
+import base64
+import json
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+
+
+CATALOG_FILENAME = 'cdx-catalog.json'
+
+INDEX_EXTS = ('.cdx', '.cdxj')
+
+
+#=================================================================
+def is_index_catalog(filename):
+    """ Return True if filename is an index catalog
+
+    >>> is_index_catalog('/path/to/indexes/cdx-catalog.json')
+    True
+
+    >>> is_index_catalog('/path/to/indexes/index.cdxj')
+    False
+    """
+    return os.path.basename(filename) == CATALOG_FILENAME
+
+
+#=================================================================
+def _line_key(line):
+    return ' '.join(line.rstrip().split(' ', 2)[:2])
+
+
+def _line_host(line):
+    """ Return SURT host of the urlkey of a line, if any
+
+    >>> _line_host('com,example)/path 20140101000000 {}')
+    'com,example'
+
+    >>> _line_host('example.com/path 20140101000000 {}')
+    """
+    urlkey = line.split(' ', 1)[0]
+    host, sep, _ = urlkey.partition(')')
+    if not sep:
+        return None
+
+    return host
+
+
+def _query_host(key, end_key):
+    """ Return SURT host, if the range key -> end_key is limited
+    to a single host (exact, prefix and host queries)
+
+    >>> _query_host('com,example)/path', 'com,example)/path!')
+    'com,example'
+
+    >>> _query_host('com,example)/', 'com,example*')
+    'com,example'
+
+    # domain query covers subdomains
+    >>> _query_host('com,example)/', 'com,example-')
+    """
+    host = _line_host(key)
+    if not host:
+        return None
+
+    if end_key.startswith(host + ')') or end_key == host + '*':
+        return host
+
+    return None
+
+
+#=================================================================
+class BloomFilter(object):
+    """
+    Simple Bloom filter, using double hashing from a single md5
+
+    >>> bloom = BloomFilter.create(['com,example', 'org,iana'])
+    >>> 'com,example' in bloom, 'org,iana' in bloom, 'net,other' in bloom
+    (True, True, False)
+
+    >>> bloom = BloomFilter.from_dict(json.loads(json.dumps(bloom.to_dict())))
+    >>> 'com,example' in bloom, 'net,other' in bloom
+    (True, False)
+    """
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+
+        if bits is None:
+            bits = array('B', [0]) * ((num_bits + 7) // 8)
+
+        self.bits = bits
+
+    @staticmethod
+    def create(items, error_rate=0.01):
+        items = set(items)
+        n = max(len(items), 1)
+
+        num_bits = int(math.ceil(-n * math.log(error_rate) /
+                                 (math.log(2) ** 2)))
+        num_hashes = max(int(round(num_bits / float(n) * math.log(2))), 1)
+
+        bloom = BloomFilter(num_bits, num_hashes)
+        for item in items:
+            bloom.add(item)
+
+        return bloom
+
+    def _offsets(self, item):
+        h1, h2 = struct.unpack('<QQ', md5(item).digest())
+        for i in xrange(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item):
+        for offset in self._offsets(item):
+            self.bits[offset >> 3] |= (1 << (offset & 7))
+
+    def __contains__(self, item):
+        for offset in self._offsets(item):
+            if not self.bits[offset >> 3] & (1 << (offset & 7)):
+                return False
+
+        return True
+
+    def to_dict(self):
+        return dict(num_bits=self.num_bits,
+                    num_hashes=self.num_hashes,
+                    bits=base64.b64encode(self.bits.tostring()))
+
+    @staticmethod
+    def from_dict(data):
+        bits = array('B', base64.b64decode(data['bits']))
+        return BloomFilter(data['num_bits'], data['num_hashes'], bits)
+
+
+#=================================================================
+class CatalogEntry(object):
+    """ Key range (and optional host filter) of a single index file
+    """
+    def __init__(self, mtime, size, min_key, max_key, hosts=None):
+        self.mtime = mtime
+        self.size = size
+        self.min_key = min_key
+        self.max_key = max_key
+        self.hosts = hosts
+
+    @staticmethod
+    def compute(filename, with_hosts=True):
+        stat = os.stat(filename)
+
+        min_key = None
+        max_key = None
+        hosts = set() if with_hosts else None
+
+        with open(filename, 'rb') as fh:
+            for line in fh:
+                if min_key is None:
+                    min_key = _line_key(line)
+
+                if with_hosts:
+                    host = _line_host(line)
+                    if host:
+                        hosts.add(host)
+
+                last_line = line
+
+        if min_key is not None:
+            max_key = _line_key(last_line)
+
+        if with_hosts:
+            hosts = BloomFilter.create(hosts)
+
+        return CatalogEntry(stat.st_mtime, stat.st_size,
+                            min_key, max_key, hosts)
+
+    def is_current(self, stat):
+        return self.mtime == stat.st_mtime and self.size == stat.st_size
+
+    def may_contain(self, key, end_key):
+        """ Return False if this index file can not contain
+        any lines in the range key -> end_key
+        """
+        # empty file
+        if self.min_key is None:
+            return False
+
+        if self.min_key >= end_key:
+            return False
+
+        # only line prefix stored, so key may also match if
+        # the max_key is a prefix of key
+        if self.max_key < key and not key.startswith(self.max_key):
+            return False
+
+        if self.hosts is not None:
+            host = _query_host(key, end_key)
+            if host and host not in self.hosts:
+                return False
+
+        return True
+
+    def to_dict(self):
+        data = dict(mtime=self.mtime,
+                    size=self.size,
+                    min_key=self.min_key,
+                    max_key=self.max_key)
+
+        if self.hosts is not None:
+            data['hosts'] = self.hosts.to_dict()
+
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        hosts = data.get('hosts')
+        if hosts:
+            hosts = BloomFilter.from_dict(hosts)
+
+        min_key = data['min_key']
+        max_key = data['max_key']
+        if min_key is not None:
+            min_key = min_key.encode('utf-8')
+            max_key = max_key.encode('utf-8')
+
+        return CatalogEntry(data['mtime'], data['size'],
+                            min_key, max_key, hosts)
+
+
+#=================================================================
+class IndexCatalog(object):
+    """ Catalog of all index files in a single directory.
+
+    Entries for files which have changed since the catalog was written
+    are recomputed (in memory only) on first use. Each file is checked
+    for changes at most once every ``check_interval`` secs
+    """
+    DEFAULT_CHECK_INTERVAL = 2
+
+    def __init__(self, dirname, check_interval=DEFAULT_CHECK_INTERVAL):
+        self.dirname = dirname
+        self.filename = os.path.join(dirname, CATALOG_FILENAME)
+        self.with_hosts = True
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        # time each entry was last checked against its file
+        self.check_interval = check_interval
+        self.checked = {}
+
+    def exists(self):
+        return os.path.isfile(self.filename)
+
+    def load(self):
+        with open(self.filename, 'rb') as fh:
+            data = json.load(fh)
+
+        self.with_hosts = data.get('hosts', True)
+
+        self.entries = dict((str(name), CatalogEntry.from_dict(entry))
+                            for name, entry in data['files'].iteritems())
+        return self
+
+    def save(self):
+        files = dict((name, entry.to_dict())
+                     for name, entry in self.entries.iteritems())
+
+        # unique temp file, in case of concurrent updates
+        with tempfile.NamedTemporaryFile(dir=self.dirname,
+                                         prefix=CATALOG_FILENAME + '.',
+                                         suffix='.tmp',
+                                         delete=False) as fh:
+            json.dump(dict(hosts=self.with_hosts, files=files), fh)
+
+        os.rename(fh.name, self.filename)
+
+    def update(self, with_hosts=True):
+        """ Compute entries for all index files in the directory
+        which are new or have changed, and drop removed files
+        """
+        if with_hosts != self.with_hosts:
+            self.entries = {}
+            self.with_hosts = with_hosts
+
+        entries = {}
+        for name in os.listdir(self.dirname):
+            if not name.endswith(INDEX_EXTS):
+                continue
+
+            entries[name] = self._get_current(name)
+
+        self.entries = entries
+        return self
+
+    def _get_current(self, name):
+        full_path = os.path.join(self.dirname, name)
+        stat = os.stat(full_path)
+
+        entry = self.entries.get(name)
+        if entry and entry.is_current(stat):
+            return entry
+
+        return CatalogEntry.compute(full_path, self.with_hosts)
+
+    def get_entry(self, filename):
+        """ Return up-to-date entry for index file ``filename``
+        """
+        name = os.path.basename(filename)
+        now = time.time()
+
+        entry = self.entries.get(name)
+        if entry and now - self.checked.get(name, 0) < self.check_interval:
+            return entry
+
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+
+        if entry and entry.is_current(stat):
+            self.checked[name] = now
+            return entry
+
+        with self.lock:
+            logging.debug('Updating catalog entry for changed file: ' +
+                          filename)
+            entry = CatalogEntry.compute(filename, self.with_hosts)
+            self.entries[name] = entry
+            self.checked[name] = now
+
+        return entry
+
+    def may_contain(self, filename, key, end_key):
+        entry = self.get_entry(filename)
+        if not entry:
+            return True
+
+        return entry.may_contain(key, end_key)
+
+
+#=================================================================
+def write_index_catalog(dirname, with_hosts=True):
+    """ Write or update the index catalog for directory ``dirname``
+    """
+    catalog = IndexCatalog(dirname)
+    if catalog.exists():
+        try:
+            catalog.load()
+        except Exception:
+            logging.warn('Rebuilding invalid index catalog: ' +
+                         catalog.filename)
+
+    catalog.update(with_hosts)
+    catalog.save()
+    return catalog.filename
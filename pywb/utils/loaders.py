@@ -13,6 +13,8 @@ import time
 import pkg_resources
 from io import open, BytesIO
 
+from filepool import shared_file_pool
+
 try:
     from boto import connect_s3
     s3_avail = True
@@ -214,7 +216,11 @@ class LocalFileLoader(object):
 
         try:
             # first, try as file
-            afile = open(url, 'rb')
+            # ranged reads (records, blocks) from the shared pool of files
+            if offset > 0 or length >= 0:
+                afile = shared_file_pool.open(url)
+            else:
+                afile = open(url, 'rb')
 
         except IOError:
             if file_only:
@@ -0,0 +1,134 @@
+"""
+Thread-safe, size-bounded LRU cache
+"""
+
+try:  # pragma: no cover
+    from collections import OrderedDict
+except ImportError:  # pragma: no cover
+    from ordereddict import OrderedDict
+
+import threading
+
+
+#=================================================================
+class LRUCache(object):
+    """
+    LRU cache bounded by the total size of all values, as computed
+    by ``sizeof`` (default: ``len()`` of each value)
+
+    Keeps counters of hits, misses and evictions. If set,
+    ``on_evict(key, value)`` is called for each evicted entry
+
+    >>> cache = LRUCache(10)
+    >>> cache.put('a', '12345')
+    >>> cache.put('b', '1234')
+    >>> cache.get('a')
+    '12345'
+
+    # b is least recently used, evicted
+    >>> cache.put('c', '12')
+    >>> cache.get('b')
+
+    >>> sorted(cache.keys()), cache.size
+    (['a', 'c'], 7)
+
+    # value larger than cache is not stored
+    >>> cache.put('d', '12345678901')
+    >>> 'd' in cache
+    False
+
+    >>> sorted(cache.stats().items())
+    [('count', 2), ('evictions', 1), ('hits', 1), ('misses', 1), ('size', 7)]
+    """
+    def __init__(self, max_size, sizeof=len, on_evict=None):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, size = self.cache.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # reinsert as most recently used
+            self.cache[key] = (value, size)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """ Return value for key, without updating recent use or counters
+        """
+        with self.lock:
+            try:
+                return self.cache[key][0]
+            except KeyError:
+                return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+
+        evicted = []
+
+        with self.lock:
+            existing = self.cache.pop(key, None)
+            if existing:
+                self.size -= existing[1]
+
+            self.cache[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                evict_key, (evict_value, evict_size) = \
+                    self.cache.popitem(last=False)
+                self.size -= evict_size
+                self.evictions += 1
+                evicted.append((evict_key, evict_value))
+
+        if self.on_evict:
+            for evict_key, evict_value in evicted:
+                self.on_evict(evict_key, evict_value)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            try:
+                value, size = self.cache.pop(key)
+            except KeyError:
+                return default
+
+            self.size -= size
+            return value
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.size = 0
+
+    def keys(self):
+        with self.lock:
+            return self.cache.keys()
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def stats(self):
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions,
+                    count=len(self.cache),
+                    size=self.size)
@@ -0,0 +1,62 @@
+"""
+Shared read-only memory mappings of local files.
+
+A single mapping is kept per file for each process and is remapped
+when the file's modification time or size changes.
+"""
+
+import mmap
+import os
+import threading
+
+
+#=================================================================
+class MMapCache(object):
+    """
+    Cache of read-only :class:`mmap.mmap` objects, keyed by filename.
+
+    Mappings are shared between all callers (and threads), so callers
+    must only slice or search the mapping, never seek() or readline()
+    """
+    def __init__(self):
+        self.mappings = {}
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """
+        Return a read-only mapping for ``filename``, reloading
+        if the file has changed since last mapped.
+
+        Returns None for an empty file, which can not be mapped
+        """
+        stat = os.stat(filename)
+        version = (stat.st_mtime, stat.st_size)
+
+        entry = self.mappings.get(filename)
+        if entry and entry[0] == version:
+            return entry[1]
+
+        with self.lock:
+            entry = self.mappings.get(filename)
+            if entry and entry[0] == version:
+                return entry[1]
+
+            if stat.st_size == 0:
+                mm = None
+            else:
+                with open(filename, 'rb') as fh:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+            # previous mapping, if any, is closed when no longer referenced
+            # by any in-progress iterators
+            self.mappings[filename] = (version, mm)
+            return mm
+
+    def remove(self, filename):
+        with self.lock:
+            self.mappings.pop(filename, None)
+
+
+#=================================================================
+# process-wide mmap cache
+shared_mmap_cache = MMapCache()
@@ -0,0 +1,243 @@
+"""
+Sparse block index for sorted, plain-text index files (such as .cdx/.cdxj)
+
+The sparse index is a small sidecar file, stored alongside the index
+(eg. ``index.cdxj.idx``), which records the key of every N-th line
+along with the byte offset of that line. Each line in the sidecar is::
+
+    <key>\\t<offset>
+
+where the key is the first two space-delimited fields of the indexed line
+(the urlkey and timestamp for cdx). The first line of the sidecar records
+the size and mtime of the index when the sidecar was written::
+
+    !index\t<size>\t<mtime>
+
+The sidecar is only used while the index still has the same size and mtime.
+
+The sidecar is loaded into memory once, and used to find a starting
+offset with an in-memory bisect, followed by a single seek and a short
+linear scan in the index itself.
+
+The keys also split the index into blocks of about the same number of
+lines, for paging. If there is no sidecar, :class:`SampledBlockKeys`
+splits a range of the index into blocks of the same number of bytes.
+"""
+
+from filepool import shared_file_pool
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+import logging
+import os
+import tempfile
+
+
+SPARSE_INDEX_EXT = '.idx'
+
+SPARSE_INDEX_HEADER = '!index'
+
+DEFAULT_INTERVAL = 512
+
+
+#=================================================================
+def sparse_index_filename(filename):
+    return filename + SPARSE_INDEX_EXT
+
+
+#=================================================================
+def is_sparse_index(filename):
+    """ Return True if filename appears to be a sparse index sidecar
+    for a .cdx or .cdxj file
+
+    >>> is_sparse_index('index.cdxj.idx')
+    True
+
+    >>> is_sparse_index('zipnum.idx')
+    False
+    """
+    if not filename.endswith(SPARSE_INDEX_EXT):
+        return False
+
+    return filename[:-len(SPARSE_INDEX_EXT)].endswith(('.cdx', '.cdxj'))
+
+
+#=================================================================
+def _line_key(line):
+    return ' '.join(line.rstrip().split(' ', 2)[:2])
+
+
+#=================================================================
+def write_sparse_index(filename, interval=DEFAULT_INTERVAL):
+    """ Write a sparse index sidecar for sorted index ``filename``,
+    recording the key and offset of every ``interval`` lines.
+
+    The sidecar is written to a temp file first and then moved into place
+    """
+    idx_filename = sparse_index_filename(filename)
+    idx_dir, idx_name = os.path.split(idx_filename)
+
+    offset = 0
+    with open(filename, 'rb') as fh:
+        stat = os.fstat(fh.fileno())
+
+        # unique temp file, in case of concurrent updates
+        with tempfile.NamedTemporaryFile(dir=idx_dir or '.',
+                                         prefix=idx_name + '.',
+                                         suffix='.tmp',
+                                         delete=False) as out:
+            out.write('%s\t%d\t%r\n' % (SPARSE_INDEX_HEADER,
+                                         stat.st_size, stat.st_mtime))
+
+            for lineno, line in enumerate(iter(fh.readline, '')):
+                if lineno % interval == 0:
+                    out.write(_line_key(line) + '\t' + str(offset) + '\n')
+
+                offset += len(line)
+
+    os.rename(out.name, idx_filename)
+    return idx_filename
+
+
+#=================================================================
+class SparseIndex(object):
+    """ In-memory sparse index, with parallel arrays of keys
+    and line offsets, and the ``(size, mtime)`` of the index
+    it was written for, if known
+    """
+    def __init__(self, keys, offsets, indexed_version=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.indexed_version = indexed_version
+
+    @staticmethod
+    def load(idx_filename):
+        keys = []
+        offsets = array('l')
+        indexed_version = None
+
+        with open(idx_filename, 'rb') as fh:
+            for line in fh:
+                if line.startswith(SPARSE_INDEX_HEADER + '\t'):
+                    _, size, mtime = line.rstrip('\n').split('\t')
+                    indexed_version = (int(size), float(mtime))
+                    continue
+
+                key, offset = line.rstrip('\n').rsplit('\t', 1)
+                keys.append(key)
+                offsets.append(int(offset))
+
+        return SparseIndex(keys, offsets, indexed_version)
+
+    def find_offset(self, key):
+        """ Return offset of a line which is guaranteed to be before
+        (or at) the first line >= key
+
+        Since only a prefix of each line is stored, entries whose
+        key is a prefix of the search key may also match and are skipped
+        """
+        i = bisect_left(self.keys, key) - 1
+
+        while i > 0 and key.startswith(self.keys[i]):
+            i -= 1
+
+        if i < 0:
+            return 0
+
+        return self.offsets[i]
+
+    def block_keys(self, key, end_key):
+        """ Return keys which split the lines in the range
+        key -> end_key into blocks
+
+        >>> SparseIndex(['a 1', 'b 1', 'c 1', 'd 1'], []).block_keys('b', 'd')
+        ['b 1', 'c 1']
+        """
+        return self.keys[bisect_right(self.keys, key):
+                         bisect_left(self.keys, end_key)]
+
+
+#=================================================================
+class SampledBlockKeys(object):
+    """ Keys which split the lines between ``start_offset``
+    and ``end_offset`` of index ``filename`` into blocks of
+    ``block_size`` bytes, for when there is no sparse index.
+
+    Each key is read on access, with a single seek, from the first
+    line starting after the block offset
+    """
+    def __init__(self, filename, start_offset, end_offset, end_key,
+                 block_size):
+        self.filename = filename
+        self.start_offset = start_offset
+        self.end_offset = end_offset
+        self.end_key = end_key
+        self.block_size = block_size
+
+    def __len__(self):
+        size = self.end_offset - self.start_offset
+        return max((size - 1) // self.block_size, 0)
+
+    def __getitem__(self, i):
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+
+        offset = self.start_offset + (i + 1) * self.block_size
+
+        with shared_file_pool.open(self.filename) as fh:
+            # skip to start of next line
+            fh.seek(offset - 1)
+            fh.readline()
+
+            if fh.tell() >= self.end_offset:
+                return self.end_key
+
+            return _line_key(fh.readline())
+
+
+#=================================================================
+class SparseIndexLoader(object):
+    """ Load and cache the sparse index for a single index file.
+    The sidecar is reloaded if it changes and is ignored if
+    missing or if the index has changed since the sidecar was written.
+
+    For a sidecar without a header, the index must be strictly older
+    than the sidecar, as an index rewritten within the same second
+    may have the same mtime
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.idx_filename = sparse_index_filename(filename)
+        self.version = None
+        self.index = None
+        self.stale = False
+
+    def get(self):
+        try:
+            idx_stat = os.stat(self.idx_filename)
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+
+        version = (idx_stat.st_mtime, idx_stat.st_size)
+        if version != self.version:
+            self.index = SparseIndex.load(self.idx_filename)
+            self.version = version
+            self.stale = False
+
+        if self.index.indexed_version:
+            stale = self.index.indexed_version != (stat.st_size,
+                                                   stat.st_mtime)
+        else:
+            stale = stat.st_mtime >= idx_stat.st_mtime
+
+        if stale:
+            if not self.stale:
+                logging.debug('Ignoring stale sparse index: ' +
+                              self.idx_filename)
+                self.stale = True
+            return None
+
+        self.stale = False
+        return self.index
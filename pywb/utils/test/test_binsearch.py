@@ -68,29 +68,125 @@ org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 I
 org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
 
 
+# mmap search
+>>> print_binsearch_results('org,iana)/domains/root/db', iter_exact, use_mmap=True)
+org,iana)/domains/root/db 20140126200927 http://www.iana.org/domains/root/db/ text/html 302 3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ - - 446 671278 iana.warc.gz
+org,iana)/domains/root/db 20140126200928 http://www.iana.org/domains/root/db text/html 200 DHXA725IW5VJJFRTWBQT6BEZKRE7H57S - - 18365 672225 iana.warc.gz
+
+>>> print_binsearch_results('org,iaana)/', iter_exact, use_mmap=True)
+
+>>> print_binsearch_results_range('org,iana)/about', 'org,iana)/about!', iter_range, prev_size=2, use_mmap=True)
+org,iana)/_js/2013.1/jquery.js 20140126201248 http://www.iana.org/_js/2013.1/jquery.js warc/revisit - AAW2RS7JB7HTF666XNZDQYJFA6PDQBPO - - 544 765491 iana.warc.gz
+org,iana)/_js/2013.1/jquery.js 20140126201307 https://www.iana.org/_js/2013.1/jquery.js warc/revisit - AAW2RS7JB7HTF666XNZDQYJFA6PDQBPO - - 543 778507 iana.warc.gz
+org,iana)/about 20140126200706 http://www.iana.org/about text/html 200 6G77LZKFAVKH4PCWWKMW6TRJPSHWUBI3 - - 2962 483588 iana.warc.gz
+
+>>> print_binsearch_results_range('a)/', 'org,iana)/_css/2013.1/fonts/inconsolata.otf ', iter_range, use_mmap=True)
+org,iana)/ 20140126200624 http://www.iana.org/ text/html 200 OSSAPWJ23L56IYVRW3GFEAR4MCJMGPTB - - 2258 334 iana.warc.gz
+
+>>> print_binsearch_results_range('z)/', 'z-', iter_range, use_mmap=True)
+
+>>> print_binsearch_results_range('org,iana)/protocols', 'z-', iter_range, use_mmap=True)
+org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 IRUJZEUAXOUUG224ZMI4VWTUPJX6XJTT - - 63663 496277 iana.warc.gz
+org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
+
+# Reverse Range Search
+>>> print_binsearch_results_range('org,iana)/about', 'org,iana)/domains', iter_range_reverse)
+org,iana)/dnssec 20140126201307 https://www.iana.org/dnssec text/html 200 PHLRSX73EV3WSZRFXMWDO6BRKTVUSASI - - 2278 773766 iana.warc.gz
+org,iana)/dnssec 20140126201306 http://www.iana.org/dnssec text/html 302 3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ - - 442 772827 iana.warc.gz
+org,iana)/about/performance/ietf-statistics 20140126200804 http://www.iana.org/about/performance/ietf-statistics text/html 302 HNYDN7XRX46RQTT2OFIWXKEYMZQAJWHD - - 582 581890 iana.warc.gz
+org,iana)/about/performance/ietf-draft-status 20140126200815 http://www.iana.org/about/performance/ietf-draft-status text/html 302 Y7CTA2QZUSCDTJCSECZNSPIBLJDO7PJJ - - 584 596566 iana.warc.gz
+org,iana)/about 20140126200706 http://www.iana.org/about text/html 200 6G77LZKFAVKH4PCWWKMW6TRJPSHWUBI3 - - 2962 483588 iana.warc.gz
+
+>>> print_binsearch_results_range('org,iana)/protocols', 'z-', iter_range_reverse, use_mmap=True)
+org,iana)/time-zones 20140126200737 http://www.iana.org/time-zones text/html 200 4Z27MYWOSXY2XDRAJRW7WRMT56LXDD4R - - 2449 569675 iana.warc.gz
+org,iana)/protocols 20140126200715 http://www.iana.org/protocols text/html 200 IRUJZEUAXOUUG224ZMI4VWTUPJX6XJTT - - 63663 496277 iana.warc.gz
+
+>>> print_binsearch_results_range('z)/', 'z-', iter_range_reverse)
+
+# shared mapping, reused until file changes
+>>> shared_mmap_cache.get(test_cdx_dir + 'iana.cdx') is shared_mmap_cache.get(test_cdx_dir + 'iana.cdx')
+True
+
+
 """
 
 
 #=================================================================
 import os
 from pywb.utils.binsearch import iter_prefix, iter_exact, iter_range
+from pywb.utils.binsearch import iter_range_reverse, iter_lines_reverse
+from pywb.utils.binsearch import find_line_offset
+from pywb.utils.mmapcache import shared_mmap_cache
 
 from pywb import get_test_dir
 
 #test_cdx_dir = os.path.dirname(os.path.realpath(__file__)) + '/../sample-data/'
 test_cdx_dir = get_test_dir() + 'cdx/'
 
-def print_binsearch_results(key, iter_func):
+def print_binsearch_results(key, iter_func, use_mmap=False):
+    if use_mmap:
+        cdx = shared_mmap_cache.get(test_cdx_dir + 'iana.cdx')
+        for line in iter_func(cdx, key):
+            print line
+        return
+
     with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
         for line in iter_func(cdx, key):
             print line
 
-def print_binsearch_results_range(key, end_key, iter_func, prev_size=0):
+def print_binsearch_results_range(key, end_key, iter_func, use_mmap=False,
+                                  **kwargs):
+    if use_mmap:
+        cdx = shared_mmap_cache.get(test_cdx_dir + 'iana.cdx')
+        for line in iter_func(cdx, key, end_key, **kwargs):
+            print line
+        return
+
     with open(test_cdx_dir + 'iana.cdx', 'rb') as cdx:
-        for line in iter_func(cdx, key, end_key, prev_size=prev_size):
+        for line in iter_func(cdx, key, end_key, **kwargs):
             print line
 
 
+def test_reverse_same_as_forward():
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as fh:
+        lines = [line.rstrip() for line in fh]
+
+    ranges = [(' ', 'z'),
+              ('org,iana)/', 'org,iana)/!'),
+              ('org,iana)/_css/', 'org,iana)/_css0'),
+              ('org,iana)/domains/root', 'org,iana)/domains/rootz'),
+              ('org,iana)/time-zones', 'org,iana)/time-zones!'),
+              ('a', 'b'),
+              ('z', 'zz')]
+
+    mm = shared_mmap_cache.get(test_cdx_dir + 'iana.cdx')
+
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as fh:
+        for start, end in ranges:
+            expected = [line for line in lines if start <= line < end]
+            expected.reverse()
+
+            assert list(iter_range_reverse(fh, start, end)) == expected
+            assert list(iter_range_reverse(mm, start, end)) == expected
+
+def test_reverse_small_blocks():
+    with open(test_cdx_dir + 'iana.cdx', 'rb') as fh:
+        lines = [line.rstrip() for line in fh]
+
+        fh.seek(0, 2)
+        size = fh.tell()
+
+        for block_size in [1, 7, 100, 1000]:
+            assert list(iter_lines_reverse(fh, size, block_size)) == lines[::-1]
+
+        # exact offsets with a linear search
+        offset = find_line_offset(fh, 'org,iana)/about')
+        assert find_line_offset(fh, 'org,iana)/about', start_offset=0) == offset
+
+        fh.seek(offset)
+        assert fh.readline().startswith('org,iana)/about ')
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -0,0 +1,163 @@
+from pywb.utils.filepool import FileHandlePool
+from pywb.utils.binsearch import iter_range
+
+from pywb import get_test_dir
+
+import os
+import pytest
+import shutil
+import tempfile
+import threading
+
+
+#=================================================================
+TEST_CDX = get_test_dir() + 'cdx/iana.cdx'
+
+
+def setup_module():
+    global tmpdir
+    tmpdir = tempfile.mkdtemp()
+
+
+def teardown_module():
+    shutil.rmtree(tmpdir)
+
+
+def write_file(name, data):
+    filename = os.path.join(tmpdir, name)
+    with open(filename, 'wb') as fh:
+        fh.write(data)
+    return filename
+
+
+def test_same_as_file():
+    pool = FileHandlePool()
+
+    with open(TEST_CDX, 'rb') as fh:
+        expected = fh.readlines()
+
+    with pool.open(TEST_CDX) as fh:
+        assert list(fh) == expected
+        assert os.fstat(fh.fileno()).st_size == os.path.getsize(TEST_CDX)
+
+    # binary search over pooled reader
+    with open(TEST_CDX, 'rb') as fh:
+        expected = list(iter_range(fh, 'org,iana)/_css', 'org,iana)/_img'))
+
+    # descriptor reused, from start
+    with pool.open(TEST_CDX) as fh:
+        assert list(iter_range(fh, 'org,iana)/_css', 'org,iana)/_img')) == expected
+
+    assert pool.stats()['misses'] == 1
+    assert pool.stats()['hits'] == 1
+
+
+def test_readers_independent_position():
+    pool = FileHandlePool()
+    filename = write_file('lines.txt', ''.join('%04d\n' % i for i in xrange(1000)))
+
+    errors = []
+
+    def read_lines(start):
+        try:
+            with pool.open(filename) as fh:
+                fh.seek(start * 5)
+                for i in xrange(start, 1000):
+                    assert fh.readline() == '%04d\n' % i
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read_lines, args=(i * 100,))
+               for i in xrange(8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+    # one descriptor shared by all readers
+    stats = pool.stats()
+    assert stats['hits'] == 7
+    assert stats['misses'] == 1
+    assert stats['open'] == 1
+
+
+def test_lru_evict():
+    pool = FileHandlePool(max_handles=1)
+    file_a = write_file('a.txt', 'aaa\n')
+    file_b = write_file('b.txt', 'bbb\n')
+
+    with pool.open(file_a) as reader:
+        assert reader.read() == 'aaa\n'
+
+    with pool.open(file_b) as reader:
+        assert reader.read() == 'bbb\n'
+
+    # least recently used descriptor closed
+    assert pool.stats()['evictions'] == 1
+    assert pool.stats()['open'] == 1
+
+    with pool.open(file_a) as reader:
+        assert reader.read() == 'aaa\n'
+
+    assert pool.stats()['misses'] == 3
+
+
+def test_reopen_replaced_file():
+    pool = FileHandlePool()
+    filename = write_file('replaced.txt', 'old\n')
+
+    old_reader = pool.open(filename)
+
+    new_file = write_file('replaced.txt.tmp', 'new data\n')
+    os.rename(new_file, filename)
+
+    # descriptor of replaced file not reused
+    assert pool.open(filename).read() == 'new data\n'
+    assert pool.stats()['misses'] == 2
+    assert pool.stats()['open'] == 1
+
+    # reader of replaced file does not read the new file
+    with pytest.raises(IOError):
+        old_reader.read()
+
+
+def test_reopen_evicted():
+    pool = FileHandlePool(max_handles=1)
+    file_a = write_file('evict_a.txt', 'aaa\n')
+    file_b = write_file('evict_b.txt', 'bbb\n')
+
+    # readers not closed, descriptors still bounded
+    reader_a = pool.open(file_a)
+    reader_b = pool.open(file_b)
+    assert pool.stats()['open'] == 1
+
+    # unchanged file reopened on next read
+    assert reader_a.read() == 'aaa\n'
+    assert reader_b.read() == 'bbb\n'
+    assert pool.stats()['evictions'] == 3
+    assert pool.stats()['open'] == 1
+
+
+def test_not_found():
+    pool = FileHandlePool()
+
+    with pytest.raises(IOError):
+        pool.open(os.path.join(tmpdir, 'not_found.txt'))
+
+    with pytest.raises(IOError):
+        pool.open(tmpdir)
+
+    reader = pool.open(write_file('closed.txt', 'abc'))
+    reader.close()
+    assert reader.closed
+
+    # no use after close
+    with pytest.raises(ValueError):
+        reader.read()
+
+    with pytest.raises(ValueError):
+        reader.raw.readinto(bytearray(1))
@@ -0,0 +1,112 @@
+from pywb.utils.indexcatalog import write_index_catalog, IndexCatalog
+from pywb.utils.indexcatalog import CATALOG_FILENAME
+
+from pywb.cdx.cdxserver import CDXServer
+from pywb.cdx.query import CDXQuery
+
+from pywb import get_test_dir
+
+from mock import patch
+
+import os
+import shutil
+import tempfile
+import time
+
+
+#=================================================================
+TEST_CDX_DIR = get_test_dir() + 'cdx/'
+
+
+def setup_module():
+    global tmpdir
+    tmpdir = tempfile.mkdtemp()
+    for name in ['iana.cdx', 'example.cdx', 'dupes.cdx']:
+        shutil.copy(os.path.join(TEST_CDX_DIR, name), tmpdir)
+
+
+def teardown_module():
+    shutil.rmtree(tmpdir)
+
+
+def query(url, match_type='exact'):
+    return CDXServer(tmpdir).load_cdx(url=url, matchType=match_type,
+                                      output='text')
+
+
+def may_contain(server, url, match_type='exact'):
+    q = CDXQuery(url=url, matchType=match_type)
+    q.set_key(*server._calc_search_keys(q))
+    return sorted(os.path.basename(source.filename)
+                  for source in server.sources if source.may_contain(q))
+
+
+def test_write_catalog():
+    filename = write_index_catalog(tmpdir)
+    assert filename == os.path.join(tmpdir, CATALOG_FILENAME)
+
+    catalog = IndexCatalog(tmpdir).load()
+    assert sorted(catalog.entries.keys()) == ['dupes.cdx', 'example.cdx',
+                                              'iana.cdx']
+
+    entry = catalog.entries['example.cdx']
+    assert entry.min_key.startswith(' CDX')
+    assert entry.max_key.startswith('org,iana)/domains/example ')
+    assert 'com,example' in entry.hosts
+
+
+def test_catalog_skip_sources():
+    write_index_catalog(tmpdir)
+    server = CDXServer(tmpdir)
+
+    # catalog not loaded as a source
+    assert len(server.sources) == 3
+    assert all(source.catalog for source in server.sources)
+
+    assert may_contain(server, 'example.com') == ['dupes.cdx', 'example.cdx']
+    assert may_contain(server, 'iana.org/domains/', 'prefix') == ['example.cdx',
+                                                                  'iana.cdx']
+    assert may_contain(server, 'iana.org/numbers') == ['iana.cdx']
+    assert may_contain(server, 'iana.org/', 'domain') == ['dupes.cdx',
+                                                          'example.cdx',
+                                                          'iana.cdx']
+
+    # no host match
+    assert may_contain(server, 'example.net/') == []
+
+
+def test_catalog_same_results():
+    write_index_catalog(tmpdir)
+
+    no_catalog = CDXServer(tmpdir, config={'use_index_catalog': False})
+    assert not any(source.catalog for source in no_catalog.sources)
+
+    for url, match_type in [('example.com', 'exact'),
+                            ('iana.org/', 'domain'),
+                            ('iana.org/_css/', 'prefix')]:
+        expected = list(no_catalog.load_cdx(url=url, matchType=match_type,
+                                            output='text'))
+
+        assert list(query(url, match_type)) == expected
+
+
+def test_catalog_file_changed():
+    write_index_catalog(tmpdir)
+    server = CDXServer(tmpdir)
+
+    assert may_contain(server, 'example.co.uk/') == []
+
+    with open(os.path.join(tmpdir, 'example.cdx'), 'ab') as fh:
+        fh.write('uk,co,example)/ 20140101000000 http://example.co.uk/ ' +
+                 'text/html 200 AAA - - 100 0 example.warc.gz\n')
+
+    # files not checked for changes on every query
+    with patch('os.stat') as mock_stat:
+        assert may_contain(server, 'example.co.uk/') == []
+        assert not mock_stat.called
+
+    now = time.time() + IndexCatalog.DEFAULT_CHECK_INTERVAL
+    with patch('time.time', lambda: now):
+        assert may_contain(server, 'example.co.uk/') == ['example.cdx']
+
+    assert len(list(query('example.co.uk/'))) == 1
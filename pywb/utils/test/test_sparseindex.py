@@ -0,0 +1,107 @@
+from pywb.utils.sparseindex import write_sparse_index, SparseIndex
+from pywb.utils.sparseindex import SparseIndexLoader
+from pywb.utils.binsearch import iter_range
+
+from pywb import get_test_dir
+
+import os
+import shutil
+import tempfile
+
+
+#=================================================================
+TEST_CDX = get_test_dir() + 'cdx/iana.cdx'
+
+
+def setup_module():
+    global tmpdir
+    global cdx_file
+    tmpdir = tempfile.mkdtemp()
+    cdx_file = os.path.join(tmpdir, 'iana.cdx')
+    shutil.copy(TEST_CDX, cdx_file)
+
+
+def teardown_module():
+    shutil.rmtree(tmpdir)
+
+
+def load_range(start, end, index=None):
+    with open(cdx_file, 'rb') as fh:
+        offset = index.find_offset(start) if index else None
+        return list(iter_range(fh, start, end, start_offset=offset))
+
+
+def test_write_sparse_index():
+    idx_file = write_sparse_index(cdx_file, interval=5)
+    assert idx_file == cdx_file + '.idx'
+
+    index = SparseIndex.load(idx_file)
+
+    with open(cdx_file, 'rb') as fh:
+        num_lines = len(fh.readlines())
+
+    assert len(index.keys) == (num_lines + 4) / 5
+    assert index.offsets[0] == 0
+
+    # each offset is at start of line with matching key
+    with open(cdx_file, 'rb') as fh:
+        for key, offset in zip(index.keys, index.offsets):
+            fh.seek(offset)
+            assert fh.readline().startswith(key)
+
+
+def test_sparse_index_search():
+    index = SparseIndexLoader(cdx_file).get()
+    assert index
+
+    ranges = [('org,iana)/', 'org,iana)/!'),
+              ('org,iana)/domains', 'org,iana)/domainst'),
+              ('org,iana)/_css/2013.1/fonts/opensans-bold.ttf 20140126200912',
+               'org,iana)/_css/2013.1/fonts/opensans-bold.ttf!'),
+              ('org,iana)/time-zones', 'org,iana)/time-zonet'),
+              ('a)/', 'b)/'),
+              ('z)/', 'z-')]
+
+    for start, end in ranges:
+        assert load_range(start, end, index) == load_range(start, end)
+
+
+def test_stale_sparse_index_ignored():
+    loader = SparseIndexLoader(cdx_file)
+    assert loader.get()
+
+    idx_mtime = os.path.getmtime(cdx_file + '.idx')
+    os.utime(cdx_file, (idx_mtime + 10, idx_mtime + 10))
+
+    assert loader.get() is None
+
+    write_sparse_index(cdx_file)
+    os.utime(cdx_file + '.idx', (idx_mtime + 20, idx_mtime + 20))
+    assert loader.get()
+
+
+def test_same_mtime_sparse_index_stale():
+    loader = SparseIndexLoader(cdx_file)
+    write_sparse_index(cdx_file)
+    assert loader.get()
+
+    # rewritten with same mtime as sidecar, detected by size
+    mtime = os.path.getmtime(cdx_file + '.idx')
+    with open(cdx_file, 'ab') as fh:
+        fh.write('org,iana)/zzz 20140101000000 - - - - - - - - -\n')
+
+    os.utime(cdx_file, (mtime, mtime))
+    assert loader.get() is None
+
+    # sidecar without header, index not older than sidecar
+    with open(cdx_file + '.idx', 'rb') as fh:
+        lines = fh.readlines()[1:]
+
+    with open(cdx_file + '.idx', 'wb') as fh:
+        fh.writelines(lines)
+
+    os.utime(cdx_file + '.idx', (mtime, mtime))
+    assert loader.get() is None
+
+    os.utime(cdx_file, (mtime - 10, mtime - 10))
+    assert loader.get()
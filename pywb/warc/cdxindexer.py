@@ -21,6 +21,9 @@ from io import BytesIO
 
 from archiveiterator import DefaultRecordIter
 
+from pywb.utils.sparseindex import write_sparse_index
+from pywb.utils.indexcatalog import write_index_catalog
+
 
 #=================================================================
 class BaseCDXWriter(object):
@@ -246,6 +249,12 @@ def write_multi_cdx_index(output, inputs, **options):
                     writer = write_cdx_index(outfile, infile, filename,
                                              **options)
 
+            if options.get('sparse_index'):
+                write_sparse_index(outpath)
+
+        if options.get('index_catalog'):
+            write_index_catalog(output)
+
         return writer
 
     # write to one cdx file
@@ -268,6 +277,12 @@ def write_multi_cdx_index(output, inputs, **options):
                     for entry in entry_iter:
                         writer.write(entry, filename)
 
+        if output != '-':
+            outfile.close()
+
+            if options.get('sparse_index'):
+                write_sparse_index(output)
+
         return writer
 
 
@@ -309,7 +324,11 @@ Some examples:
 """.format(os.path.basename(sys.argv[0]))
 
     sort_help = """
-Sort the output to each file before writing to create a total ordering
+Sort the output to each file before writing to create a total ordering.
+When writing to a file or directory, a sparse block index (.idx) sidecar
+is also written for each sorted output file.
+When writing to a directory, a key-range catalog (cdx-catalog.json)
+of all the index files in the directory is also written
 """
 
     unsurt_help = """
@@ -426,6 +445,8 @@ instead of current working directory
 
     write_multi_cdx_index(cmd.output, cmd.inputs,
                           sort=cmd.sort,
+                          sparse_index=cmd.sort,
+                          index_catalog=cmd.sort,
                           surt_ordered=not cmd.unsurt,
                           include_all=cmd.allrecords,
                           append_post=cmd.postappend,
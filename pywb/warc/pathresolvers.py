@@ -1,6 +1,7 @@
 import redis
 
 from pywb.utils.binsearch import iter_exact
+from pywb.utils.filepool import shared_file_pool
 
 import urlparse
 import urllib
@@ -51,6 +52,20 @@ class RedisResolver:
         redis_val = self.redis.hget(self.key_prefix + filename, 'path')
         return [redis_val] if redis_val else []
 
+    def resolve_batch(self, filenames):
+        """ Resolve all filenames in a single pipelined round-trip,
+        returning dict of filename -> list of paths
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for filename in filenames:
+            pipe.hget(self.key_prefix + filename, 'path')
+
+        results = {}
+        for filename, redis_val in zip(filenames, pipe.execute()):
+            results[filename] = [redis_val] if redis_val else []
+
+        return results
+
     def __repr__(self):
         return "RedisResolver('{0}')".format(self.redis_url)
 
@@ -61,7 +76,7 @@ class PathIndexResolver:
         self.pathindex_file = pathindex_file
 
     def __call__(self, filename):
-        with open(self.pathindex_file, 'rb') as reader:
+        with shared_file_pool.open(self.pathindex_file) as reader:
             result = iter_exact(reader, filename, '\t')
 
             for pathline in result:
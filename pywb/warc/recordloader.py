@@ -81,7 +81,12 @@ class ArcWarcRecordLoader:
                                              decomp_type=decomp_type,
                                              block_size=self.block_size)
 
-        return self.parse_record_stream(stream)
+        # stream of the record closed by the caller, once read
+        try:
+            return self.parse_record_stream(stream)
+        except:
+            stream.close()
+            raise
 
     def parse_record_stream(self, stream,
                             statusline=None,
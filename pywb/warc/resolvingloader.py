@@ -12,7 +12,42 @@ class ResolvingLoader(object):
         self.path_resolvers = make_best_resolvers(paths)
         self.record_loader = record_loader
 
-    def __call__(self, cdx, failed_files, cdx_loader, *args):
+        # true if resolving many files at once saves lookups
+        self.batch_resolve = any(hasattr(resolver, 'resolve_batch')
+                                 for resolver in self.path_resolvers)
+
+    def resolve_all(self, cdx_list):
+        """
+        Resolve all filenames (and orig. filenames) of the cdx in
+        ``cdx_list`` up front, using a single batch lookup for resolvers
+        which support it.
+
+        Return dict of filename -> list of possible paths, in resolver order
+        """
+        filenames = []
+        for cdx in cdx_list:
+            for field in ('filename', 'orig.filename'):
+                filename = cdx.get(field)
+                if filename and filename != '-' and filename not in filenames:
+                    filenames.append(filename)
+
+        resolved_paths = dict((filename, []) for filename in filenames)
+        if not filenames:
+            return resolved_paths
+
+        for resolver in self.path_resolvers:
+            if hasattr(resolver, 'resolve_batch'):
+                results = resolver.resolve_batch(filenames)
+            else:
+                results = dict((filename, resolver(filename))
+                               for filename in filenames)
+
+            for filename in filenames:
+                resolved_paths[filename].extend(results.get(filename, []))
+
+        return resolved_paths
+
+    def __call__(self, cdx, failed_files, cdx_loader, *args, **kwargs):
         """
         Resolve headers and payload for a given capture
         In the simple case, headers and payload are in the same record.
@@ -23,7 +58,12 @@ class ResolvingLoader(object):
         orig. fields in cdx dict.
         Otherwise, call _load_different_url_payload() to get cdx index
         from a different url to find the original record.
+
+        If ``resolved_paths`` is provided (from :meth:`resolve_all`),
+        the paths are used instead of calling the path resolvers
         """
+        resolved_paths = kwargs.get('resolved_paths')
+
         has_curr = (cdx['filename'] != '-')
         #has_orig = (cdx.get('orig.filename', '-') != '-')
         orig_f = cdx.get('orig.filename')
@@ -32,7 +72,8 @@ class ResolvingLoader(object):
         # load headers record from cdx['filename'] unless it is '-' (rare)
         headers_record = None
         if has_curr:
-            headers_record = self._resolve_path_load(cdx, False, failed_files)
+            headers_record = self._resolve_path_load(cdx, False, failed_files,
+                                                     resolved_paths)
 
         # two index lookups
         # Case 1: if mimetype is still warc/revisit
@@ -49,7 +90,8 @@ class ResolvingLoader(object):
 
         # case 3: identical url revisit, load payload from orig.filename
         elif (has_orig):
-            payload_record = self._resolve_path_load(cdx, True, failed_files)
+            payload_record = self._resolve_path_load(cdx, True, failed_files,
+                                                     resolved_paths)
 
         # special case: set header to payload if old-style revisit
         # with missing header
@@ -73,7 +115,8 @@ class ResolvingLoader(object):
 
         return (headers_record.status_headers, payload_record.stream)
 
-    def _resolve_path_load(self, cdx, is_original, failed_files):
+    def _resolve_path_load(self, cdx, is_original, failed_files,
+                           resolved_paths=None):
         """
         Load specific record based on filename, offset and length
         fields in the cdx.
@@ -82,6 +125,9 @@ class ResolvingLoader(object):
         Resolve the filename to full path using specified path resolvers
 
         If failed_files list provided, keep track of failed resolve attempts
+
+        If resolved_paths dict provided, use the already resolved
+        paths for the filename, if any
         """
 
         if is_original:
@@ -101,9 +147,13 @@ class ResolvingLoader(object):
         any_found = False
         last_exc = None
         last_traceback = None
-        for resolver in self.path_resolvers:
-            possible_paths = resolver(filename)
+        if resolved_paths is not None and filename in resolved_paths:
+            all_possible_paths = [resolved_paths[filename]]
+        else:
+            all_possible_paths = (resolver(filename)
+                                  for resolver in self.path_resolvers)
 
+        for possible_paths in all_possible_paths:
             if possible_paths:
                 for path in possible_paths:
                     any_found = True
@@ -289,6 +289,32 @@ Exception: ArchiveLoadFailed
 >>> load_from_cdx_test(URL_AGNOSTIC_REVISIT_CDX, revisit_func=load_orig_bad_cdx)
 Exception: ArchiveLoadFailed
 
+# Batch Resolve
+# ==============================================================================
+>>> ResolvingLoader(test_warc_dir).batch_resolve
+False
+
+>>> resolved_paths = ResolvingLoader(test_warc_dir).resolve_all(map(CDXObject, [URL_AGNOSTIC_ORIG_CDX, BAD_ORIG_CDX, URL_AGNOSTIC_ORIG_CDX]))
+>>> sorted(resolved_paths.keys())
+['example-url-agnostic-orig.warc.gz', 'someunknown.warc.gz']
+
+>>> load_from_cdx_test(URL_AGNOSTIC_ORIG_CDX, resolved_paths=resolved_paths)
+StatusAndHeaders(protocol = 'HTTP/1.0', statusline = '200 OK', headers = [ ('Accept-Ranges', 'bytes'),
+  ('Content-Type', 'text/html; charset=UTF-8'),
+  ('Date', 'Tue, 02 Jul 2013 19:54:02 GMT'),
+  ('ETag', '"780602-4f6-4db31b2978ec0"'),
+  ('Last-Modified', 'Thu, 25 Apr 2013 16:13:23 GMT'),
+  ('Server', 'ECS (sjc/4FCE)'),
+  ('X-Cache', 'HIT'),
+  ('Content-Length', '1270'),
+  ('Connection', 'close')])
+<!doctype html>
+<html>
+
+# already resolved paths used, no other lookup
+>>> load_from_cdx_test(URL_AGNOSTIC_ORIG_CDX, resolved_paths={'example-url-agnostic-orig.warc.gz': []})
+Exception: ArchiveLoadFailed
+
 
 """
 
@@ -350,12 +376,13 @@ def load_orig_cdx(_):
 
 #==============================================================================
 def load_from_cdx_test(cdx, revisit_func=load_orig_cdx, reraise=False,
-                       failed_files=None):
+                       failed_files=None, resolved_paths=None):
     resolve_loader = ResolvingLoader(test_warc_dir)
     cdx = CDXObject(cdx)
 
     try:
-        (headers, stream) = resolve_loader(cdx, failed_files, revisit_func)
+        (headers, stream) = resolve_loader(cdx, failed_files, revisit_func,
+                                           resolved_paths=resolved_paths)
         print headers
         sys.stdout.write(stream.readline())
         sys.stdout.write(stream.readline())
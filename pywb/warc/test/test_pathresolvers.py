@@ -18,6 +18,10 @@
 >>> redis_resolver('example.warc.gz')
 ['some_path/example.warc.gz']
 
+# resolve many in one pipeline
+>>> sorted(redis_resolver.resolve_batch(['example.warc.gz', 'not-found.gz']).items())
+[('example.warc.gz', ['some_path/example.warc.gz']), ('not-found.gz', [])]
+
 
 make_best_resolver tests
 # http path
@@ -2,28 +2,111 @@ from pywb.cdx.cdxserver import create_cdx_server
 
 from pywb.framework.basehandlers import BaseHandler
 from pywb.framework.wbrequestresponse import WbResponse
+from pywb.utils.wbexception import BadRequestException
 
 from query_handler import QueryHandler
 
 from urlparse import parse_qs
 
+import json
+
 
 #=================================================================
 class CDXAPIHandler(BaseHandler):
     """
     Handler which passes wsgi request to cdx server and
     returns a text-based cdx api
+
+    A POST request is a batch query, with a json list of urls in the
+    body. Each entry is either a url or a dict with the ``url`` and any
+    of the per-url params in ``BATCH_URL_PARAMS``. All other params
+    are taken from the query string and shared by all urls.
+
+    The results are returned grouped by url, in the sorted order of
+    the url keys, each group starting with a header line:
+    ``# <index> <url>`` for text output, or
+    ``{"index": <index>, "url": <url>}`` for json output
     """
+    BATCH_URL_PARAMS = ('url', 'matchType', 'closest', 'sort', 'limit',
+                        'from', 'to')
+
+    MAX_BATCH_URLS = 10000
+
     def __init__(self, index_handler):
         self.index_handler = index_handler
 
     def __call__(self, wbrequest):
         params = self.extract_params_from_wsgi_env(wbrequest.env)
 
+        if wbrequest.env.get('REQUEST_METHOD') == 'POST':
+            return self.handle_batch(wbrequest, params)
+
         cdx_iter = self.index_handler.load_cdx(wbrequest, params)
 
         return WbResponse.text_stream(cdx_iter)
 
+    def handle_batch(self, wbrequest, params):
+        url_params_list = self.extract_batch_urls(wbrequest.env)
+
+        batch_iter = self.index_handler.load_cdx_batch(wbrequest, params,
+                                                       url_params_list)
+
+        return WbResponse.text_stream(self.iter_batch(batch_iter,
+                                                      url_params_list,
+                                                      params['output']))
+
+    @staticmethod
+    def iter_batch(batch_iter, url_params_list, output):
+        for inx, query, cdx_iter in batch_iter:
+            url = url_params_list[inx]['url']
+
+            if output == 'json':
+                yield json.dumps(dict(index=inx, url=url)) + '\n'
+            else:
+                yield '# {0} {1}\n'.format(inx, url)
+
+            for line in cdx_iter:
+                yield line
+
+    @classmethod
+    def extract_batch_urls(cls, env):
+        """ Parse the list of per-url params from the json body
+        of a batch request
+        """
+        try:
+            length = int(env.get('CONTENT_LENGTH') or 0)
+            urls = json.loads(env['wsgi.input'].read(length))
+        except ValueError:
+            raise BadRequestException('Batch query must be a json list')
+
+        if not isinstance(urls, list):
+            raise BadRequestException('Batch query must be a json list')
+
+        if len(urls) > cls.MAX_BATCH_URLS:
+            msg = 'Batch query is limited to {0} urls'
+            raise BadRequestException(msg.format(cls.MAX_BATCH_URLS))
+
+        url_params_list = []
+        for url in urls:
+            if not isinstance(url, dict):
+                url = dict(url=url)
+
+            if not isinstance(url.get('url'), basestring):
+                raise BadRequestException('Each batch query requires a url')
+
+            url_params = {}
+            for name in cls.BATCH_URL_PARAMS:
+                value = url.get(name)
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+
+                if value is not None:
+                    url_params[name] = str(value)
+
+            url_params_list.append(url_params)
+
+        return url_params_list
+
     @staticmethod
     def extract_params_from_wsgi_env(env):
         """ utility function to extract params and create a CDXQuery
@@ -81,6 +81,29 @@ class QueryHandler(object):
         return cdx_iter, output
 
     def load_cdx(self, wbrequest, params):
+        params = self._init_cdx_params(wbrequest, params)
+
+        cdx_iter = self.cdx_server.load_cdx(**params)
+        return cdx_iter
+
+    def load_cdx_batch(self, wbrequest, params, url_params_list):
+        """ Load a batch of queries, each from ``params`` updated with
+        the per-url params in ``url_params_list``.
+
+        Yields ``(index, query, cdx_iter)``, in key order, from the
+        cdx server batch load
+        """
+        params = self._init_cdx_params(wbrequest, params)
+
+        params_list = []
+        for url_params in url_params_list:
+            batch_params = dict(params)
+            batch_params.update(url_params)
+            params_list.append(batch_params)
+
+        return self.cdx_server.load_cdx_batch(params_list)
+
+    def _init_cdx_params(self, wbrequest, params):
         if wbrequest:
             # add any custom filter from the request
             if wbrequest.query_filter:
@@ -99,8 +122,7 @@ class QueryHandler(object):
             if perms_op:
                 params['custom_ops'] = [perms_op]
 
-        cdx_iter = self.cdx_server.load_cdx(**params)
-        return cdx_iter
+        return params
 
     def make_cdx_response(self, wbrequest, cdx_iter, output, **kwargs):
         # if not text, the iterator is assumed to be CDXObjects
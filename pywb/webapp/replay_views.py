@@ -71,6 +71,12 @@ class ReplayView(object):
 
         response = None
 
+        # resolve paths of all w/arcs at once, if supported
+        resolved_paths = None
+        if getattr(self.content_loader, 'batch_resolve', False):
+            cdx_lines = list(cdx_lines)
+            resolved_paths = self.content_loader.resolve_all(cdx_lines)
+
         # Iterate over the cdx until find one that works
         # The cdx should already be sorted in
         # closest-to-timestamp order (from the cdx server)
@@ -88,7 +94,8 @@ class ReplayView(object):
                 response = self.cached_replay_capture(wbrequest,
                                                       cdx,
                                                       cdx_loader,
-                                                      failed_files)
+                                                      failed_files,
+                                                      resolved_paths)
 
             except (CaptureException, ArchiveLoadFailed) as ce:
                 #import traceback
@@ -108,12 +115,14 @@ class ReplayView(object):
 
         raise last_e
 
-    def cached_replay_capture(self, wbrequest, cdx, cdx_loader, failed_files):
+    def cached_replay_capture(self, wbrequest, cdx, cdx_loader, failed_files,
+                              resolved_paths=None):
         def get_capture():
             return self.replay_capture(wbrequest,
                                        cdx,
                                        cdx_loader,
-                                       failed_files)
+                                       failed_files,
+                                       resolved_paths)
 
         if not self.enable_range_cache:
             return get_capture()
@@ -135,11 +144,17 @@ class ReplayView(object):
                                        cdx=cdx)
         return response
 
-    def replay_capture(self, wbrequest, cdx, cdx_loader, failed_files):
+    def replay_capture(self, wbrequest, cdx, cdx_loader, failed_files,
+                       resolved_paths=None):
+        kwargs = {}
+        if resolved_paths is not None:
+            kwargs['resolved_paths'] = resolved_paths
+
         (status_headers, stream) = (self.content_loader(cdx,
                                                         failed_files,
                                                         cdx_loader,
-                                                        wbrequest))
+                                                        wbrequest,
+                                                        **kwargs))
 
         # check and reject self-redirect
         self._reject_self_redirect(wbrequest, cdx, status_headers)
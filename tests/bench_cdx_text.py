@@ -0,0 +1,66 @@
+"""
+Benchmark text output of the cdx server, comparing the pass-through path
+(no cdx objects created) with loading every line as a cdx object
+
+Usage: python -m tests.bench_cdx_text [num_lines]
+"""
+
+from pywb.cdx.cdxserver import CDXServer
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+#=================================================================
+CDX_LINE = ('com,example)/path/{0:08d} 2014012617{1:04d} '
+            'http://example.com/path/{0:08d} text/html 200 '
+            'B2LTWWPUOYAH7UIPQ7ZUPQ4VMBSVC36A - - 1046 {0} example.warc.gz\n')
+
+
+def write_cdx(filename, num_lines):
+    with open(filename, 'wb') as fh:
+        for i in xrange(num_lines):
+            fh.write(CDX_LINE.format(i, i % 10000))
+
+
+def no_op(cdx_iter, query):
+    return cdx_iter
+
+
+def run(server, **params):
+    start = time.time()
+    count = 0
+    for line in server.load_cdx(url='example.com/', matchType='domain',
+                                output='text', limit=sys.maxint, **params):
+        count += 1
+
+    return count, time.time() - start
+
+
+def main(num_lines=200000):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'bench.cdx')
+        write_cdx(filename, num_lines)
+
+        server = CDXServer(filename)
+
+        for fl in [None, 'urlkey,timestamp,digest']:
+            params = {'fl': fl} if fl else {}
+
+            count, passthrough = run(server, **params)
+            _, objects = run(server, custom_ops=[no_op], **params)
+
+            print('fl={0}: {1} lines, pass-through {2:.3f}s, '
+                  'cdx objects {3:.3f}s ({4:.1f}x)'.
+                  format(fl, count, passthrough, objects,
+                         objects / passthrough))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
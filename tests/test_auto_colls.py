@@ -220,6 +220,9 @@ class TestManagedColls(object):
         assert len(reindex_cdx.splitlines()) == len(merged_cdx.splitlines())
         assert merged_cdx == reindex_cdx
 
+        # sparse index sidecar written for reindex
+        assert os.path.isfile(orig + '.idx')
+
     def test_add_static(self):
         """ Test adding static file to collection, check access
         """